@@ -0,0 +1,247 @@
+import argparse
+import glob
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+import numpy as np
+import pandas as pd
+from fancy_logging import logger, configure_logging, logging_level_argument
+from profiling import StageTimer
+from xgrid_index import DEFAULT_X_TOLERANCE
+
+REPORT_TABLE = 'batch_report'
+DATASET_FILES = ('train', 'ideal', 'test')
+# maximum number of processed datasets waiting to be written, further datasets wait for the writer
+MAX_PENDING_WRITES = 8
+
+
+def find_datasets(patterns=None, manifest=None) -> dict:
+    """
+    Find the dataset directories of a batch.
+
+    :param patterns: List of glob patterns of dataset directories, e.g. 'nightly/*'.
+    :param manifest: Path of a text file with one dataset directory per line, relative paths are relative to the file.
+    :return: Dictionary of the unique dataset ids and their directories, in the order they were found.
+    """
+    directories = []
+    for pattern in patterns or []:
+        directories.extend(sorted(path for path in glob.glob(pattern) if os.path.isdir(path)))
+    if manifest:
+        with open(manifest) as file:
+            base = os.path.dirname(os.path.abspath(manifest))
+            directories.extend(os.path.join(base, line.strip()) for line in file if line.strip() and not line.startswith('#'))
+
+    datasets = {}
+    for directory in dict.fromkeys(os.path.normpath(directory) for directory in directories):
+        # the id becomes part of the table names, directories with the same name get a numbered suffix
+        base_id = re.sub(r'\W+', '_', os.path.basename(directory)).strip('_') or 'dataset'
+        dataset_id, number = base_id, 1
+        while dataset_id in datasets:
+            number += 1
+            dataset_id = f"{base_id}_{number}"
+        datasets[dataset_id] = directory
+    return datasets
+
+
+def process_dataset(dataset_id: str, directory: str, x_tolerance: float = DEFAULT_X_TOLERANCE, interpolate: bool = False,
+                    pruned_search: bool = False) -> dict:
+    """
+    Load one dataset, select its ideal functions and assign its test data, without touching the database.
+
+    Runs in the worker processes of the batch, errors are returned instead of raised, so one broken dataset does not abort the batch.
+
+    :param dataset_id: Id of the dataset.
+    :param directory: Directory with the train.csv, ideal.csv and test.csv files.
+    :param x_tolerance: Maximum absolute difference between an x value and the matching x value of the ideal data.
+    :param interpolate: Boolean flag to interpolate ideal values for x values between the ideal x values.
+    :param pruned_search: Boolean flag to search the ideal functions with lower bounds and early abandoning.
+    :return: Dictionary with 'dataset', 'status', 'error', the 'timings' per stage, the 'ideal_functions' and the 'tables' to write.
+    """
+    from csv_processor import TEST_CSV_OPTIONS, assign_points, read_csv_files, select_ideal_functions
+    from xgrid_index import XGridIndex
+
+    timer = StageTimer()
+    result = {'dataset': dataset_id, 'directory': directory, 'status': 'failed', 'error': None, 'timings': {},
+              'ideal_functions': None, 'tables': {}}
+    try:
+        with timer.stage("load") as stage:
+            csv_files = {name: os.path.join(directory, f"{name}.csv") for name in DATASET_FILES}
+            frames = dict(read_csv_files(csv_files, np.float64, options={'test': TEST_CSV_OPTIONS}))
+            train_data, ideal_data, test_points = (frames[name] for name in DATASET_FILES)
+            stage.rows = len(train_data) + len(ideal_data) + len(test_points)
+
+        with timer.stage("select", rows=len(train_data)):
+            x_index = XGridIndex(ideal_data['x'], tolerance=x_tolerance, interpolate=interpolate)
+            ideal_functions = select_ideal_functions(train_data, ideal_data, x_index, pruned=pruned_search)
+
+        with timer.stage("assign", rows=len(test_points)):
+            test_data = assign_points(test_points, ideal_data, ideal_functions, x_index)
+
+        result.update(status='ok', ideal_functions={training_function: {key: value if isinstance(value, str) else float(value)
+                                                                        for key, value in mapping.items()}
+                                                    for training_function, mapping in ideal_functions.items()},
+                      tables={'train': train_data, 'ideal': ideal_data,
+                              'test': test_data.drop(columns=['y_point_mapped', 'y_point_not_found'])},
+                      points_assigned=int(test_data['No. of ideal func'].notna().sum()),
+                      points_unassigned=int(test_data['No. of ideal func'].isna().sum()))
+
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        result['traceback'] = traceback.format_exc()
+
+    result['timings'] = {stage['stage']: stage['wall_time'] for stage in timer.summary()}
+    return result
+
+
+def write_dataset(db, dataset_id: str, tables: dict, pragmas: dict = None) -> float:
+    """
+    Write the tables of a processed dataset in one transaction, run by the single writer thread of the batch.
+
+    The tables of a dataset are named '<dataset id>_train', '<dataset id>_ideal' and '<dataset id>_test'.
+
+    :param db: SqliteOperations object of the batch database.
+    :param dataset_id: Id of the dataset.
+    :param tables: Dictionary of the table names without the dataset id and their DataFrames.
+    :param pragmas: Dictionary of PRAGMAs to apply while the tables are written, e.g. BULK_LOAD_PRAGMAS.
+    :return: Wall time of the write in seconds.
+    :raises RuntimeError: If a table could not be written, the other tables of the dataset are rolled back.
+    """
+    start = time.perf_counter()
+    with db.transaction(pragmas):
+        failed = [table_name for table_name, data in tables.items() if not db.fill_table(f"{dataset_id}_{table_name}", data)]
+        if failed:
+            raise RuntimeError(f"Could not write the tables {', '.join(failed)}")
+    return time.perf_counter() - start
+
+
+def run_batch(datasets: dict, db_path_to_file: str, workers: int = None, x_tolerance: float = DEFAULT_X_TOLERANCE,
+              interpolate: bool = False, pruned_search: bool = False, fast_import: bool = False) -> list:
+    """
+    Process many datasets concurrently in a process pool and write all results into one SQLite file through a single writer thread.
+
+    A failing dataset is reported and the batch continues with the others.
+
+    :param datasets: Dictionary of dataset ids and their directories, e.g. from find_datasets.
+    :param db_path_to_file: Path to the SQLite database file.
+    :param workers: Number of worker processes, the number of CPUs if not given.
+    :param x_tolerance: Maximum absolute difference between an x value and the matching x value of the ideal data.
+    :param interpolate: Boolean flag to interpolate ideal values for x values between the ideal x values.
+    :param pruned_search: Boolean flag to search the ideal functions with lower bounds and early abandoning.
+    :param fast_import: Boolean flag to keep the journal in memory and switch off syncing to disk while the tables are written.
+    :return: List of dictionaries with the status, error, stage timings and assigned points of every dataset, in the order of the datasets.
+    """
+    from sqlite_helper import BULK_LOAD_PRAGMAS, DatabaseWriter, SqliteOperations
+
+    start = time.perf_counter()
+    pragmas = BULK_LOAD_PRAGMAS if fast_import else None
+    # the workers never wait for a database lock, all tables are written one dataset after another by this thread
+    writer = DatabaseWriter(SqliteOperations(db_path_to_file), max_pending=MAX_PENDING_WRITES)
+    writer.start()
+    results = {}
+    writes = {}
+
+    try:
+        # the workers are spawned, forking them would copy the locks of the running writer and logging threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as executor:
+            futures = {executor.submit(process_dataset, dataset_id, directory, x_tolerance, interpolate, pruned_search): dataset_id
+                       for dataset_id, directory in datasets.items()}
+            for future in as_completed(futures):
+                dataset_id = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'dataset': dataset_id, 'directory': datasets[dataset_id], 'status': 'failed',
+                              'error': f"{type(e).__name__}: {e}", 'timings': {}, 'tables': {}}
+
+                if result['status'] == 'ok':
+                    writes[dataset_id] = writer.submit(write_dataset, dataset_id, result.pop('tables'), pragmas)
+                    logger.info(f"Dataset '{dataset_id}' processed, {result['points_assigned']} of "
+                                f"{result['points_assigned'] + result['points_unassigned']} test points assigned")
+                else:
+                    result.pop('tables')
+                    logger.warning(f"Dataset '{dataset_id}' failed: {result['error']}")
+                    logger.debug(result.get('traceback', ''))
+                results[dataset_id] = result
+    finally:
+        writer.close()
+
+    report = []
+    for dataset_id in datasets:
+        result = results[dataset_id]
+        write_time = None
+        if dataset_id in writes:
+            try:
+                write_time = writes[dataset_id].result()
+            except Exception as e:
+                result.update(status='failed', error=f"Writing failed: {type(e).__name__}: {e}")
+        report.append({
+            'dataset': dataset_id,
+            'directory': result['directory'],
+            'status': result['status'],
+            'error': result['error'],
+            'load_s': result['timings'].get('load'),
+            'select_s': result['timings'].get('select'),
+            'assign_s': result['timings'].get('assign'),
+            'write_s': write_time,
+            'points_assigned': result.get('points_assigned'),
+            'points_unassigned': result.get('points_unassigned'),
+            'ideal_functions': json.dumps(result.get('ideal_functions')) if result.get('ideal_functions') else None,
+        })
+
+    if not SqliteOperations(db_path_to_file).fill_table(REPORT_TABLE, pd.DataFrame(report)):
+        logger.warning(f"Could not write the batch report to table '{REPORT_TABLE}'")
+
+    failed = sum(row['status'] != 'ok' for row in report)
+    logger.info(f"Batch of {len(report)} datasets finished in {time.perf_counter() - start:.2f}s, {failed} failed")
+    return report
+
+
+def format_report(report: list) -> str:
+    """
+    Format the report of a batch as a table.
+
+    :param report: List of dictionaries from run_batch.
+    :return: Table as string.
+    """
+    def seconds(value):
+        return f"{value:>8.3f}" if value is not None and not np.isnan(value) else f"{'-':>8}"
+
+    lines = [f"{'Dataset':<24} {'Status':<7} {'Load':>8} {'Select':>8} {'Assign':>8} {'Write':>8} {'Assigned':>9}  Error"]
+    for row in report:
+        assigned = f"{row['points_assigned']}/{row['points_assigned'] + row['points_unassigned']}" if row['points_assigned'] is not None else '-'
+        lines.append(f"{row['dataset']:<24} {row['status']:<7} {seconds(row['load_s'])} {seconds(row['select_s'])} "
+                     f"{seconds(row['assign_s'])} {seconds(row['write_s'])} {assigned:>9}  {row['error'] or ''}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Process many dataset directories into one SQLite database.')
+    parser.add_argument('patterns', nargs='*', help="Glob patterns of dataset directories with train.csv, ideal.csv and test.csv, e.g. 'nightly/*'")
+    parser.add_argument('-m', '--manifest', type=str, default=None, help='Text file with one dataset directory per line')
+    parser.add_argument('-db', '--db_path_to_file', type=str, default='batch.sqlite3', help='Path to the SQLite database file.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--x-tolerance', type=float, default=DEFAULT_X_TOLERANCE, help='Maximum difference for matching x values against the ideal data')
+    parser.add_argument('--interpolate', action='store_true', help='Interpolate ideal values for x values between the ideal x values')
+    parser.add_argument('--pruned-search', action='store_true', help='Skip ideal functions by lower bounds and partial sums in the search')
+    parser.add_argument('--fast-import', action='store_true', help='Keep the journal in memory and switch off syncing to disk while writing')
+    parser.add_argument('--report', type=str, default=None, help='Write the report of the batch as JSON to this file')
+    parser.add_argument('--log-level', type=logging_level_argument, default=None, help='Logging level, e.g. DEBUG or WARNING')
+
+    args = parser.parse_args()
+    configure_logging(level=args.log_level)
+
+    datasets = find_datasets(args.patterns, args.manifest)
+    if not datasets:
+        parser.error("No dataset directories found.")
+
+    report = run_batch(datasets, args.db_path_to_file, args.workers, args.x_tolerance, args.interpolate, args.pruned_search, args.fast_import)
+    logger.info(f"Batch report:\n{format_report(report)}")
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    exit(1 if any(row['status'] != 'ok' for row in report) else 0)
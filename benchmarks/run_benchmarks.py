@@ -0,0 +1,269 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+from csv_processor import load_csv_data, load_dataset, select_ideal_functions, assign_test_data, main  # noqa: E402
+from fancy_logging import logger  # noqa: E402
+from synthetic_dataset import generate_dataset  # noqa: E402
+from xgrid_index import XGridIndex  # noqa: E402
+
+# default maximum number of columns of a SQLite table, the limit of the wide layout
+SQLITE_MAX_COLUMNS = 2000
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def timed(function, *args, **kwargs):
+    """
+    Call a function and measure its wall time.
+
+    :param function: Function to call.
+    :return: Tuple of the wall time in seconds and the return value of the function.
+    """
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def fill_table(db, table_name, data, layout='wide'):
+    """
+    Fill a table like SqliteOperations.fill_table, but raise if it failed, so no timing is reported for a failed write.
+
+    :raises RuntimeError: If the table could not be filled.
+    """
+    if not db.fill_table(table_name, data, layout=layout):
+        raise RuntimeError(f"Could not write the table {table_name} in the {layout} layout")
+
+
+def ideal_column_count(dataset_dir):
+    """
+    Count the columns of the ideal.csv file of a dataset from its header.
+
+    :param dataset_dir: Directory with the ideal.csv file.
+    :return: Number of columns, including x.
+    """
+    with open(os.path.join(dataset_dir, 'ideal.csv')) as file:
+        return len(file.readline().split(','))
+
+
+def bench_csv_load(dataset_dir, work_dir, interpolate, ideal_layout):
+    wall_time, ideal_data = timed(load_csv_data, os.path.join(dataset_dir, 'ideal.csv'))
+    return wall_time, len(ideal_data)
+
+
+def bench_fill_table(dataset_dir, work_dir, interpolate, ideal_layout):
+    from sqlite_helper import SqliteOperations
+    ideal_data = load_csv_data(os.path.join(dataset_dir, 'ideal.csv'))
+    db = SqliteOperations(os.path.join(work_dir, 'fill.sqlite3'))
+    wall_time, _ = timed(fill_table, db, 'ideal', ideal_data, ideal_layout)
+    return wall_time, len(ideal_data)
+
+
+def bench_get_data_from_table(dataset_dir, work_dir, interpolate, ideal_layout):
+    from sqlite_helper import SqliteOperations
+    db = SqliteOperations(os.path.join(work_dir, 'read.sqlite3'))
+    fill_table(db, 'ideal', load_csv_data(os.path.join(dataset_dir, 'ideal.csv')), ideal_layout)
+    wall_time, ideal_data = timed(db.get_data_from_table, 'ideal', dtype=float)
+    return wall_time, len(ideal_data)
+
+
+def import_dataset(dataset_dir, work_dir, read_workers, ideal_layout):
+    from sqlite_helper import SqliteOperations
+    db = SqliteOperations(os.path.join(work_dir, f'import_{read_workers}.sqlite3'))
+    wall_time, _ = timed(load_dataset, db, dataset_dir, with_visualizing=False, ideal_layout=ideal_layout, read_workers=read_workers)
+    row_counts = [db.get_row_count(table_name) for table_name in ('train', 'ideal')]
+    if None in row_counts:
+        raise RuntimeError("Could not import the train and ideal tables")
+    return wall_time, sum(row_counts)
+
+
+def bench_load_dataset(dataset_dir, work_dir, interpolate, ideal_layout):
+    return import_dataset(dataset_dir, work_dir, None, ideal_layout)
+
+
+def bench_load_dataset_sequential(dataset_dir, work_dir, interpolate, ideal_layout):
+    return import_dataset(dataset_dir, work_dir, 0, ideal_layout)
+
+
+def get_function_subset(dataset_dir, work_dir, layout):
+    from sqlite_helper import SqliteOperations
+    ideal_data = load_csv_data(os.path.join(dataset_dir, 'ideal.csv'))
+    db = SqliteOperations(os.path.join(work_dir, f'{layout}.sqlite3'))
+    fill_table(db, 'ideal', ideal_data, layout)
+    # a handful of chosen ideal functions, like the assignment reads them
+    columns = ['x', *ideal_data.columns[1::max(1, ideal_data.shape[1] // 4)][:4]]
+    wall_time, subset = timed(db.get_data_from_table, 'ideal', columns=columns, dtype=float)
+    return wall_time, subset.size
+
+
+def bench_get_function_subset_wide(dataset_dir, work_dir, interpolate, ideal_layout):
+    return get_function_subset(dataset_dir, work_dir, 'wide')
+
+
+def bench_get_function_subset_long(dataset_dir, work_dir, interpolate, ideal_layout):
+    return get_function_subset(dataset_dir, work_dir, 'long')
+
+
+def bench_get_function_subset_blob(dataset_dir, work_dir, interpolate, ideal_layout):
+    return get_function_subset(dataset_dir, work_dir, 'blob')
+
+
+def bench_select_ideal_functions(dataset_dir, work_dir, interpolate, ideal_layout):
+    training_data = load_csv_data(os.path.join(dataset_dir, 'train.csv'))
+    ideal_data = load_csv_data(os.path.join(dataset_dir, 'ideal.csv'))
+    wall_time, _ = timed(select_ideal_functions, training_data, ideal_data)
+    return wall_time, (training_data.shape[1] - 1) * (ideal_data.shape[1] - 1)
+
+
+def bench_select_ideal_functions_pruned(dataset_dir, work_dir, interpolate, ideal_layout):
+    training_data = load_csv_data(os.path.join(dataset_dir, 'train.csv'))
+    ideal_data = load_csv_data(os.path.join(dataset_dir, 'ideal.csv'))
+    wall_time, _ = timed(select_ideal_functions, training_data, ideal_data, pruned=True)
+    return wall_time, (training_data.shape[1] - 1) * (ideal_data.shape[1] - 1)
+
+
+def bench_assign_test_data(dataset_dir, work_dir, interpolate, ideal_layout):
+    training_data = load_csv_data(os.path.join(dataset_dir, 'train.csv'))
+    ideal_data = load_csv_data(os.path.join(dataset_dir, 'ideal.csv'))
+    x_index = XGridIndex(ideal_data['x'], interpolate=interpolate)
+    ideal_functions = select_ideal_functions(training_data, ideal_data, x_index)
+    wall_time, test_data = timed(assign_test_data, os.path.join(dataset_dir, 'test.csv'), ideal_data, ideal_functions, x_index)
+    return wall_time, len(test_data)
+
+
+def bench_main(dataset_dir, work_dir, interpolate, ideal_layout, **options):
+    wall_time, _ = timed(main, dataset_dir, os.path.join(work_dir, 'main.sqlite3'), overwrite=True, interpolate=interpolate,
+                         ideal_layout=ideal_layout, **options)
+    with open(os.path.join(dataset_dir, 'test.csv')) as file:
+        return wall_time, sum(1 for _ in file) - 1
+
+
+def bench_main_in_memory(dataset_dir, work_dir, interpolate, ideal_layout):
+    return bench_main(dataset_dir, work_dir, interpolate, ideal_layout, in_memory=True)
+
+
+def bench_main_no_db(dataset_dir, work_dir, interpolate, ideal_layout):
+    return bench_main(dataset_dir, work_dir, interpolate, ideal_layout, no_db=True)
+
+
+SCENARIOS = {
+    'csv_load': bench_csv_load,
+    'fill_table': bench_fill_table,
+    'get_data_from_table': bench_get_data_from_table,
+    'load_dataset': bench_load_dataset,
+    'load_dataset_sequential': bench_load_dataset_sequential,
+    'get_function_subset_wide': bench_get_function_subset_wide,
+    'get_function_subset_long': bench_get_function_subset_long,
+    'get_function_subset_blob': bench_get_function_subset_blob,
+    'select_ideal_functions': bench_select_ideal_functions,
+    'select_ideal_functions_pruned': bench_select_ideal_functions_pruned,
+    'assign_test_data': bench_assign_test_data,
+    'main': bench_main,
+    'main_in_memory': bench_main_in_memory,
+    'main_no_db': bench_main_no_db,
+}
+
+
+def run_scenario(name, dataset_dir, repeat, interpolate, ideal_layout='wide'):
+    """
+    Run one scenario several times in this process and keep the fastest run.
+
+    :param name: Name of the scenario.
+    :param dataset_dir: Directory with the train.csv, ideal.csv and test.csv files.
+    :param repeat: Number of runs.
+    :param interpolate: Boolean flag to interpolate off-grid test points.
+    :param ideal_layout: Storage layout of the ideal table in the scenarios that write it, except get_function_subset_*.
+    :return: Dictionary with the results of the scenario.
+    """
+    logger.setLevel(logging.WARNING)
+    wall_times = []
+    rows = 0
+    try:
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as work_dir:
+                wall_time, rows = SCENARIOS[name](dataset_dir, work_dir, interpolate, ideal_layout)
+            wall_times.append(wall_time)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    wall_time = min(wall_times) if wall_times else None
+    return {
+        'scenario': name,
+        'wall_time_s': wall_time,
+        'rows': rows,
+        'rows_per_s': rows / wall_time if wall_time else None,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        'error': error,
+    }
+
+
+def git_commit():
+    """
+    Get the commit of the benchmarked code.
+
+    :return: Hash of the current commit or None if it is unknown.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the CSV processor on synthetic data.')
+    parser.add_argument('--rows', type=int, default=400, help='Number of x values of the grid')
+    parser.add_argument('--training-functions', type=int, default=4, help='Number of training functions')
+    parser.add_argument('--ideal-functions', type=int, default=50, help='Number of ideal functions')
+    parser.add_argument('--test-points', type=int, default=100, help='Number of test points')
+    parser.add_argument('--noise', type=float, default=0.5, help='Maximum absolute noise of the training functions')
+    parser.add_argument('--off-grid-fraction', type=float, default=0.0, help='Fraction of test points between two x values')
+    parser.add_argument('--dataset', type=str, default=None, help='Use the CSV files in this directory instead of generating them')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS), help='Scenarios to run')
+    parser.add_argument('--ideal-layout', choices=['wide', 'long', 'blob'], default=None,
+                        help=f'Storage layout of the ideal table (default: wide, long above {SQLITE_MAX_COLUMNS} columns)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per scenario, the fastest run is reported')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='JSON file to write the results to')
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as generated_dir:
+        dataset_dir = args.dataset or generated_dir
+        if not args.dataset:
+            generate_dataset(dataset_dir, args.rows, args.training_functions, args.ideal_functions,
+                             args.test_points, args.noise, args.off_grid_fraction)
+        # the wide layout has one column per ideal function, SQLite does not allow more than SQLITE_MAX_COLUMNS
+        ideal_layout = args.ideal_layout or ('long' if ideal_column_count(dataset_dir) > SQLITE_MAX_COLUMNS else 'wide')
+
+        results = []
+        for name in args.scenarios:
+            # every scenario runs in a fresh process, so the peak RSS belongs to that scenario only
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_scenario, name, dataset_dir, args.repeat, args.off_grid_fraction > 0, ideal_layout).result()
+            print(f"{name}: {result['wall_time_s']} s, {result['rows_per_s']} rows/s, {result['peak_rss_kb']} KB"
+                  + (f", {result['error']}" if result['error'] else ""))
+            results.append(result)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'parameters': {**{key: value for key, value in vars(args).items() if key not in ('output', 'scenarios')}, 'ideal_layout': ideal_layout},
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
@@ -0,0 +1,76 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+
+def generate_dataset(directory: str, rows: int = 400, training_functions: int = 4, ideal_functions: int = 50,
+                     test_points: int = 100, noise: float = 0.5, off_grid_fraction: float = 0.0,
+                     outlier_fraction: float = 0.5, seed: int = 0) -> dict:
+    """
+    Write synthetic train.csv, ideal.csv and test.csv files in the format of Dataset2.
+
+    The ideal functions are random combinations of sine, line and square on the x grid -20.0..20.0.
+    Every training function is one randomly chosen ideal function plus uniform noise.
+
+    :param directory: Directory to write the CSV files to.
+    :param rows: Number of x values of the grid.
+    :param training_functions: Number of training functions.
+    :param ideal_functions: Number of ideal functions.
+    :param test_points: Number of test points.
+    :param noise: Maximum absolute noise added to the training functions.
+    :param off_grid_fraction: Fraction of test points with an x value between two grid values.
+    :param outlier_fraction: Fraction of test points that do not belong to any training function.
+    :param seed: Seed of the random number generator.
+    :return: Dictionary mapping every training function to the ideal function it was generated from.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    x = np.round(np.linspace(-20.0, 20.0, rows), 6)
+    coefficients = rng.uniform(-1, 1, size=(4, ideal_functions))
+    ideal_matrix = (coefficients[0] * 10 * np.sin(x[:, np.newaxis] * (1 + coefficients[1]))
+                    + coefficients[2] * x[:, np.newaxis]
+                    + coefficients[3] * 0.05 * x[:, np.newaxis] ** 2)
+    ideal_names = [f"y{number}" for number in range(1, ideal_functions + 1)]
+
+    chosen = rng.choice(ideal_functions, size=training_functions, replace=training_functions > ideal_functions)
+    training_matrix = ideal_matrix[:, chosen] + rng.uniform(-noise, noise, size=(rows, training_functions))
+    training_names = [f"y{number}" for number in range(1, training_functions + 1)]
+
+    positions = rng.integers(0, rows, size=test_points)
+    test_x = x[positions]
+    off_grid = rng.random(test_points) < off_grid_fraction
+    # off-grid points lie halfway to the next grid value, or to the previous one at the end of the grid
+    direction = np.where(positions < rows - 1, 1, -1)
+    test_x[off_grid] = np.round(test_x[off_grid] + direction[off_grid] * (x[1] - x[0]) / 2, 6)
+    test_y = ideal_matrix[positions, chosen[rng.integers(0, training_functions, size=test_points)]]
+    test_y = test_y + rng.uniform(-noise, noise, size=test_points)
+    outliers = rng.random(test_points) < outlier_fraction
+    test_y[outliers] += rng.choice([-1, 1], size=outliers.sum()) * rng.uniform(5 * noise, 50 * noise, size=outliers.sum())
+
+    pd.DataFrame(np.column_stack([x, training_matrix]), columns=['x', *training_names]).to_csv(
+        os.path.join(directory, 'train.csv'), index=False)
+    pd.DataFrame(np.column_stack([x, ideal_matrix]), columns=['x', *ideal_names]).to_csv(
+        os.path.join(directory, 'ideal.csv'), index=False)
+    pd.DataFrame({'x': test_x, 'y': test_y}).to_csv(os.path.join(directory, 'test.csv'), index=False)
+
+    return {training_names[position]: ideal_names[column] for position, column in enumerate(chosen)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic train/ideal/test dataset.')
+    parser.add_argument('directory', type=str, help='Directory to write the CSV files to')
+    parser.add_argument('--rows', type=int, default=400, help='Number of x values of the grid')
+    parser.add_argument('--training-functions', type=int, default=4, help='Number of training functions')
+    parser.add_argument('--ideal-functions', type=int, default=50, help='Number of ideal functions')
+    parser.add_argument('--test-points', type=int, default=100, help='Number of test points')
+    parser.add_argument('--noise', type=float, default=0.5, help='Maximum absolute noise of the training functions')
+    parser.add_argument('--off-grid-fraction', type=float, default=0.0, help='Fraction of test points between two x values')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random number generator')
+
+    args = parser.parse_args()
+
+    mapping = generate_dataset(args.directory, args.rows, args.training_functions, args.ideal_functions,
+                               args.test_points, args.noise, args.off_grid_fraction, seed=args.seed)
+    print(mapping)
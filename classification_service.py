@@ -0,0 +1,393 @@
+import asyncio
+import json
+import math
+import os
+import traceback
+import numpy as np
+import pandas as pd
+from fancy_logging import logger
+from xgrid_index import XGridIndex, DEFAULT_X_TOLERANCE
+from value_index import SortedValueIndex
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8750
+# largest request body that is accepted, in bytes
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+
+class AssignmentModel:
+    """
+    Warm in-memory state for assigning test points: the chosen ideal functions with their thresholds, the ideal
+    data of these functions and the indexes over it.
+
+    :param ideal_data: DataFrame with the x values and the chosen ideal functions.
+    :param ideal_functions: Dictionary of ideal functions with their respective max deviations.
+    :param x_index: XGridIndex over the x values of the ideal data.
+    :param value_index: SortedValueIndex over the chosen ideal functions, to find the closest function with a binary search.
+    """
+
+    def __init__(self, ideal_data: pd.DataFrame, ideal_functions: dict, x_index: XGridIndex, value_index: SortedValueIndex = None):
+        # the data is copied once, so a memory-mapped column cache can be closed
+        self.ideal_data = ideal_data.copy()
+        self.ideal_functions = ideal_functions
+        self.x_index = x_index
+        self.value_index = value_index
+
+    def assign(self, x: np.ndarray, y: np.ndarray) -> tuple:
+        """
+        Assign test points to the ideal functions, in the order of the points.
+
+        :param x: Array of the x values of the points.
+        :param y: Array of the y values of the points.
+        :return: Tuple of an array of the ideal function names, None where a point was not assigned, an array of the
+                 deviations, NaN where a point was not assigned, and a boolean array of the x values found in the ideal data.
+        """
+        from csv_processor import assign_points
+
+        # the points are aligned once, points without a match in the ideal data are left unassigned
+        test_data = assign_points(pd.DataFrame({'x': x, 'y': y}), self.ideal_data, self.ideal_functions, self.x_index, self.value_index,
+                                  sort=False, skip_unmatched=True)
+        names = test_data['No. of ideal func']
+        ideal_function = np.where(names.notna(), names.to_numpy(dtype=object), None)
+        return ideal_function, test_data['Delta Y'].to_numpy(dtype=float), test_data['x found'].to_numpy(dtype=bool)
+
+
+def load_model(db_path_to_file: str, csv_path: str = None, x_tolerance: float = DEFAULT_X_TOLERANCE, interpolate: bool = False,
+               workers: int = 1, pruned_search: bool = False, value_index: bool = False, column_cache: bool = False,
+               dtype: str = 'float64') -> AssignmentModel:
+    """
+    Load the imported data once and select its ideal functions, or take them from the selection cache.
+
+    :param db_path_to_file: Path to the SQLite database file.
+    :param csv_path: Path to the CSV files, imported if the database has no train and ideal tables yet.
+    :param x_tolerance: Maximum absolute difference between an x value and the matching x value of the ideal data.
+    :param interpolate: Boolean flag to interpolate ideal values for x values between the ideal x values.
+    :param workers: Number of worker processes for the ideal function search.
+    :param pruned_search: Boolean flag to search the ideal functions with lower bounds and early abandoning.
+    :param value_index: Boolean flag to find the closest ideal function with a binary search over sorted values.
+    :param column_cache: Boolean flag to keep the ideal data in a memory-mapped binary cache next to the database.
+    :param dtype: Name of the dtype the ideal data is held in, 'float64' or 'float32'.
+    :return: AssignmentModel with the chosen ideal functions.
+    :raises ValueError: If the database has no data and no CSV files are given.
+    """
+    from csv_processor import COLUMN_CACHE_SUFFIX, DTYPES, build_value_index, load_dataset, prepare_ideal_functions
+    from column_cache import ColumnCache
+    from sqlite_helper import SqliteOperations
+
+    db = SqliteOperations(db_path_to_file)
+    ideal_cache = ColumnCache(db_path_to_file + COLUMN_CACHE_SUFFIX) if column_cache else None
+    if not (db.table_exists("train") and db.table_exists("ideal")):
+        if csv_path is None:
+            raise ValueError(f"No training and ideal data in '{db_path_to_file}'.")
+        load_dataset(db=db, csv_path=csv_path, with_visualizing=False, column_cache=ideal_cache, dtype=DTYPES[dtype])
+
+    ideal_functions, ideal_data, x_index, _ = prepare_ideal_functions(db, x_tolerance, interpolate, workers, pruned_search, ideal_cache,
+                                                                      dtype=DTYPES[dtype])
+    return AssignmentModel(ideal_data, ideal_functions, x_index, build_value_index(ideal_data, ideal_functions) if value_index else None)
+
+
+class MicroBatcher:
+    """
+    Collects the points of concurrent requests into batches, so they are assigned by one vectorized call.
+
+    Every batch takes all requests that are waiting when it starts, while a batch is assigned in a worker thread
+    the next requests are collected. If a batch fails, its requests are assigned one by one, so a bad request only
+    fails itself.
+
+    :param model: AssignmentModel to assign the points with.
+    :param max_points: Maximum number of points of a batch, a single larger request is still assigned at once.
+    :param max_delay: Seconds to wait for more requests before a batch is started.
+    """
+
+    def __init__(self, model: AssignmentModel, max_points: int = 65536, max_delay: float = 0.0):
+        self.model = model
+        self.max_points = max_points
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.points = 0
+
+    async def submit(self, x: np.ndarray, y: np.ndarray) -> tuple:
+        """
+        Assign test points within the next batch.
+
+        :param x: Array of the x values of the points.
+        :param y: Array of the y values of the points.
+        :return: Result of AssignmentModel.assign for these points.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((x, y, future))
+        return await future
+
+    async def _collect(self) -> list:
+        """
+        Wait for a request and take all further requests that fit into the batch.
+
+        :return: List of the requests of the batch.
+        """
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        points = len(batch[0][0])
+        deadline = loop.time() + self.max_delay
+
+        while points < self.max_points:
+            try:
+                if self.queue.empty() and loop.time() < deadline:
+                    request = await asyncio.wait_for(self.queue.get(), deadline - loop.time())
+                else:
+                    request = self.queue.get_nowait()
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            batch.append(request)
+            points += len(request[0])
+        return batch
+
+    async def run(self):
+        """
+        Assign the batches until the task is cancelled.
+        """
+        while True:
+            batch = await self._collect()
+            try:
+                await self._assign(batch)
+            except Exception as e:
+                if len(batch) > 1:
+                    logger.warning(f"Could not assign batch of {sum(len(x) for x, _, _ in batch)} points, "
+                                   f"assigning its {len(batch)} requests one by one: {e}")
+                    logger.debug(traceback.format_exc())
+                    for request in batch:
+                        try:
+                            await self._assign([request])
+                        except Exception as request_error:
+                            self._fail(request, request_error)
+                else:
+                    self._fail(batch[0], e)
+
+    async def _assign(self, batch: list):
+        """
+        Assign the points of the requests of a batch with one call in a worker thread and answer the requests.
+
+        :param batch: List of the requests of the batch.
+        :raises Exception: If the assignment failed, no request is answered then.
+        """
+        loop = asyncio.get_running_loop()
+        sizes = [len(x) for x, _, _ in batch]
+        results = await loop.run_in_executor(None, self.model.assign, np.concatenate([x for x, _, _ in batch]),
+                                             np.concatenate([y for _, y, _ in batch]))
+        self.batches += 1
+        self.points += sum(sizes)
+        bounds = np.cumsum([0, *sizes])
+        for (_, _, future), start, stop in zip(batch, bounds[:-1], bounds[1:]):
+            if not future.done():
+                future.set_result(tuple(result[start:stop] for result in results))
+
+    @staticmethod
+    def _fail(request: tuple, error: Exception):
+        """
+        Answer a request whose points could not be assigned with the error.
+
+        :param request: Tuple of the x values, the y values and the future of the request.
+        :param error: Exception of the assignment.
+        """
+        logger.warning(f"Could not assign request of {len(request[0])} points: {error}")
+        logger.debug(''.join(traceback.format_exception(error)))
+        if not request[2].done():
+            request[2].set_exception(error)
+
+
+class AssignmentServer:
+    """
+    Minimal asyncio HTTP/1.1 service that answers assignment requests from a warm AssignmentModel.
+
+    Endpoints:
+        POST /assign with {"x": 1.0, "y": 2.0} or {"x": [...], "y": [...]}, answered with the ideal function and
+        its deviation per point, null where a point was not assigned.
+        GET /ideal-functions with the chosen ideal functions and their max deviations.
+        GET /health with the number of assigned batches and points.
+
+    :param model: AssignmentModel to assign the points with.
+    :param max_batch_points: Maximum number of points of a micro-batch.
+    :param max_batch_delay: Seconds to wait for more requests before a micro-batch is started.
+    """
+
+    def __init__(self, model: AssignmentModel, max_batch_points: int = 65536, max_batch_delay: float = 0.0):
+        self.model = model
+        self.batcher = MicroBatcher(model, max_batch_points, max_batch_delay)
+        self.batcher_task = None
+        self.server = None
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix_socket: str = None):
+        """
+        Start listening and batching.
+
+        :param host: Host to listen on, only local connections are accepted by default.
+        :param port: TCP port to listen on, 0 for any free port.
+        :param unix_socket: Path of a Unix socket to listen on instead of the TCP port.
+        :return: asyncio server.
+        """
+        self.batcher_task = asyncio.create_task(self.batcher.run())
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+            self.server = await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info(f"Serving assignments on {unix_socket or ', '.join(str(sock.getsockname()) for sock in self.server.sockets)}")
+        return self.server
+
+    async def stop(self):
+        """
+        Stop listening and batching.
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.batcher_task is not None:
+            self.batcher_task.cancel()
+            try:
+                await self.batcher_task
+            except asyncio.CancelledError:
+                pass
+
+    async def serve_forever(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix_socket: str = None):
+        """
+        Serve until the task is cancelled, e.g. by Ctrl+C.
+
+        :param host: Host to listen on, only local connections are accepted by default.
+        :param port: TCP port to listen on.
+        :param unix_socket: Path of a Unix socket to listen on instead of the TCP port.
+        """
+        await self.start(host, port, unix_socket)
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Answer the requests of one connection, which is kept alive between requests unless the client closes it.
+
+        :param reader: Stream of the requests.
+        :param writer: Stream for the responses.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    await self.respond(writer, 400, {'error': 'Malformed request'}, keep_alive=False)
+                    break
+                if length > MAX_BODY_SIZE:
+                    await self.respond(writer, 413, {'error': f'Body larger than {MAX_BODY_SIZE} bytes'}, keep_alive=False)
+                    break
+
+                body = await reader.readexactly(length)
+                status, payload = await self.dispatch(method, path, body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool):
+        """
+        Write a JSON response.
+
+        :param writer: Stream for the response.
+        :param status: HTTP status code.
+        :param payload: JSON serializable response.
+        :param keep_alive: Boolean flag to keep the connection open after the response.
+        """
+        body = json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> tuple:
+        """
+        Answer one request.
+
+        :param method: HTTP method.
+        :param path: Requested path.
+        :param body: Body of the request.
+        :return: Tuple of the HTTP status code and the JSON serializable response.
+        """
+        routes = {'/assign': 'POST', '/ideal-functions': 'GET', '/health': 'GET'}
+        path = path.split('?', 1)[0]
+        if path not in routes:
+            return 404, {'error': f'Unknown path {path}'}
+        if method != routes[path]:
+            return 405, {'error': f'{path} only accepts {routes[path]}'}
+
+        if path == '/health':
+            return 200, {'status': 'ok', 'batches': self.batcher.batches, 'points': self.batcher.points}
+        if path == '/ideal-functions':
+            return 200, {training_function: {key: value if isinstance(value, str) else float(value) for key, value in mapping.items()}
+                         for training_function, mapping in self.model.ideal_functions.items()}
+
+        try:
+            request = json.loads(body)
+            single = np.isscalar(request['x'])
+            x = np.atleast_1d(np.asarray(request['x'], dtype=float))
+            y = np.atleast_1d(np.asarray(request['y'], dtype=float))
+            if x.ndim != 1 or x.shape != y.shape:
+                raise ValueError("x and y must be numbers or lists of the same length")
+            if not (np.isfinite(x).all() and np.isfinite(y).all()):
+                raise ValueError("x and y must be finite numbers")
+        except (ValueError, TypeError, KeyError) as e:
+            return 400, {'error': f'Invalid assignment request: {e}'}
+
+        try:
+            ideal_function, delta_y, found = await self.batcher.submit(x, y)
+        except Exception as e:
+            return 500, {'error': str(e)}
+
+        result = {
+            'ideal_function': ideal_function.tolist(),
+            'delta_y': [None if math.isnan(value) else value for value in delta_y.tolist()],
+            'x_found': found.tolist(),
+        }
+        if single:
+            result = {key: values[0] for key, values in result.items()}
+        return 200, result
+
+
+def serve(model: AssignmentModel, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix_socket: str = None,
+          max_batch_points: int = 65536, max_batch_delay: float = 0.0):
+    """
+    Serve assignment requests until the process is interrupted.
+
+    :param model: AssignmentModel to assign the points with.
+    :param host: Host to listen on, only local connections are accepted by default.
+    :param port: TCP port to listen on.
+    :param unix_socket: Path of a Unix socket to listen on instead of the TCP port.
+    :param max_batch_points: Maximum number of points of a micro-batch.
+    :param max_batch_delay: Seconds to wait for more requests before a micro-batch is started.
+    """
+    server = AssignmentServer(model, max_batch_points, max_batch_delay)
+    try:
+        asyncio.run(server.serve_forever(host, port, unix_socket))
+    except KeyboardInterrupt:
+        logger.info("Service stopped")
@@ -0,0 +1,99 @@
+import json
+import os
+import traceback
+import numpy as np
+import pandas as pd
+from fancy_logging import logger
+
+HEADER_FILE = 'header.json'
+
+
+class ColumnCache:
+    """
+    Binary columnar cache of a table, with one memory-mapped .npy file per column.
+
+    The header records the fingerprint of the table content the cache was written for,
+    so a cache that does not match the database anymore is never read.
+
+    :param directory: Directory holding the column files and the header.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.logger = logger
+
+    def read_header(self):
+        """
+        Read the header of the cache.
+
+        :return: Dictionary with 'fingerprint', 'rows', 'dtype' and 'columns' or None if there is no valid cache.
+        """
+        try:
+            with open(os.path.join(self.directory, HEADER_FILE)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.warning(f"Could not read column cache header in '{self.directory}': {e}")
+            self.logger.debug(traceback.format_exc())
+            return None
+
+    def write(self, data, fingerprint, dtype=np.float64, x_dtype=None):
+        """
+        Write every column of a DataFrame to the cache.
+
+        :param data: DataFrame to cache.
+        :param fingerprint: Fingerprint of the table content the data was read from.
+        :param dtype: NumPy dtype the columns are stored with.
+        :param x_dtype: NumPy dtype the x column is stored with, the dtype if not given.
+        """
+        if fingerprint is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            header_path = os.path.join(self.directory, HEADER_FILE)
+            # without a header the cache is invalid while the columns are replaced
+            if os.path.exists(header_path):
+                os.remove(header_path)
+
+            files = {}
+            for position, col in enumerate(data.columns):
+                files[col] = f"{position}.npy"
+                np.save(os.path.join(self.directory, files[col]), data[col].to_numpy(dtype=x_dtype if x_dtype is not None and col == 'x' else dtype))
+
+            header = {'fingerprint': fingerprint, 'rows': len(data), 'dtype': np.dtype(dtype).name, 'columns': files}
+            with open(header_path + '.tmp', 'w') as file:
+                json.dump(header, file)
+            os.replace(header_path + '.tmp', header_path)
+            self.logger.debug(f"Column cache written to '{self.directory}'")
+
+        except Exception as e:
+            self.logger.warning(f"Could not write column cache to '{self.directory}': {e}")
+            self.logger.debug(traceback.format_exc())
+
+    def read(self, fingerprint, columns=None, dtype=None):
+        """
+        Read columns from the cache, only the pages of the read columns are mapped into memory.
+
+        :param fingerprint: Fingerprint of the current table content.
+        :param columns: List of column names to read, all columns if not given.
+        :param dtype: NumPy dtype the columns have to be stored with, any dtype if not given.
+        :return: DataFrame backed by the memory-mapped columns or None if the cache does not match the fingerprint or dtype.
+        """
+        header = self.read_header()
+        if fingerprint is None or header is None or header['fingerprint'] != fingerprint:
+            self.logger.debug(f"Column cache in '{self.directory}' does not match the database")
+            return None
+        if dtype is not None and header['dtype'] != np.dtype(dtype).name:
+            self.logger.debug(f"Column cache in '{self.directory}' is stored as {header['dtype']}, not {np.dtype(dtype).name}")
+            return None
+
+        try:
+            columns = columns or list(header['columns'])
+            arrays = {col: np.load(os.path.join(self.directory, header['columns'][col]), mmap_mode='r') for col in columns}
+            return pd.DataFrame(arrays, copy=False)
+
+        except Exception as e:
+            self.logger.warning(f"Could not read column cache in '{self.directory}': {e}")
+            self.logger.debug(traceback.format_exc())
+            return None
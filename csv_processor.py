@@ -1,17 +1,45 @@
-import unittest
+from __future__ import annotations
+
 from math import sqrt
 import os
-import csv
+import hashlib
+import importlib.util
+import sys
 import argparse
+import logging
+import numpy as np
 import pandas as pd
-from fancy_logging import logger
-from sqlite_helper import SqliteOperations
-from visualize_functions import PlotManager, FULL_SCREEN
+from fancy_logging import logger, configure_logging, logging_level_argument
+from column_cache import ColumnCache
+from profiling import stage_timer
+from xgrid_index import XGridIndex, DEFAULT_X_TOLERANCE
+from pruned_search import pruned_best_ideal_columns
+from value_index import SortedValueIndex
 import traceback
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context, shared_memory
+from typing import Iterable, Iterator, TYPE_CHECKING
+
+# sqlalchemy, matplotlib and unittest are only imported by the code paths that need them,
+# so the assignment and selection functions can be used without their import cost
+if TYPE_CHECKING:
+    from sqlite_helper import SqliteOperations
+    from visualize_functions import PlotManager
 
 # Constants for repeated values
 DEFAULT_CSV_PATH = 'Dataset2'
 DEFAULT_DB_PATH = 'db.sqlite3'
+HASH_BLOCK_SIZE = 1 << 20
+COLUMN_CACHE_SUFFIX = '.columns'
+# dtypes the data can be held in memory with, float32 halves the memory of the ideal and training data
+DTYPES = {'float64': np.float64, 'float32': np.float32}
+# number of changed assignments of the compact dtype that are logged one by one
+MAX_LOGGED_CHANGES = 10
+# the pyarrow parser splits a file over several threads, the C parser of pandas is used if pyarrow is not installed
+CSV_ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') else 'c'
+# only the first two columns of the test file are parsed, as x and y. The header line is skipped instead of read,
+# because the pyarrow engine only selects columns by position in files without a header
+TEST_CSV_OPTIONS = {'usecols': [0, 1], 'names': ['x', 'y'], 'header': None, 'skiprows': 1}
 
 def str2bool(v: str) -> bool:
     """
@@ -30,54 +58,253 @@ def str2bool(v: str) -> bool:
     else:
         raise argparse.ArgumentTypeError('Boolean value expected.')
 
-def load_csv_data(csv_file: str) -> pd.DataFrame:
+def read_csv_file(csv_file, dtype=np.float64, **options) -> pd.DataFrame:
+    """
+    Parse a CSV file of numbers with the fastest available parser engine.
+
+    :param csv_file: Path or file object of the CSV file.
+    :param dtype: NumPy dtype for all columns, which skips the type inference of pandas, inferred per column if None.
+    :param options: Further options of pd.read_csv, e.g. usecols to skip the other columns.
+    :return: DataFrame containing the CSV data.
+    """
+    return pd.read_csv(csv_file, dtype=dtype, engine=CSV_ENGINE, **options)
+
+def read_test_points(csv_file, dtype=np.float64) -> pd.DataFrame:
+    """
+    Parse the x and y columns of a test file.
+
+    :param csv_file: Path or file object of the CSV file containing test data.
+    :param dtype: NumPy dtype of the x and y columns.
+    :return: DataFrame with the columns 'x' and 'y'.
+    """
+    return read_csv_file(csv_file, dtype, **TEST_CSV_OPTIONS)
+
+def read_csv_files(csv_files: dict, dtype=np.float64, options: dict = None, workers: int = None) -> Iterator[tuple]:
+    """
+    Parse several CSV files concurrently in a thread pool and yield them in the given order.
+
+    All files are submitted at once, so while the caller processes one file, e.g. writes it to the database, the next
+    ones are still parsed. Parsing errors are raised when the failed file is reached.
+
+    :param csv_files: Dictionary of keys and paths of the CSV files.
+    :param dtype: NumPy dtype for all columns of all files.
+    :param options: Dictionary of keys and further options of pd.read_csv for the file of the key, e.g. TEST_CSV_OPTIONS.
+    :param workers: Number of files parsed at the same time, one thread per file if not given, with 0 every file is parsed
+                    in the calling thread when it is reached, so nothing overlaps.
+    :return: Iterator over tuples of the key and the DataFrame of every file.
+    """
+    options = options or {}
+    if workers == 0:
+        for key, csv_file in csv_files.items():
+            yield key, read_csv_file(csv_file, dtype, **options.get(key, {}))
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers or len(csv_files), thread_name_prefix="csv-reader")
+    try:
+        futures = {key: executor.submit(read_csv_file, csv_file, dtype, **options.get(key, {})) for key, csv_file in csv_files.items()}
+        for key, future in futures.items():
+            yield key, future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def load_csv_data(csv_file: str, dtype=None) -> pd.DataFrame:
     """
     Load CSV data into a pandas DataFrame.
 
     :param csv_file: Path to the CSV file.
+    :param dtype: NumPy dtype for all columns, which skips the type inference of pandas, inferred per column if not given.
     :return: DataFrame containing the CSV data or None if an error occurs.
     """
     try:
-        data = pd.read_csv(csv_file)
+        data = read_csv_file(csv_file, dtype)
         return data
     except Exception as e:
         logger.error(f"Error loading CSV file: {e}")
         logger.debug(traceback.format_exc())
         return None
 
-def load_dataset(db: SqliteOperations, csv_path: str, with_visualizing: bool) -> None:
+def hash_file(csv_file: str, prefix_size: int = None) -> tuple:
+    """
+    Calculate the SHA-256 hash of a file and optionally of its first bytes in the same pass.
+
+    :param csv_file: Path to the file.
+    :param prefix_size: Number of bytes at the start of the file to hash separately.
+    :return: Tuple of the hash of the file and the hash of the prefix, None if no prefix size is given.
+    """
+    file_hash = hashlib.sha256()
+    prefix_hash = None
+    read_bytes = 0
+
+    with open(csv_file, mode='rb') as file:
+        while block := file.read(HASH_BLOCK_SIZE):
+            if prefix_size is not None and read_bytes <= prefix_size < read_bytes + len(block):
+                file_hash.update(block[:prefix_size - read_bytes])
+                prefix_hash = file_hash.hexdigest()
+                file_hash.update(block[prefix_size - read_bytes:])
+            else:
+                file_hash.update(block)
+            read_bytes += len(block)
+
+    if prefix_size is not None and prefix_hash is None and read_bytes == prefix_size:
+        prefix_hash = file_hash.hexdigest()
+
+    return file_hash.hexdigest(), prefix_hash
+
+def import_csv_incrementally(db: SqliteOperations, csv_file: str, table_name: str, pragmas: dict = None, layout: str = 'wide') -> bool:
+    """
+    Import a CSV file into a table only if it changed since the last import.
+
+    Unchanged files are detected by size and modification time or, if those differ, by the content hash recorded
+    in the manifest. If the old content is still the start of the file, only the appended rows are imported,
+    which needs the wide layout. A table in another layout than the requested one is imported completely.
+
+    :param db: SqliteOperations object for database operations.
+    :param csv_file: Path to the CSV file.
+    :param table_name: Name of the table to import into.
+    :param pragmas: Dictionary of PRAGMAs to apply for the duration of a complete import.
+    :param layout: Storage layout of the table, one of TABLE_LAYOUTS of sqlite_helper.
+    :return: True if the table is up to date with the CSV file, False if the import failed and the manifest was left unchanged.
+    """
+    source = os.path.abspath(csv_file)
+    stat = os.stat(csv_file)
+    entry = db.get_manifest_entry(table_name)
+
+    if entry is None or entry['source'] != source or not db.table_exists(table_name) or db.get_table_layout(table_name) != layout:
+        content_hash, _ = hash_file(csv_file)
+    elif entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        logger.info(f"{csv_file} is unchanged, skipping import into '{table_name}'")
+        return True
+    else:
+        prefix_size = entry['size'] if stat.st_size > entry['size'] else None
+        content_hash, prefix_hash = hash_file(csv_file, prefix_size)
+
+        if content_hash == entry['content_hash']:
+            logger.info(f"{csv_file} is unchanged, skipping import into '{table_name}'")
+            db.set_manifest_entry(table_name, source, stat.st_size, stat.st_mtime_ns, content_hash)
+            return True
+
+        if prefix_hash == entry['content_hash']:
+            with open(csv_file, mode='rb') as file:
+                file.seek(prefix_size - 1)
+                appended_rows_only = file.read(1) == b'\n'
+                if appended_rows_only:
+                    columns = pd.read_csv(csv_file, nrows=0).columns
+                    tail = pd.read_csv(file, header=None, names=columns)
+
+            if appended_rows_only and layout == 'wide':
+                # the manifest only records the new content together with the written rows
+                with db.transaction():
+                    if not db.append_to_table(table_name, tail):
+                        return False
+                    db.set_manifest_entry(table_name, source, stat.st_size, stat.st_mtime_ns, content_hash)
+                logger.info(f"Appended {len(tail)} new rows of {csv_file} to '{table_name}'")
+                return True
+
+    data = load_csv_data(csv_file)
+    if data is None:
+        return False
+
+    with db.transaction(pragmas):
+        if not db.fill_table(table_name, data, layout=layout):
+            return False
+        db.set_manifest_entry(table_name, source, stat.st_size, stat.st_mtime_ns, content_hash)
+    logger.info(f"Imported {csv_file} into '{table_name}'")
+    return True
+
+def read_ideal_data(db: SqliteOperations, column_cache: ColumnCache = None, columns: list = None, dtype=np.float64) -> pd.DataFrame:
+    """
+    Read the ideal data from the column cache if it matches the database, otherwise from the database.
+
+    :param db: SqliteOperations object for database operations.
+    :param column_cache: ColumnCache of the ideal table, the database is always used if not given.
+    :param columns: List of column names to read, all columns if not given.
+    :param dtype: NumPy dtype of the read columns, a cache with another dtype is rewritten. The x values are always float64.
+    :return: DataFrame containing the ideal data or None if an error occurs.
+    """
+    if column_cache is None:
+        return db.get_data_from_table("ideal", columns=columns, dtype=dtype, x_dtype=np.float64)
+
+    fingerprint = db.get_fingerprint(["ideal"])
+    ideal_data = column_cache.read(fingerprint, columns, dtype)
+    if ideal_data is None:
+        ideal_data = db.get_data_from_table("ideal", dtype=dtype, x_dtype=np.float64)
+        if ideal_data is not None:
+            column_cache.write(ideal_data, fingerprint, dtype, x_dtype=np.float64)
+            if columns:
+                ideal_data = ideal_data[columns]
+
+    return ideal_data
+
+def load_dataset(db: SqliteOperations, csv_path: str, with_visualizing: bool, fast_import: bool = False, incremental: bool = False,
+                 column_cache: ColumnCache = None, plotmanager: PlotManager = None, dtype=np.float64, ideal_layout: str = 'wide',
+                 read_workers: int = None) -> None:
     """
     Load dataset into the database and visualize if needed.
 
     :param db: SqliteOperations object for database operations.
     :param csv_path: Path to the CSV files.
     :param with_visualizing: Boolean flag to enable visualization.
+    :param fast_import: Boolean flag to keep the journal in memory and switch off syncing to disk during the import.
+    :param incremental: Boolean flag to only import the CSV files that changed since the last import.
+    :param column_cache: ColumnCache to write the imported ideal data to.
+    :param plotmanager: PlotManager to show or export the figures with, a new one if not given.
+    :param dtype: NumPy dtype the column cache is written with, the database always keeps the parsed float64 values.
+    :param ideal_layout: Storage layout of the ideal table, one of TABLE_LAYOUTS of sqlite_helper.
+    :param read_workers: Number of CSV files parsed at the same time, see read_csv_files.
     """
     logger.debug(f"CSV-Path: {csv_path}")
     logger.debug(f"Visualize?: {with_visualizing}")
 
-    train_data = load_csv_data(os.path.join(csv_path, "train.csv"))
-    ideal_data = load_csv_data(os.path.join(csv_path, "ideal.csv"))
-
-    if train_data is None or ideal_data is None:
-        logger.error("Failed to load training or ideal data.")
-        return
-
-    db.fill_table("train", train_data)
-    db.fill_table("ideal", ideal_data)
+    from sqlite_helper import BULK_LOAD_PRAGMAS
+    pragmas = BULK_LOAD_PRAGMAS if fast_import else None
+
+    # both tables are imported in one transaction, which is committed once
+    if incremental:
+        with stage_timer.stage("import"), db.transaction(pragmas):
+            up_to_date = [import_csv_incrementally(db, os.path.join(csv_path, f"{table_name}.csv"), table_name, layout=layout)
+                          for table_name, layout in (("train", 'wide'), ("ideal", ideal_layout))]
+        if not all(up_to_date):
+            logger.error("Failed to load training or ideal data.")
+            return
+    else:
+        # the ideal file is still parsed while the training data is written, so this stage includes loading the files
+        layouts = {"train": 'wide', "ideal": ideal_layout}
+        csv_files = {table_name: os.path.join(csv_path, f"{table_name}.csv") for table_name in layouts}
+        try:
+            with stage_timer.stage("import", rows=0) as stage, db.transaction(pragmas):
+                for table_name, data in read_csv_files(csv_files, np.float64, workers=read_workers):
+                    db.fill_table(table_name, data, layout=layouts[table_name])
+                    db.delete_manifest_entry(table_name)
+                    stage.rows += len(data)
+                    if table_name == "ideal":
+                        ideal_data = data
+        except Exception as e:
+            logger.error(f"Error loading CSV file: {e}")
+            logger.debug(traceback.format_exc())
+            logger.error("Failed to load training or ideal data.")
+            return
+        if column_cache is not None:
+            column_cache.write(ideal_data, db.get_fingerprint(["ideal"]), dtype, x_dtype=np.float64)
 
     logger.info("Database created and filled with training and ideal data")
 
     if with_visualizing:
-        plotmanager = PlotManager()
-
-        data = db.get_data_from_table("train")
-        plotmanager.load_xy_as_line_plot(data, "Original Training-Data")
+        if plotmanager is None:
+            from visualize_functions import PlotManager
+            plotmanager = PlotManager()
+        show_dataset(plotmanager, db.get_data_from_table("train"), db.get_data_from_table("ideal"))
 
-        data = db.get_data_from_table("ideal")
-        plotmanager.load_xy_as_line_plot(data, "Original Ideal-Data")
+def show_dataset(plotmanager: PlotManager, training_data: pd.DataFrame, ideal_data: pd.DataFrame) -> None:
+    """
+    Show the training and the ideal data as line plots.
 
-        plotmanager.show_plots()
+    :param plotmanager: PlotManager to show or export the figures with.
+    :param training_data: DataFrame containing the training data.
+    :param ideal_data: DataFrame containing the ideal data.
+    """
+    plotmanager.load_xy_as_line_plot(training_data, "Original Training-Data")
+    plotmanager.load_xy_as_line_plot(ideal_data, "Original Ideal-Data")
+    plotmanager.show_plots()
 
 def get_row(dataframe: pd.DataFrame, column_name: str, value) -> pd.DataFrame:
     """
@@ -102,74 +329,371 @@ def get_max_deviation(col1: pd.Series, col2: pd.Series) -> float:
     max_dev = deviation.max()
     return max_dev
 
-def assign_test_data(csv_path: str, ideal_data: pd.DataFrame, ideal_functions: dict) -> pd.DataFrame:
+def mapped_thresholds(ideal_functions: dict) -> dict:
+    """
+    Get every ideal function that was mapped to a training function with its sqrt(2) threshold.
+
+    :param ideal_functions: Dictionary of ideal functions with their respective max deviations.
+    :return: Dictionary of the ideal function names and their thresholds, the first mapping defines the threshold.
+    """
+    thresholds = {}
+    for training_function in ideal_functions.values():
+        thresholds.setdefault(training_function['ideal_function'], training_function['max_deviation_factor_sqrt_two'])
+    return thresholds
+
+def build_value_index(ideal_data: pd.DataFrame, ideal_functions: dict) -> SortedValueIndex:
+    """
+    Build a SortedValueIndex over the mapped ideal functions, for assigning test points against many of them.
+
+    :param ideal_data: DataFrame containing ideal data.
+    :param ideal_functions: Dictionary of ideal functions with their respective max deviations.
+    :return: SortedValueIndex in the row order of the ideal data.
+    """
+    function_names = list(mapped_thresholds(ideal_functions))
+    return SortedValueIndex(ideal_data[function_names].to_numpy(), function_names)
+
+def assign_points(test_points: pd.DataFrame, ideal_data: pd.DataFrame, ideal_functions: dict, x_index: XGridIndex = None,
+                  value_index: SortedValueIndex = None, sort: bool = True, skip_unmatched: bool = False) -> pd.DataFrame:
+    """
+    Assign a batch of test points to ideal functions in one vectorized pass.
+
+    Every test point is aligned to its row in the ideal data, the deviations to all mapped ideal functions
+    are computed at once and the sqrt(2) threshold of the closest function is applied as a vector.
+    With a value index the closest function of points on the x grid is found by a binary search over the
+    sorted values of their row instead, interpolated points are still compared with every function.
+
+    :param test_points: DataFrame with the columns 'x' and 'y' of the test points.
+    :param ideal_data: DataFrame containing ideal data.
+    :param ideal_functions: Dictionary of ideal functions with their respective max deviations.
+    :param x_index: XGridIndex over the x values of the ideal data, built with default settings if not given.
+    :param value_index: SortedValueIndex over the mapped ideal functions in the row order of the ideal data.
+    :param sort: Boolean flag to sort the result by x, otherwise it keeps the order of the test points.
+    :param skip_unmatched: Boolean flag to leave test points without a match in the ideal data unassigned instead of raising,
+                           the result then has a boolean column 'x found'.
+    :return: DataFrame containing the test points with assigned ideal functions and deviations, sorted by x.
+    :raises ValueError: If a test point has no match in the ideal data and skip_unmatched is not set, or the value index
+                        does not cover the mapped ideal functions.
+    """
+    thresholds = mapped_thresholds(ideal_functions)
+    if value_index is not None:
+        if sorted(value_index.function_names) != sorted(thresholds):
+            raise ValueError("The value index does not cover the mapped ideal functions.")
+        thresholds = {name: thresholds[name] for name in value_index.function_names}
+    function_names = np.array(list(thresholds), dtype=object)
+    max_deviations = np.fromiter(thresholds.values(), dtype=float, count=len(thresholds))
+
+    test_x = test_points['x'].to_numpy(dtype=float)
+    test_y = test_points['y'].to_numpy(dtype=float)
+
+    if x_index is None:
+        x_index = XGridIndex(ideal_data['x'])
+
+    # points without a row of their own are compared with every function
+    compared = np.ones(len(test_x), dtype=bool)
+    found = np.ones(len(test_x), dtype=bool)
+    best = np.zeros(len(test_x), dtype=np.intp)
+    min_deviation_values = np.empty(len(test_x))
+    if value_index is not None:
+        positions = x_index.get_positions(test_x)
+        compared = positions < 0
+        best[~compared], min_deviation_values[~compared] = value_index.nearest(positions[~compared], test_y[~compared])
+
+    if compared.any():
+        ideal_matrix, found[compared] = x_index.align(test_x[compared], ideal_data[list(thresholds)])
+        if not skip_unmatched and not found.all():
+            raise ValueError(f"No unique match found for x={test_x[np.argmin(found)]} in ideal data.")
+        # the deviations of points without a match are NaN, so they are not assigned
+        deviations = np.abs(ideal_matrix - test_y[compared, np.newaxis])
+        best[compared] = deviations.argmin(axis=1)
+        min_deviation_values[compared] = deviations[np.arange(len(deviations)), best[compared]]
+    # check if Deviation is higher than max Deviation factor sqrt 2
+    mapped = min_deviation_values <= max_deviations[best]
+
+    min_deviation_functions = np.where(mapped, function_names[best], None)
+    # called once per chunk, so the message is only built if it is logged
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Assigned %d of %d test points to an ideal function", mapped.sum(), len(mapped))
+
+    test_data = pd.DataFrame({
+        'x': test_x,
+        'y': test_y,
+        'Delta Y': np.where(mapped, min_deviation_values, np.nan),
+        'No. of ideal func': min_deviation_functions,
+        'y_point_mapped': np.where(mapped, test_y, np.nan),
+        'y_point_not_found': np.where(mapped, np.nan, test_y),
+    })
+    if skip_unmatched:
+        test_data['x found'] = found
+
+    if not sort:
+        return test_data
+    return test_data.set_index('x').sort_index().reset_index()
+
+def assign_test_data(csv_path: str, ideal_data: pd.DataFrame, ideal_functions: dict, x_index: XGridIndex = None,
+                     value_index: SortedValueIndex = None, test_points: Future = None) -> pd.DataFrame:
     """
     Assign test data to ideal functions and calculate deviations.
 
     :param csv_path: Path to the CSV file containing test data.
     :param ideal_data: DataFrame containing ideal data.
     :param ideal_functions: Dictionary of ideal functions with their respective max deviations.
+    :param x_index: XGridIndex over the x values of the ideal data, built with default settings if not given.
+    :param value_index: SortedValueIndex over the mapped ideal functions to find the closest function with a binary search.
+    :param test_points: Future of the test points already being read with read_test_points, read from csv_path if not given.
     :return: DataFrame containing test data with assigned ideal functions and deviations.
     """
     test_data = pd.DataFrame()
 
-    ideal_data = ideal_data[['x', *[training_function['ideal_function'] for training_function in ideal_functions.values()]]].copy() # get every ideal function that was mapped to a training function
-
-    '''
-    would load it like the other csv-files, but it has to be loaded "line-by-line"
-    test_data = load_csv_data(os.path.join(csv_path, "test.csv"))
-    '''
     try:
-        with open(csv_path, mode='r', newline='') as file:
-            csv_reader = csv.reader(file)
+        if test_points is None:
+            with open(csv_path, mode='r', newline='') as file:
+                test_points = read_test_points(file)
+        else:
+            test_points = test_points.result()
 
-            next(csv_reader)  # Skip t
+        test_data = assign_points(test_points, ideal_data, ideal_functions, x_index, value_index)
 
-            for index, row in enumerate(csv_reader):
-                row_x = float(row[0])
-                row_y = float(row[1])
+    except Exception as e:
+        logger.error(f"Error assigning test data: {e}")
+        logger.debug(traceback.format_exc())
 
-                ideal_data_row = get_row(ideal_data, 'x', row_x)
-                if len(ideal_data_row) != 1:
-                    raise ValueError(f"No unique match found for x={row_x} in ideal data.")
+    return test_data
 
-                deviations = {col: abs(ideal_data_row.iloc[0][col] - row_y) for col in ideal_data_row if col != 'x'}
+def read_test_chunks(csv_path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Read the test points in chunks of bounded size.
 
-                min_deviation_function = min(deviations, key=deviations.get)
-                min_deviation_value = deviations[min_deviation_function]
+    :param csv_path: Path to the CSV file containing test data.
+    :param chunk_size: Maximum number of test points per chunk.
+    :return: Iterator over DataFrames with the columns 'x' and 'y'.
+    """
+    with open(csv_path, mode='r', newline='') as file:
+        # the pyarrow engine cannot read in chunks
+        yield from pd.read_csv(file, dtype=np.float64, chunksize=chunk_size, **TEST_CSV_OPTIONS)
 
-                # check if Deviation is higher than max Deviation factor sqrt 2
-                max_deviation = next((value['max_deviation_factor_sqrt_two'] for key, value in ideal_functions.items() if value['ideal_function'] == min_deviation_function), None)
-                if min_deviation_value > max_deviation:
-                    min_deviation_function = None
-                    min_deviation_value = None
-                    logger.debug(f"For {row_x} with Value y: {row_y} no Min Deviation found")
-                else:
-                    logger.debug(f"For {row_x} with Value y: {row_y} found Min Deviation with Function: {min_deviation_function}: {min_deviation_value}")
+def assign_test_chunks(chunks: Iterable[pd.DataFrame], ideal_data: pd.DataFrame, ideal_functions: dict, x_index: XGridIndex,
+                       value_index: SortedValueIndex = None) -> Iterator[pd.DataFrame]:
+    """
+    Assign every chunk of test points to the ideal functions.
 
-                row_data = {
-                    'x': [row_x],
-                    'y': [row_y],
-                    'Delta Y': min_deviation_value,
-                    'No. of ideal func': min_deviation_function,
-                }
+    :param chunks: Iterable over DataFrames with the columns 'x' and 'y'.
+    :param ideal_data: DataFrame containing ideal data.
+    :param ideal_functions: Dictionary of ideal functions with their respective max deviations.
+    :param x_index: XGridIndex over the x values of the ideal data.
+    :param value_index: SortedValueIndex over the mapped ideal functions to find the closest function with a binary search.
+    :return: Iterator over the assigned chunks, each sorted by x.
+    """
+    for chunk in chunks:
+        yield assign_points(chunk, ideal_data, ideal_functions, x_index, value_index)
+
+def stream_test_data(csv_path: str, ideal_data: pd.DataFrame, ideal_functions: dict, chunk_size: int,
+                     x_index: XGridIndex = None, db: SqliteOperations = None, table_name: str = "test",
+                     value_index: SortedValueIndex = None) -> tuple:
+    """
+    Assign test data chunk by chunk and append every assigned chunk to the database.
+
+    Only one chunk is held in memory at a time, so the memory usage depends on the chunk size and not on the size
+    of the test data. The rows are sorted by x within each chunk only.
+
+    :param csv_path: Path to the CSV file containing test data.
+    :param ideal_data: DataFrame containing ideal data.
+    :param ideal_functions: Dictionary of ideal functions with their respective max deviations.
+    :param chunk_size: Maximum number of test points per chunk.
+    :param x_index: XGridIndex over the x values of the ideal data, built with default settings if not given.
+    :param db: SqliteOperations object or DatabaseWriter to append the chunks to, nothing is written if not given.
+    :param table_name: Name of the table to append the chunks to.
+    :param value_index: SortedValueIndex over the mapped ideal functions to find the closest function with a binary search.
+    :return: Tuple of the number of assigned and unassigned test points.
+    """
+    if x_index is None:
+        x_index = XGridIndex(ideal_data['x'])
 
-                if min_deviation_function:
-                    row_data['y_point_mapped'] = row_y
-                    row_data['y_point_not_found'] = None
-                else:
-                    row_data['y_point_mapped'] = None
-                    row_data['y_point_not_found'] = row_y
+    points_assigned = 0
+    points_unassigned = 0
 
-                test_data = pd.concat([test_data, pd.DataFrame(row_data).set_index('x')])
+    try:
+        chunks = assign_test_chunks(read_test_chunks(csv_path, chunk_size), ideal_data, ideal_functions, x_index, value_index)
+        for number, chunk in enumerate(chunks):
+            assigned = int(chunk['No. of ideal func'].notna().sum())
+            points_assigned += assigned
+            points_unassigned += len(chunk) - assigned
 
-        test_data = test_data.sort_index().reset_index()
+            if db is not None:
+                db.append_to_table(table_name, chunk.drop(columns=['y_point_mapped', 'y_point_not_found']))
+            logger.debug("Chunk %d: %d test points, %d assigned", number, len(chunk), assigned)
 
     except Exception as e:
         logger.error(f"Error assigning test data: {e}")
         logger.debug(traceback.format_exc())
 
-    return test_data
+    return points_assigned, points_unassigned
+
+def squared_deviation_sums(training_matrix: np.ndarray, ideal_matrix: np.ndarray) -> np.ndarray:
+    """
+    Calculate the sum of squared deviations for every pair of training and ideal function in one pass.
+
+    The sums are expanded to ||a||² + ||b||² - 2aᵀb, so the work is done by three matrix products.
+    NaN values are ignored pairwise, like pandas does with skipna. The products are calculated in the dtype of the matrices.
+
+    :param training_matrix: Array of shape (rows, training functions), aligned on x with the ideal matrix.
+    :param ideal_matrix: Array of shape (rows, ideal functions), aligned on x with the training matrix.
+    :return: Array of shape (training functions, ideal functions) with the sums of squared deviations.
+    """
+    training_valid = ~np.isnan(training_matrix)
+    ideal_valid = ~np.isnan(ideal_matrix)
+    training_values = np.where(training_valid, training_matrix, 0.0)
+    ideal_values = np.where(ideal_valid, ideal_matrix, 0.0)
+
+    return ((training_values ** 2).T @ ideal_valid
+            + training_valid.T.astype(training_values.dtype) @ (ideal_values ** 2)
+            - 2 * training_values.T @ ideal_values)
+
+def best_ideal_columns(training_matrix: np.ndarray, ideal_matrix: np.ndarray) -> tuple:
+    """
+    Find the ideal column with the minimum sum of squared deviations for every training column.
+
+    The candidates are found with the matrix products in the dtype of the matrices, the exact sums that decide
+    between them are always accumulated in float64.
+
+    :param training_matrix: Array of shape (rows, training functions), aligned on x with the ideal matrix.
+    :param ideal_matrix: Array of shape (rows, ideal functions), aligned on x with the training matrix.
+    :return: Tuple of the positions of the best ideal columns and their exact sums of squared deviations.
+    """
+    sums = squared_deviation_sums(training_matrix, ideal_matrix)
+
+    # the expansion loses precision for large values, so every candidate within the rounding error
+    # of the minimum gets its exact sum calculated before the final choice
+    rounding_error = 64 * np.finfo(sums.dtype).eps * (
+        np.nansum(np.square(training_matrix, dtype=np.float64), axis=0)[:, np.newaxis]
+        + np.nansum(np.square(ideal_matrix, dtype=np.float64), axis=0)[np.newaxis, :])
+    limits = (sums + rounding_error).min(axis=1, keepdims=True)
+
+    best_positions = np.empty(training_matrix.shape[1], dtype=np.intp)
+    best_sums = np.empty(training_matrix.shape[1])
+    for training_position in range(training_matrix.shape[1]):
+        training_values = training_matrix[:, training_position]
+        candidates = np.flatnonzero(sums[training_position] - rounding_error[training_position] <= limits[training_position])
+        exact_sums = np.nansum((ideal_matrix[:, candidates].astype(np.float64) - training_values[:, np.newaxis]) ** 2, axis=0)
+        best_positions[training_position] = candidates[exact_sums.argmin()]
+        best_sums[training_position] = exact_sums.min()
+
+    return best_positions, best_sums
+
+# shared state of the worker processes of the parallel ideal function search
+_worker_state = {}
+
+def _init_selection_worker(shared_memory_name: str, shape: tuple, dtype: str, training_matrix: np.ndarray) -> None:
+    """
+    Attach a worker process to the shared ideal matrix.
+
+    :param shared_memory_name: Name of the shared memory block holding the ideal matrix.
+    :param shape: Shape of the ideal matrix.
+    :param dtype: Name of the dtype of the ideal matrix.
+    :param training_matrix: Array of shape (rows, training functions), aligned on x with the ideal matrix.
+    """
+    if sys.version_info >= (3, 13):
+        block = shared_memory.SharedMemory(name=shared_memory_name, track=False)
+    else:
+        block = shared_memory.SharedMemory(name=shared_memory_name)
+    _worker_state['shared_memory'] = block
+    _worker_state['ideal_matrix'] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    _worker_state['training_matrix'] = training_matrix
+
+def _select_in_block(start: int, stop: int) -> tuple:
+    """
+    Search the best ideal columns within one block of columns of the shared ideal matrix.
+
+    :param start: First column of the block.
+    :param stop: Column after the last column of the block.
+    :return: Tuple of the positions of the best ideal columns and their exact sums of squared deviations.
+    """
+    best_positions, best_sums = best_ideal_columns(_worker_state['training_matrix'], _worker_state['ideal_matrix'][:, start:stop])
+    return best_positions + start, best_sums
+
+def best_ideal_columns_parallel(training_matrix: np.ndarray, ideal_matrix: np.ndarray, workers: int) -> tuple:
+    """
+    Find the best ideal columns like best_ideal_columns, spread over a pool of worker processes.
+
+    The ideal matrix is copied into shared memory once, every worker searches blocks of its columns
+    and the results of the blocks are reduced to the overall minimum.
+
+    :param training_matrix: Array of shape (rows, training functions), aligned on x with the ideal matrix.
+    :param ideal_matrix: Array of shape (rows, ideal functions), aligned on x with the training matrix.
+    :param workers: Number of worker processes.
+    :return: Tuple of the positions of the best ideal columns and their exact sums of squared deviations.
+    """
+    number_of_columns = ideal_matrix.shape[1]
+    block_size = max(1, -(-number_of_columns // (workers * 4)))
+    blocks = [(start, min(start + block_size, number_of_columns)) for start in range(0, number_of_columns, block_size)]
+
+    block = shared_memory.SharedMemory(create=True, size=max(1, ideal_matrix.nbytes))
+    try:
+        np.ndarray(ideal_matrix.shape, dtype=ideal_matrix.dtype, buffer=block.buf)[:] = ideal_matrix
+
+        # the workers are spawned, forking them would copy the locks of the database writer and logging threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'), initializer=_init_selection_worker,
+                                 initargs=(block.name, ideal_matrix.shape, ideal_matrix.dtype.name, training_matrix)) as executor:
+            results = list(executor.map(_select_in_block, *zip(*blocks)))
+    finally:
+        block.close()
+        block.unlink()
+
+    # blocks are in column order, so ties keep the first column like the serial search
+    positions = np.stack([result[0] for result in results])
+    sums = np.stack([result[1] for result in results])
+    best_blocks = sums.argmin(axis=0)
+    columns = np.arange(training_matrix.shape[1])
+
+    return positions[best_blocks, columns], sums[best_blocks, columns]
+
+def select_ideal_functions(training_data: pd.DataFrame, ideal_data: pd.DataFrame, x_index: XGridIndex = None, workers: int = 1,
+                           pruned: bool = False) -> dict:
+    """
+    Find the ideal function for every training function based on minimum squared deviation.
+
+    Training and ideal data are aligned on x once, the complete training x ideal matrix of squared deviation
+    sums is calculated and the maximum deviations of the chosen pairs are taken from the same aligned data.
+    Float32 ideal data is searched in float32, the sums that decide and the maximum deviations are float64.
+
+    :param training_data: DataFrame containing the training data.
+    :param ideal_data: DataFrame containing the ideal data.
+    :param x_index: XGridIndex over the x values of the ideal data, built with default settings if not given.
+    :param workers: Number of worker processes for the search, the search runs in this process if 1.
+    :param pruned: Boolean flag to skip ideal functions by lower bounds and partial sums instead of calculating every sum,
+                   for very large ideal data. The result is the same, the search runs in this process.
+    :return: Dictionary with the ideal function and its max deviations for each training function.
+    """
+    training_columns = [col for col in training_data.columns if col != 'x']
+    ideal_columns = np.array([col for col in ideal_data.columns if col != 'x'], dtype=object)
+
+    if x_index is None:
+        x_index = XGridIndex(ideal_data['x'])
+
+    ideal_matrix, found = x_index.align(training_data['x'], ideal_data[list(ideal_columns)])
+    ideal_matrix = ideal_matrix[found]
+    training_matrix = training_data[training_columns].to_numpy(dtype=ideal_matrix.dtype)[found]
+
+    if pruned:
+        best_positions, _, stats = pruned_best_ideal_columns(training_matrix, ideal_matrix)
+        logger.info(f"Pruned search: {stats.pruned} of {stats.candidates} candidates pruned by lower bounds, "
+                    f"{stats.abandoned} abandoned early, {stats.evaluated} evaluated completely")
+    elif workers > 1:
+        best_positions, _ = best_ideal_columns_parallel(training_matrix, ideal_matrix, workers)
+    else:
+        best_positions, _ = best_ideal_columns(training_matrix, ideal_matrix)
+
+    ideal_functions = {}
+    for training_position, training_function in enumerate(training_columns):
+        min_position = best_positions[training_position]
+        max_deviation = np.nanmax(np.abs(training_matrix[:, training_position].astype(np.float64) - ideal_matrix[:, min_position]))
+        ideal_functions[training_function] = {
+            'ideal_function': ideal_columns[min_position],
+            'max_deviation': max_deviation,
+            'max_deviation_factor_sqrt_two': max_deviation * sqrt(2)
+        }
+        logger.debug("Ideal Function for %s: %s", training_function, ideal_columns[min_position])
+
+    return ideal_functions
 
 def find_ideal_function(training_function_name: str, training_function: pd.DataFrame, ideal_data: pd.DataFrame) -> str:
     """
@@ -182,25 +706,247 @@ def find_ideal_function(training_function_name: str, training_function: pd.DataF
     """
     logger.debug(f"Searching Ideal Function for {training_function.columns.tolist()}")
 
-    merged_data = pd.merge(training_function, ideal_data, on='x', suffixes=('_train', ''))
-    merged_training_function_name = training_function_name + '_train'
+    return select_ideal_functions(training_function[['x', training_function_name]], ideal_data)[training_function_name]['ideal_function']
+
+def log_memory_saved(dtype, *frames: pd.DataFrame) -> int:
+    """
+    Log how much memory the given data takes in the compact dtype compared with float64.
+
+    :param dtype: NumPy dtype the data is held in.
+    :param frames: DataFrames to measure, None is skipped.
+    :return: Number of bytes saved.
+    """
+    frames = [frame for frame in frames if frame is not None]
+    used = sum(int(frame.memory_usage(index=False).sum()) for frame in frames)
+    as_float64 = sum(frame.size * np.dtype(np.float64).itemsize for frame in frames)
+    logger.info(f"Data held as {np.dtype(dtype).name}: {used / 2 ** 20:.1f} MiB instead of {as_float64 / 2 ** 20:.1f} MiB "
+                f"as float64, {(as_float64 - used) / 2 ** 20:.1f} MiB saved")
+    return as_float64 - used
+
+def find_dtype_changes(db: SqliteOperations, ideal_functions: dict, test_data: pd.DataFrame, x_tolerance: float = DEFAULT_X_TOLERANCE,
+                       interpolate: bool = False, training_data: pd.DataFrame = None, ideal_data: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Repeat the selection among the chosen ideal functions and the assignment of the test points with the float64 data
+    of the database or of the given DataFrames, and flag the choices of a compact dtype that differ from it.
+
+    Only the chosen ideal functions are read, so the check costs a fraction of a float64 run.
+
+    :param db: SqliteOperations object with the imported train and ideal tables, only used if the DataFrames are not given.
+    :param ideal_functions: Dictionary of the ideal functions selected in the compact dtype.
+    :param test_data: DataFrame of the test points assigned in the compact dtype.
+    :param x_tolerance: Maximum absolute difference between an x value and the matching x value of the ideal data.
+    :param interpolate: Boolean flag to interpolate ideal values for x values between the ideal x values.
+    :param training_data: DataFrame containing the float64 training data, read from the database if not given.
+    :param ideal_data: DataFrame containing the float64 ideal data, read from the database if not given.
+    :return: DataFrame with 'x', 'y' and the ideal function of both dtypes for every test point whose assignment changed.
+    """
+    ideal_columns = chosen_ideal_columns(ideal_functions)
+    if training_data is None or ideal_data is None:
+        training_data = db.get_data_from_table("train", dtype=np.float64)
+        ideal_data = db.get_data_from_table("ideal", columns=ideal_columns, dtype=np.float64)
+    else:
+        ideal_data = ideal_data[ideal_columns]
+    x_index = XGridIndex(ideal_data['x'], tolerance=x_tolerance, interpolate=interpolate)
+
+    reference_functions = select_ideal_functions(training_data, ideal_data, x_index)
+    for training_function, mapping in reference_functions.items():
+        if mapping['ideal_function'] != ideal_functions[training_function]['ideal_function']:
+            logger.warning(f"Ideal function of {training_function} changed by the compact dtype: "
+                           f"{ideal_functions[training_function]['ideal_function']} instead of {mapping['ideal_function']}")
+
+    reference = assign_points(test_data[['x', 'y']], ideal_data, reference_functions, x_index, sort=False)
+    # unassigned points have None or NaN as ideal function
+    compact_functions = test_data['No. of ideal func']
+    compact_functions = np.where(compact_functions.notna(), compact_functions, None)
+    reference_functions = reference['No. of ideal func']
+    reference_functions = np.where(reference_functions.notna(), reference_functions, None)
+    changed = compact_functions != reference_functions
+
+    changes = pd.DataFrame({
+        'x': test_data['x'].to_numpy()[changed],
+        'y': test_data['y'].to_numpy()[changed],
+        'compact': compact_functions[changed],
+        'float64': reference_functions[changed],
+    })
+    if len(changes):
+        logger.warning(f"{len(changes)} of {len(test_data)} test points are assigned differently than with float64")
+        for change in changes.head(MAX_LOGGED_CHANGES).itertuples(index=False):
+            logger.warning(f"Test point x={change.x}, y={change.y}: {change.compact} instead of {change.float64}")
+    else:
+        logger.info("All test points are assigned like with float64")
+    return changes
+
+def chosen_ideal_columns(ideal_functions: dict) -> list:
+    """
+    Get the columns of the ideal data needed to assign test points.
+
+    :param ideal_functions: Dictionary of ideal functions with their respective max deviations.
+    :return: List of 'x' and every chosen ideal function once.
+    """
+    return ['x', *dict.fromkeys(mapping['ideal_function'] for mapping in ideal_functions.values())]
+
+def cast_values(data: pd.DataFrame, dtype) -> pd.DataFrame:
+    """
+    Cast the function columns of a DataFrame to a dtype, the x values keep their dtype.
+
+    :param data: DataFrame with an 'x' column.
+    :param dtype: NumPy dtype of the function columns.
+    :return: The DataFrame itself if it is float64 already and float64 is requested, otherwise a cast copy.
+    """
+    if np.dtype(dtype) == np.float64 and (data.dtypes.drop('x', errors='ignore') == np.float64).all():
+        return data
+    return data.astype({column: dtype for column in data.columns if column != 'x'})
+
+def selection_fingerprint(db: SqliteOperations, x_tolerance: float, interpolate: bool, dtype=np.float64) -> str:
+    """
+    Get the fingerprint the ideal functions selected for the imported data are cached under.
+
+    :param db: SqliteOperations object with the imported train and ideal tables.
+    :param x_tolerance: Maximum absolute difference between an x value and the matching x value of the ideal data.
+    :param interpolate: Boolean flag to interpolate ideal values for x values between the ideal x values.
+    :param dtype: NumPy dtype the data is searched in, a compact dtype may select differently, so it gets selections of its own.
+    :return: Fingerprint of the tables and settings.
+    """
+    compact = np.dtype(dtype) != np.float64
+    return db.get_fingerprint(["train", "ideal"], x_tolerance, interpolate, *([np.dtype(dtype).name] if compact else []))
+
+def prepare_ideal_functions(db: SqliteOperations, x_tolerance: float = DEFAULT_X_TOLERANCE, interpolate: bool = False, workers: int = 1,
+                            pruned_search: bool = False, column_cache: ColumnCache = None, with_training_data: bool = False,
+                            dtype=np.float64) -> tuple:
+    """
+    Select the ideal functions of the imported data, or take them from the selection cache, and read what is needed to assign test points.
+
+    :param db: SqliteOperations object with the imported train and ideal tables.
+    :param x_tolerance: Maximum absolute difference between an x value and the matching x value of the ideal data.
+    :param interpolate: Boolean flag to interpolate ideal values for x values between the ideal x values.
+    :param workers: Number of worker processes for the ideal function search.
+    :param pruned_search: Boolean flag to search the ideal functions with lower bounds and early abandoning.
+    :param column_cache: ColumnCache to read the ideal data from.
+    :param with_training_data: Boolean flag to read the training data even if the selection is cached.
+    :param dtype: NumPy dtype the training and ideal data are read and searched in, the x values are always float64.
+    :return: Tuple of the ideal functions, the ideal data with the x values and the chosen ideal functions, the XGridIndex
+             over it and the training data, None if it was not needed.
+    """
+    compact = np.dtype(dtype) != np.float64
+    fingerprint = selection_fingerprint(db, x_tolerance, interpolate, dtype)
+    ideal_functions = db.get_cached_selection(fingerprint)
+    selection_cached = ideal_functions is not None
+
+    if not selection_cached:
+        with stage_timer.stage("read") as stage:
+            training_data = db.get_data_from_table("train", dtype=dtype, x_dtype=np.float64)
+            ideal_data = read_ideal_data(db, column_cache, dtype=dtype)
+            stage.rows = len(training_data) + len(ideal_data)
+        if compact:
+            log_memory_saved(dtype, training_data, ideal_data)
+        x_index = XGridIndex(ideal_data['x'], tolerance=x_tolerance, interpolate=interpolate)
+
+        logger.info("Searching Ideal Functions")
+        with stage_timer.stage("select", rows=len(training_data)):
+            ideal_functions = select_ideal_functions(training_data, ideal_data, x_index, workers, pruned_search)
+        db.store_cached_selection(fingerprint, ideal_functions)
+    else:
+        logger.info("Ideal Functions loaded from cache")
+
+    logger.info(f"Ideal function cache: {db.cache_hits} hits, {db.cache_misses} misses")
+    logger.info(f"Ideal Functions: {ideal_functions}")
+
+    # only the chosen ideal functions are needed from here on
+    ideal_columns = chosen_ideal_columns(ideal_functions)
+    if selection_cached:
+        with stage_timer.stage("read") as stage:
+            ideal_data = read_ideal_data(db, column_cache, ideal_columns, dtype)
+            training_data = db.get_data_from_table("train", dtype=dtype, x_dtype=np.float64) if with_training_data else None
+            stage.rows = len(ideal_data)
+        if compact:
+            log_memory_saved(dtype, training_data, ideal_data)
+        x_index = XGridIndex(ideal_data['x'], tolerance=x_tolerance, interpolate=interpolate)
+    else:
+        ideal_data = ideal_data[ideal_columns]
+
+    return ideal_functions, ideal_data, x_index, training_data
+
+def select_ideal_functions_in_memory(training_data: pd.DataFrame, ideal_data: pd.DataFrame, x_tolerance: float = DEFAULT_X_TOLERANCE,
+                                     interpolate: bool = False, workers: int = 1, pruned_search: bool = False, dtype=np.float64) -> tuple:
+    """
+    Select the ideal functions of freshly parsed data, without writing it to the database and reading it back first.
+
+    :param training_data: DataFrame containing the parsed training data.
+    :param ideal_data: DataFrame containing the parsed ideal data.
+    :param x_tolerance: Maximum absolute difference between an x value and the matching x value of the ideal data.
+    :param interpolate: Boolean flag to interpolate ideal values for x values between the ideal x values.
+    :param workers: Number of worker processes for the ideal function search.
+    :param pruned_search: Boolean flag to search the ideal functions with lower bounds and early abandoning.
+    :param dtype: NumPy dtype the training and ideal data are searched in, the x values keep their dtype.
+    :return: Tuple like prepare_ideal_functions, with the training data in the dtype.
+    """
+    parsed_bytes = sum(int(frame.memory_usage(index=False).sum()) for frame in (training_data, ideal_data))
+    training_data = cast_values(training_data, dtype)
+    ideal_data = cast_values(ideal_data, dtype)
+    if np.dtype(dtype) != np.float64:
+        # the caller still holds the parsed float64 data, so the copies add to it instead of saving memory
+        compact_bytes = sum(int(frame.memory_usage(index=False).sum()) for frame in (training_data, ideal_data))
+        logger.info(f"Searching {np.dtype(dtype).name} copies of the parsed data: {compact_bytes / 2 ** 20:.1f} MiB held "
+                    f"next to {parsed_bytes / 2 ** 20:.1f} MiB of float64 data")
+    x_index = XGridIndex(ideal_data['x'], tolerance=x_tolerance, interpolate=interpolate)
 
-    # Create a dictionary to store the sum of squared deviations for each function
-    squared_deviation_sums = {}
+    logger.info("Searching Ideal Functions")
+    with stage_timer.stage("select", rows=len(training_data)):
+        ideal_functions = select_ideal_functions(training_data, ideal_data, x_index, workers, pruned_search)
+    logger.info(f"Ideal Functions: {ideal_functions}")
 
-    # Iterate over each y function in ideal_data
-    for col in ideal_data.columns:
-        if col != 'x':
-            # Calculate the squared deviation
-            squared_deviation = (merged_data[merged_training_function_name] - merged_data[col]) ** 2
-            # Calculate the sum of squared deviations, ignoring NaN values
-            squared_deviation_sums[col] = squared_deviation.sum(skipna=True)
+    return ideal_functions, ideal_data[chosen_ideal_columns(ideal_functions)], x_index, training_data
 
-    min_function = min(squared_deviation_sums, key=squared_deviation_sums.get)
+def persist_dataset(db: SqliteOperations, training_data: pd.DataFrame, ideal_data: pd.DataFrame, pragmas: dict = None,
+                    ideal_layout: str = 'wide', column_cache: ColumnCache = None, dtype=np.float64) -> bool:
+    """
+    Write parsed training and ideal data to the database in one transaction, like load_dataset does after parsing.
 
-    return min_function
+    :param db: SqliteOperations object for database operations.
+    :param training_data: DataFrame containing the parsed training data.
+    :param ideal_data: DataFrame containing the parsed ideal data.
+    :param pragmas: Dictionary of PRAGMAs to apply for the duration of the import.
+    :param ideal_layout: Storage layout of the ideal table, one of TABLE_LAYOUTS of sqlite_helper.
+    :param column_cache: ColumnCache to write the ideal data to.
+    :param dtype: NumPy dtype the column cache is written with.
+    :return: True once both tables are written.
+    :raises RuntimeError: If a table could not be written, the database keeps the tables it had before.
+    """
+    with db.transaction(pragmas):
+        if not db.fill_table("train", training_data):
+            raise RuntimeError("Could not write the table train")
+        if not db.fill_table("ideal", ideal_data, layout=ideal_layout):
+            raise RuntimeError("Could not write the table ideal")
+        db.delete_manifest_entry("train")
+        db.delete_manifest_entry("ideal")
+    if column_cache is not None:
+        column_cache.write(ideal_data, db.get_fingerprint(["ideal"]), dtype, x_dtype=np.float64)
+    logger.debug("Training and ideal data written to the database")
+    return True
+
+def store_selection(db: SqliteOperations, ideal_functions: dict, x_tolerance: float, interpolate: bool, dtype=np.float64,
+                    persisted: Future = None) -> None:
+    """
+    Cache the ideal functions selected for the imported data, so the next run over the database skips the selection.
 
-def main(csv_path: str, db_path_to_file: str, overwrite: bool = None, with_visualizing_steps: bool = False, with_visualizing_result: bool = False) -> None:
+    :param db: SqliteOperations object with the imported train and ideal tables.
+    :param ideal_functions: Dictionary of ideal functions with their respective max deviations.
+    :param x_tolerance: Maximum absolute difference between an x value and the matching x value of the ideal data.
+    :param interpolate: Boolean flag to interpolate ideal values for x values between the ideal x values.
+    :param dtype: NumPy dtype the ideal functions were selected in.
+    :param persisted: Future of the persist_dataset write of the data, nothing is cached if that write failed.
+    """
+    if persisted is not None and persisted.exception() is not None:
+        logger.debug("Selection not cached, the training and ideal data were not written")
+        return
+    db.store_cached_selection(selection_fingerprint(db, x_tolerance, interpolate, dtype), ideal_functions)
+
+def main(csv_path: str, db_path_to_file: str, overwrite: bool = None, with_visualizing_steps: bool = False, with_visualizing_result: bool = False,
+         x_tolerance: float = DEFAULT_X_TOLERANCE, interpolate: bool = False, chunk_size: int = None,
+         workers: int = 1, fast_import: bool = False, incremental: bool = False, column_cache: bool = False,
+         export_dir: str = None, export_format: str = 'png', pruned_search: bool = False, value_index: bool = False,
+         dtype: str = 'float64', ideal_layout: str = 'wide', read_workers: int = None, in_memory: bool = False,
+         no_db: bool = False) -> None:
     """
     Main function to handle the process of loading CSV data, processing it, and visualizing results.
 
@@ -209,14 +955,50 @@ def main(csv_path: str, db_path_to_file: str, overwrite: bool = None, with_visua
     :param overwrite: Boolean flag to indicate if the existing database should be overwritten.
     :param with_visualizing_steps: Boolean flag to enable visualization of steps.
     :param with_visualizing_result: Boolean flag to enable visualization of final results.
+    :param x_tolerance: Maximum absolute difference between an x value and the matching x value of the ideal data.
+    :param interpolate: Boolean flag to interpolate ideal values for x values between the ideal x values.
+    :param chunk_size: Stream the test data in chunks of this many points instead of loading it at once.
+    :param workers: Number of worker processes for the ideal function search.
+    :param fast_import: Boolean flag to keep the journal in memory and switch off syncing to disk during the import.
+    :param incremental: Boolean flag to only import the CSV files that changed since the last import.
+    :param column_cache: Boolean flag to keep the ideal data in a memory-mapped binary cache next to the database.
+    :param export_dir: Directory to export the visualized figures to as image files instead of showing them.
+    :param export_format: File format of the exported figures, 'png' or 'svg'.
+    :param pruned_search: Boolean flag to search the ideal functions with lower bounds and early abandoning.
+    :param value_index: Boolean flag to find the closest ideal function of each test point with a binary search over sorted values.
+    :param dtype: Name of the dtype the data is held and searched in, 'float64' or the compact 'float32', whose assignments
+                  are checked against float64.
+    :param ideal_layout: Storage layout of the imported ideal table, 'wide' with one column per function, 'long' with one row
+                         per function and x value or 'blob' with one packed array per function.
+    :param read_workers: Number of CSV files parsed at the same time, one thread per file if not given, 0 parses them one after
+                         another without overlapping the database writes.
+    :param in_memory: Boolean flag to select and assign with the parsed data of a fresh import and write the database in a
+                      background thread, instead of reading the imported data back from the database.
+    :param no_db: Boolean flag to run the in-memory pipeline without reading or writing any database.
     """
     logger.info("Starting Program")
 
-    logger.info("Checking Database")
-    db_exists = os.path.exists(db_path_to_file)
-    logger.info("Database already exists" if db_exists else "Creating new Database")
-
-    if db_exists and overwrite is None:
+    if no_db:
+        logger.info("Running without a database, nothing is written")
+        db_exists = False
+        if incremental:
+            logger.warning("Nothing is imported incrementally without a database.")
+            incremental = False
+    else:
+        logger.info("Checking Database")
+        db_exists = os.path.exists(db_path_to_file)
+        logger.info("Database already exists" if db_exists else "Creating new Database")
+
+    if in_memory and incremental:
+        logger.warning("The incremental import reads the data back from the database, the in-memory pipeline is not used.")
+        in_memory = False
+
+    if incremental:
+        overwrite = True
+    elif db_exists and overwrite is None and not sys.stdin.isatty():
+        logger.warning("Not running interactively, the existing database is not overwritten.")
+        overwrite = False
+    elif db_exists and overwrite is None:
         logger.info("Do you want to overwrite the existing database? (yes/no): ")
         while overwrite is None:
             user_input = input().strip().lower()
@@ -225,89 +1007,159 @@ def main(csv_path: str, db_path_to_file: str, overwrite: bool = None, with_visua
             except argparse.ArgumentTypeError as error:
                 logger.warning(error)
 
-    db = SqliteOperations(db_path_to_file)
-    plotmanager = PlotManager()
-
-    if not db_exists or overwrite:
-        if db_exists:
-            logger.warning("Database gets overwritten.")
-        load_dataset(db=db, csv_path=csv_path, with_visualizing=with_visualizing_steps)
-    else:
-        logger.warning("Database already exists and should not be overwritten. Skipping data import.")
+    import_data = not db_exists or overwrite
+    write_db = import_data and not no_db
+    in_memory = (in_memory or no_db) and import_data
 
-    training_data = db.get_data_from_table("train")
-    ideal_data = db.get_data_from_table("ideal")
+    from sqlite_helper import SqliteOperations, DatabaseWriter, BULK_LOAD_PRAGMAS
+    db = SqliteOperations(db_path_to_file) if not no_db else None
+    ideal_cache = ColumnCache(db_path_to_file + COLUMN_CACHE_SUFFIX) if column_cache and not no_db else None
+    # in memory, everything written to the database is queued to a background writer, which is joined at the end
+    writer = DatabaseWriter(db) if in_memory and write_db else None
+    if writer:
+        writer.start()
 
-    logger.info("Searching Ideal Functions")
-    ideal_functions = {}
-    for col in training_data:
-        if col != 'x':
-            min_function = find_ideal_function(col, training_data[['x', col]], ideal_data)
-            max_deviation = get_max_deviation(training_data[col], ideal_data[min_function])
-
-            ideal_functions[col] = {
-                'ideal_function': min_function,
-                'max_deviation': max_deviation,
-                'max_deviation_factor_sqrt_two': max_deviation * sqrt(2)
-            }
-
-    logger.info(f"Ideal Functions: {ideal_functions}")
-
-    if with_visualizing_steps:
-        for training_function in ideal_functions:
-            training_function_data = training_data[['x', training_function]]
-            ideal_function_data = ideal_data[['x', ideal_functions[training_function]['ideal_function']]]
-
-            # Rename columns with suffixes:
-            training_function_data = training_function_data.rename(columns={col: col + '_train' for col in training_function_data.columns if col != 'x'})
-            ideal_function_data = ideal_function_data.rename(columns={col: col + '_ideal' for col in ideal_function_data.columns if col != 'x'})
-
-            data = pd.merge(training_function_data, ideal_function_data, on='x')
-
-            plotmanager.load_xy_as_line_plot(data, f"Training Function {training_function} with Ideal Function {ideal_functions[training_function]['ideal_function']}")
-
-        plotmanager.show_plots()
-
-    test_data = assign_test_data(csv_path=os.path.join(csv_path, 'test.csv'), ideal_data=ideal_data, ideal_functions=ideal_functions)
-
-    points_unassigned = test_data['No. of ideal func'].isna().sum()
-    points_assigned = test_data['No. of ideal func'].notna().sum()
-    logger.info(f"Results for Test-Data: \nPoints Assigned: {points_assigned}\nPoints Unassigned: {points_unassigned}\n")
-
-    if not db_exists or overwrite:
-        db.drop_table("test")
-        db.fill_table("test", test_data.drop(columns=['y_point_mapped', 'y_point_not_found']))
-        logger.info("Database filled with test data")
-    else:
-        logger.info("Not allowed to overwrite Database, set --overwrite to True for overwriting")
+    try:
+        plotmanager = None
+        if export_dir and not (with_visualizing_steps or with_visualizing_result):
+            logger.warning("No figures are exported, visualize the steps or the results to export them.")
+        if with_visualizing_steps or with_visualizing_result:
+            from visualize_functions import PlotManager, FULL_SCREEN
+            plotmanager = PlotManager(export_dir=export_dir, export_format=export_format)
+
+        # the test points are parsed in the background while the other files are imported and the ideal functions are selected
+        test_reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="csv-reader") if read_workers != 0 and not chunk_size else None
+        test_points = test_reader.submit(read_test_points, os.path.join(csv_path, 'test.csv')) if test_reader else None
+
+        if import_data and db_exists:
+            logger.info("Database gets updated with the changed CSV files." if incremental else "Database gets overwritten.")
+        elif not import_data:
+            logger.warning("Database already exists and should not be overwritten. Skipping data import.")
+
+        # the float64 data of the in-memory pipeline, to check the assignments of a compact dtype against
+        parsed_data = {}
+        if in_memory:
+            csv_files = {table_name: os.path.join(csv_path, f"{table_name}.csv") for table_name in ("train", "ideal")}
+            try:
+                with stage_timer.stage("load") as stage:
+                    parsed_data = dict(read_csv_files(csv_files, np.float64, workers=read_workers))
+                    stage.rows = sum(len(data) for data in parsed_data.values())
+            except Exception as e:
+                logger.error(f"Failed to load training or ideal data: {e}")
+                logger.debug(traceback.format_exc())
+                return
+
+            persisted = None
+            if writer:
+                persisted = writer.submit(persist_dataset, parsed_data["train"], parsed_data["ideal"], BULK_LOAD_PRAGMAS if fast_import else None,
+                                          ideal_layout, ideal_cache, DTYPES[dtype])
+            if with_visualizing_steps:
+                show_dataset(plotmanager, parsed_data["train"], parsed_data["ideal"])
+
+            ideal_functions, ideal_data, x_index, training_data = select_ideal_functions_in_memory(
+                parsed_data["train"], parsed_data["ideal"], x_tolerance, interpolate, workers, pruned_search, DTYPES[dtype])
+            if writer:
+                # the writes run in order, so the data is written or has failed before the selection would be cached
+                writer.submit(store_selection, ideal_functions, x_tolerance, interpolate, DTYPES[dtype], persisted=persisted)
+            # a compact dtype is only checked against the chosen ideal functions, the other float64 columns are released
+            # here, or once the writer has written them
+            parsed_data = {"train": parsed_data["train"], "ideal": parsed_data["ideal"][chosen_ideal_columns(ideal_functions)]} \
+                if dtype != 'float64' else {}
+        else:
+            if import_data:
+                load_dataset(db=db, csv_path=csv_path, with_visualizing=with_visualizing_steps, fast_import=fast_import, incremental=incremental,
+                             column_cache=ideal_cache, plotmanager=plotmanager, dtype=DTYPES[dtype], ideal_layout=ideal_layout,
+                             read_workers=read_workers)
+
+            ideal_functions, ideal_data, x_index, training_data = prepare_ideal_functions(
+                db, x_tolerance, interpolate, workers, pruned_search, ideal_cache, with_training_data=with_visualizing_steps, dtype=DTYPES[dtype])
+        # the test table is written by the background writer in memory and by this thread otherwise
+        test_db = writer or db
+
+        if with_visualizing_steps:
+            for training_function in ideal_functions:
+                training_function_data = training_data[['x', training_function]]
+                ideal_function_data = ideal_data[['x', ideal_functions[training_function]['ideal_function']]]
+
+                # Rename columns with suffixes:
+                training_function_data = training_function_data.rename(columns={col: col + '_train' for col in training_function_data.columns if col != 'x'})
+                ideal_function_data = ideal_function_data.rename(columns={col: col + '_ideal' for col in ideal_function_data.columns if col != 'x'})
+
+                data = pd.merge(training_function_data, ideal_function_data, on='x')
+
+                plotmanager.load_xy_as_line_plot(data, f"Training Function {training_function} with Ideal Function {ideal_functions[training_function]['ideal_function']}")
+
+            plotmanager.show_plots()
+
+        sorted_values = build_value_index(ideal_data, ideal_functions) if value_index else None
+
+        if chunk_size:
+            if write_db:
+                test_db.drop_table("test")
+            # the chunks are written while they are assigned, so this stage includes persisting them
+            with stage_timer.stage("assign") as stage:
+                points_assigned, points_unassigned = stream_test_data(
+                    csv_path=os.path.join(csv_path, 'test.csv'), ideal_data=ideal_data, ideal_functions=ideal_functions,
+                    chunk_size=chunk_size, x_index=x_index, db=test_db if write_db else None, value_index=sorted_values)
+                stage.rows = points_assigned + points_unassigned
+            test_data = None
+        else:
+            with stage_timer.stage("assign") as stage:
+                test_data = assign_test_data(csv_path=os.path.join(csv_path, 'test.csv'), ideal_data=ideal_data, ideal_functions=ideal_functions, x_index=x_index,
+                                             value_index=sorted_values, test_points=test_points)
+                stage.rows = len(test_data)
+            if test_reader:
+                test_reader.shutdown()
+
+            points_unassigned = test_data['No. of ideal func'].isna().sum()
+            points_assigned = test_data['No. of ideal func'].notna().sum()
+        logger.info(f"Results for Test-Data: \nPoints Assigned: {points_assigned}\nPoints Unassigned: {points_unassigned}\n")
+
+        if dtype != 'float64' and test_data is None:
+            logger.warning("Assignments of the compact dtype are not checked against float64 when the test data is streamed in chunks")
+        elif dtype != 'float64':
+            with stage_timer.stage("verify", rows=len(test_data)):
+                find_dtype_changes(db, ideal_functions, test_data, x_tolerance, interpolate, parsed_data.get("train"), parsed_data.get("ideal"))
+
+        if write_db:
+            if test_data is not None:
+                with stage_timer.stage("persist", rows=len(test_data)):
+                    test_db.fill_table("test", test_data.drop(columns=['y_point_mapped', 'y_point_not_found']))
+            logger.info("Test data queued for the database" if writer else "Database filled with test data")
+        elif no_db:
+            logger.info("Nothing written, running without a database")
+        else:
+            logger.info("Not allowed to overwrite Database, set --overwrite to True for overwriting")
 
-    if with_visualizing_steps or with_visualizing_result:
-        logger.info("Showing Results")
+        if test_data is None and (with_visualizing_steps or with_visualizing_result):
+            logger.warning("Results are not visualized when the test data is streamed in chunks")
+        elif with_visualizing_steps or with_visualizing_result:
+            logger.info("Showing Results")
 
-        style = {
-            'y': {'linewidth': 3, 'alpha': 0.5, 'color': 'black'},
-            'y_point_mapped': {'type': 'scatter', 'linewidth': 3, 'alpha': 1, 'color': 'green'},
-            'y_point_not_found': {'type': 'scatter', 'linewidth': 3, 'alpha': 1, 'color': 'red'}
-        }
+            style = {
+                'y': {'linewidth': 3, 'alpha': 0.5, 'color': 'black'},
+                'y_point_mapped': {'type': 'scatter', 'linewidth': 3, 'alpha': 1, 'color': 'green'},
+                'y_point_not_found': {'type': 'scatter', 'linewidth': 3, 'alpha': 1, 'color': 'red'}
+            }
 
-        visualize_data = test_data.drop(columns=['Delta Y', 'No. of ideal func'])
-        ideal_columns = [training_function['ideal_function'] for training_function in ideal_functions.values()]
-        ideal_data = ideal_data[['x', *ideal_columns]].copy()
-        visualize_data = pd.merge(visualize_data, ideal_data, on='x')
+            visualize_data = test_data.drop(columns=['Delta Y', 'No. of ideal func'])
+            ideal_columns = [training_function['ideal_function'] for training_function in ideal_functions.values()]
+            ideal_data = ideal_data[['x', *ideal_columns]].copy()
+            visualize_data = pd.merge(visualize_data, ideal_data, on='x')
 
-        for col in ideal_data.columns:
-            style[col] = {'linewidth': 10, 'alpha': 0.3}
+            for col in ideal_data.columns:
+                style[col] = {'linewidth': 10, 'alpha': 0.3}
 
-        text_functions = "Train;Ideal"
-        for train_function in ideal_functions:
-            text_functions += f"\n{train_function};{ideal_functions[train_function]['ideal_function']}"
+            text_functions = "Train;Ideal"
+            for train_function in ideal_functions:
+                text_functions += f"\n{train_function};{ideal_functions[train_function]['ideal_function']}"
 
-        plotmanager.load_xy_as_line_plot(
-            data=visualize_data,
-            name="Test Data mapped to Ideal Functions",
-            position=FULL_SCREEN,
-            styles=style,
-            text=f'''
+            plotmanager.load_xy_as_line_plot(
+                data=visualize_data,
+                name="Test Data mapped to Ideal Functions",
+                position=FULL_SCREEN,
+                styles=style,
+                text=f'''
 INFO:\nThis Graph only shows the ideal function 
 for each training function, which are:
 \n{text_functions}\n
@@ -315,9 +1167,20 @@ and the test function y. The red and
 green points show the x,y values 
 that could or couldn't be mapped. 
 '''
-        )
-
-        plotmanager.show_plots()
+            )
+
+            plotmanager.show_plots()
+    finally:
+        # the figures of all steps are exported by one pool, which is waited for once
+        if plotmanager is not None:
+            plotmanager.shutdown()
+        if writer:
+            with stage_timer.stage("persist"):
+                failed = writer.close()
+            if failed:
+                logger.error(f"{failed} background writes to the database failed")
+            else:
+                logger.info("Background writes to the database finished")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Load CSV data into SQLite database.')
@@ -327,10 +1190,38 @@ if __name__ == "__main__":
     parser.add_argument('-v', '--visualize_import', action='store_true', help='Visualize every important step')
     parser.add_argument('-e', '--visualize_result', action='store_true', help='Visualize only end-results')
     parser.add_argument('-t', '--test', action='store_true', help='Run unit tests before executing main program')
+    parser.add_argument('--x-tolerance', type=float, default=DEFAULT_X_TOLERANCE, help='Maximum difference for matching x values against the ideal data')
+    parser.add_argument('--interpolate', action='store_true', help='Interpolate ideal values for x values between the ideal x values')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Stream the test data in chunks of this many points')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes for the ideal function search')
+    parser.add_argument('--pruned-search', action='store_true', help='Skip ideal functions by lower bounds and partial sums in the search, for very large ideal data')
+    parser.add_argument('--value-index', action='store_true', help='Find the closest ideal function of each test point with a binary search, for many ideal functions')
+    parser.add_argument('--dtype', choices=list(DTYPES), default='float64', help='Hold and search the data in float32 to halve its memory, assignments are checked against float64')
+    parser.add_argument('--ideal-layout', choices=['wide', 'long', 'blob'], default='wide', help='Storage layout of the ideal table, long and blob are not limited to 2000 functions')
+    parser.add_argument('--read-workers', type=int, default=None, help='Number of CSV files parsed at the same time (default: all), 0 parses them one after another')
+    parser.add_argument('--in-memory', action='store_true', help='Select and assign with the parsed data of a fresh import and write the database in the background')
+    parser.add_argument('--no-db', action='store_true', help='Select and assign with the parsed data without reading or writing a database')
+    parser.add_argument('--fast-import', action='store_true', help='Keep the journal in memory and switch off syncing to disk while importing')
+    parser.add_argument('--column-cache', action='store_true', help='Keep the ideal data in a memory-mapped binary cache next to the database')
+    parser.add_argument('-i', '--incremental', action='store_true', help='Only import the CSV files that changed since the last import')
+    parser.add_argument('--export-dir', type=str, default=None, help='Export the figures of -v and -e to image files in this directory instead of showing them')
+    parser.add_argument('--export-format', choices=['png', 'svg'], default='png', help='File format of the exported figures')
+    parser.add_argument('--serve', action='store_true', help='Load and select once, then answer assignment requests over HTTP on localhost')
+    parser.add_argument('--port', type=int, default=8750, help='TCP port of the service of --serve')
+    parser.add_argument('--unix-socket', type=str, default=None, help='Serve on this Unix socket instead of the TCP port')
+    parser.add_argument('--batch-delay', type=float, default=0.0, help='Seconds the service waits to collect concurrent requests into one batch')
+    parser.add_argument('--log-level', type=logging_level_argument, default=None, help='Logging level, e.g. DEBUG or WARNING (default: $DLMDSPWP01_LOG_LEVEL or INFO)')
+    parser.add_argument('--log-async', action='store_true', help='Write log messages in a background thread')
+    parser.add_argument('--profile', action='store_true', help='Show the wall time, CPU time and throughput of every stage')
+    parser.add_argument('--profile-stats', type=str, default=None, help='Write cProfile statistics of the run to this file')
+    parser.add_argument('--profile-trace', type=str, default=None, help='Write the stages as Chrome trace JSON to this file')
 
     args = parser.parse_args()
 
+    configure_logging(level=args.log_level, asynchronous=True if args.log_async else None)
+
     if args.test:
+        import unittest
         test_result = unittest.TextTestRunner().run(unittest.defaultTestLoader.discover('.'))
         if not test_result.wasSuccessful():
             logger.fatal("Unit Tests Failed, aborting")
@@ -338,4 +1229,35 @@ if __name__ == "__main__":
         else:
             logger.info("Unit Tests Successful")
 
-    main(args.csv_path, args.db_path_to_file, args.overwrite, args.visualize_import, args.visualize_result)
\ No newline at end of file
+    profiler = None
+    if args.profile_stats:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    stage_timer.reset()
+    try:
+        if args.serve:
+            from classification_service import load_model, serve
+            model = load_model(args.db_path_to_file, csv_path=args.csv_path, x_tolerance=args.x_tolerance, interpolate=args.interpolate,
+                               workers=args.workers, pruned_search=args.pruned_search, value_index=args.value_index,
+                               column_cache=args.column_cache, dtype=args.dtype)
+            serve(model, port=args.port, unix_socket=args.unix_socket, max_batch_delay=args.batch_delay)
+        else:
+            main(args.csv_path, args.db_path_to_file, overwrite=args.overwrite, with_visualizing_steps=args.visualize_import,
+                 with_visualizing_result=args.visualize_result, x_tolerance=args.x_tolerance, interpolate=args.interpolate,
+                 chunk_size=args.chunk_size, workers=args.workers, fast_import=args.fast_import, incremental=args.incremental,
+                 column_cache=args.column_cache, export_dir=args.export_dir, export_format=args.export_format,
+                 pruned_search=args.pruned_search, value_index=args.value_index, dtype=args.dtype, ideal_layout=args.ideal_layout,
+                 read_workers=args.read_workers, in_memory=args.in_memory, no_db=args.no_db)
+    finally:
+        # also write the profile when the service is stopped or the run failed
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile_stats)
+            logger.info(f"cProfile statistics written to {args.profile_stats}, view them with: python -m pstats {args.profile_stats}")
+        if args.profile_trace:
+            stage_timer.write_chrome_trace(args.profile_trace)
+            logger.info(f"Chrome trace written to {args.profile_trace}")
+        if args.profile:
+            logger.info(f"Stage timings:\n{stage_timer.format_summary()}")
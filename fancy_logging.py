@@ -1,6 +1,13 @@
+import argparse
+import atexit
 import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
 
-LOGGING_LEVEL = logging.INFO
+# the logging level and mode can be changed with these environment variables or the command line options
+LOGGING_LEVEL_ENVIRONMENT_VARIABLE = "DLMDSPWP01_LOG_LEVEL"
+LOGGING_ASYNC_ENVIRONMENT_VARIABLE = "DLMDSPWP01_LOG_ASYNC"
 
 
 class LoggingLevelError(Exception):
@@ -15,6 +22,45 @@ class LoggingLevelError(Exception):
         super().__init__(self.message)
 
 
+def parse_logging_level(level) -> int:
+    """
+    Convert a logging level name like 'DEBUG' or a number into a logging level.
+
+    :param level: Name or number of the logging level.
+    :return: Logging level as integer.
+    :raises LoggingLevelError: If the logging level is unknown.
+    """
+    if isinstance(level, int):
+        return level
+    level = str(level).strip().upper()
+    if level.isdigit():
+        return int(level)
+    if isinstance(logging.getLevelName(level), int):
+        return logging.getLevelName(level)
+    raise LoggingLevelError(f"Unknown logging level: {level}")
+
+
+def logging_level_argument(level: str) -> int:
+    """
+    Parse the logging level of a command line option, an unknown level becomes a usage error of argparse.
+
+    :param level: Name or number of the logging level.
+    :return: Logging level as integer.
+    :raises argparse.ArgumentTypeError: If the logging level is unknown.
+    """
+    try:
+        return parse_logging_level(level)
+    except LoggingLevelError as e:
+        raise argparse.ArgumentTypeError(f"{e.message}, e.g. DEBUG, INFO, WARNING, ERROR or a number")
+
+
+try:
+    LOGGING_LEVEL = parse_logging_level(os.environ.get(LOGGING_LEVEL_ENVIRONMENT_VARIABLE, logging.INFO))
+except LoggingLevelError as e:
+    print(e)
+    LOGGING_LEVEL = logging.INFO
+
+
 class ColorFormatter(logging.Formatter):
     """
     Custom formatter to add color to logging messages.
@@ -35,9 +81,15 @@ class ColorFormatter(logging.Formatter):
         logging.CRITICAL: bold_red + format + reset
     }
 
+    def __init__(self):
+        super().__init__()
+        # one formatter per level is built once and reused for every record
+        self.formatters = {level: logging.Formatter(log_fmt) for level, log_fmt in self.FORMATS.items()}
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
+        formatter = self.formatters.get(record.levelno)
+        if formatter is None:
+            formatter = self.formatters.setdefault(record.levelno, logging.Formatter(self.FORMATS.get(record.levelno)))
         return formatter.format(record)
 
 
@@ -47,11 +99,14 @@ class Logger:
 
     :param name: Name of the logger.
     :param level: Logging level.
+    :param asynchronous: Write the records in a background thread instead of the logging thread.
     :raises LoggingLevelError: If the logging level is not an integer.
     """
 
-    def __init__(self, name: str, level: int):
+    def __init__(self, name: str, level: int, asynchronous: bool = False):
         self.logger = logging.getLogger(name)
+        self.handler = None
+        self.listener = None
         try:
             if not isinstance(level, int):
                 raise LoggingLevelError("Logging level must be an integer.")
@@ -60,19 +115,72 @@ class Logger:
             print(e)
             level = logging.DEBUG
             self.logger.setLevel(level)
-        self.set_handler(level)
+        self.set_handler(level, asynchronous)
 
-    def set_handler(self, level: int):
+    def set_handler(self, level: int, asynchronous: bool = False):
         """
-        Set the handler for the logger.
+        Set the handler for the logger, an existing handler is replaced.
 
         :param level: Logging level for the handler.
+        :param asynchronous: Hand the records to a QueueListener thread that formats and writes them.
         """
+        self.stop_listener()
+        if self.handler is not None:
+            self.logger.removeHandler(self.handler)
+
         ch = logging.StreamHandler()
         ch.setLevel(level)
         ch.setFormatter(ColorFormatter())
-        self.logger.addHandler(ch)
 
+        if asynchronous:
+            log_queue = queue.SimpleQueue()
+            self.listener = QueueListener(log_queue, ch, respect_handler_level=True)
+            self.listener.start()
+            atexit.register(self.stop_listener)
+            self.handler = QueueHandler(log_queue)
+            self.handler.setLevel(level)
+        else:
+            self.handler = ch
 
-logger = Logger("DLMDSPWP01", LOGGING_LEVEL).logger
-logger.info("Logger initialized successfully.")
+        self.logger.addHandler(self.handler)
+
+    def set_level(self, level):
+        """
+        Change the logging level of the logger and its handler.
+
+        :param level: Name or number of the logging level.
+        :raises LoggingLevelError: If the logging level is unknown.
+        """
+        level = parse_logging_level(level)
+        self.logger.setLevel(level)
+        self.handler.setLevel(level)
+        if self.listener is not None:
+            for handler in self.listener.handlers:
+                handler.setLevel(level)
+
+    def stop_listener(self):
+        """
+        Write all queued records and stop the background thread of the asynchronous mode.
+        """
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
+logger_setup = Logger("DLMDSPWP01", LOGGING_LEVEL,
+                      asynchronous=os.environ.get(LOGGING_ASYNC_ENVIRONMENT_VARIABLE, "").lower() in ("1", "true", "yes"))
+logger = logger_setup.logger
+
+
+def configure_logging(level=None, asynchronous=None):
+    """
+    Change the logging level and mode of the program logger, e.g. from command line options.
+
+    :param level: Name or number of the logging level, unchanged if not given.
+    :param asynchronous: Boolean flag to write the records in a background thread, unchanged if not given.
+    :raises LoggingLevelError: If the logging level is unknown.
+    """
+    if asynchronous is not None and asynchronous != (logger_setup.listener is not None):
+        logger_setup.set_handler(logger.level, asynchronous)
+    if level is not None:
+        logger_setup.set_level(level)
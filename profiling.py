@@ -0,0 +1,137 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+
+@dataclass
+class StageRecord:
+    """
+    Timing of one run of a pipeline stage.
+
+    :param name: Name of the stage.
+    :param start: Start of the stage in seconds of time.perf_counter.
+    :param wall_time: Wall time of the stage in seconds.
+    :param cpu_time: CPU time of this process during the stage in seconds.
+    :param rows: Number of rows the stage processed, if known.
+    """
+    name: str
+    start: float
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    rows: int = None
+    thread_id: int = field(default_factory=threading.get_ident)
+
+    @property
+    def throughput(self):
+        """
+        Rows processed per second of wall time, None if the rows are unknown.
+        """
+        if self.rows is None or not self.wall_time:
+            return None
+        return self.rows / self.wall_time
+
+
+class StageTimer:
+    """
+    Collects the wall time, CPU time and processed rows of the stages of the pipeline.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.origin = time.perf_counter()
+
+    def reset(self):
+        """
+        Delete all records.
+        """
+        self.records = []
+        self.origin = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        Time the code within the context as a stage, the yielded record's rows can be set within the context.
+
+        :param name: Name of the stage.
+        :param rows: Number of rows the stage processes, if known in advance.
+        """
+        record = StageRecord(name=name, start=time.perf_counter(), rows=rows)
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall_time = time.perf_counter() - record.start
+            record.cpu_time = time.process_time() - cpu_start
+            self.records.append(record)
+
+    def timed(self, name):
+        """
+        Decorator timing every call of a function as a stage.
+
+        :param name: Name of the stage.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self):
+        """
+        Sum up the records per stage.
+
+        :return: List of dictionaries with 'stage', 'calls', 'wall_time', 'cpu_time', 'rows' and 'throughput', in order of appearance.
+        """
+        stages = {}
+        for record in self.records:
+            stage = stages.setdefault(record.name, {'stage': record.name, 'calls': 0, 'wall_time': 0.0, 'cpu_time': 0.0, 'rows': None})
+            stage['calls'] += 1
+            stage['wall_time'] += record.wall_time
+            stage['cpu_time'] += record.cpu_time
+            if record.rows is not None:
+                stage['rows'] = (stage['rows'] or 0) + record.rows
+
+        for stage in stages.values():
+            stage['throughput'] = stage['rows'] / stage['wall_time'] if stage['rows'] is not None and stage['wall_time'] else None
+        return list(stages.values())
+
+    def format_summary(self):
+        """
+        Format the summary as a table.
+
+        :return: Table as string.
+        """
+        lines = [f"{'Stage':<12} {'Calls':>5} {'Wall [s]':>10} {'CPU [s]':>10} {'Rows':>12} {'Rows/s':>14}"]
+        for stage in self.summary():
+            rows = f"{stage['rows']:>12}" if stage['rows'] is not None else f"{'-':>12}"
+            throughput = f"{stage['throughput']:>14.0f}" if stage['throughput'] is not None else f"{'-':>14}"
+            lines.append(f"{stage['stage']:<12} {stage['calls']:>5} {stage['wall_time']:>10.4f} {stage['cpu_time']:>10.4f} {rows} {throughput}")
+        return "\n".join(lines)
+
+    def write_chrome_trace(self, path):
+        """
+        Write the records as Chrome trace events, to be opened with chrome://tracing or Perfetto.
+
+        :param path: Path of the JSON file.
+        """
+        events = [{
+            'name': record.name,
+            'ph': 'X',
+            'ts': (record.start - self.origin) * 1e6,
+            'dur': record.wall_time * 1e6,
+            'pid': os.getpid(),
+            'tid': record.thread_id,
+            'args': {'cpu_time_s': record.cpu_time, 'rows': record.rows},
+        } for record in self.records]
+
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+
+stage_timer = StageTimer()
@@ -0,0 +1,166 @@
+from dataclasses import dataclass
+import numpy as np
+
+# number of segments the rows are split into for the lower bounds of the sums of squared deviations
+PRUNING_SEGMENTS = 16
+# number of candidates and rows that are processed together
+PRUNING_BATCH_SIZE = 256
+PRUNING_ROW_BLOCK = 256
+
+
+@dataclass
+class PruningStats:
+    """
+    Counts of the candidates of a pruned search.
+
+    :param candidates: Number of training and ideal function pairs.
+    :param pruned: Pairs discarded by their lower bound without looking at the rows.
+    :param abandoned: Pairs discarded while their sum was calculated, once the partial sum exceeded the best sum.
+    :param evaluated: Pairs whose sum was calculated completely.
+    """
+    candidates: int = 0
+    pruned: int = 0
+    abandoned: int = 0
+    evaluated: int = 0
+
+
+def segment_statistics(matrix: np.ndarray, edges: np.ndarray) -> tuple:
+    """
+    Calculate the mean and the standard deviation of every column within every segment of rows, in float64.
+
+    :param matrix: Array of shape (rows, columns).
+    :param edges: Array of the first row of every segment followed by the number of rows.
+    :return: Tuple of two arrays of shape (segments, columns) with the means and the standard deviations.
+    """
+    means = np.empty((len(edges) - 1, matrix.shape[1]))
+    stds = np.empty((len(edges) - 1, matrix.shape[1]))
+    for segment, (start, stop) in enumerate(zip(edges[:-1], edges[1:])):
+        means[segment] = matrix[start:stop].mean(axis=0, dtype=np.float64)
+        # centered, so large offsets do not cancel out the deviations
+        stds[segment] = np.sqrt(np.square(matrix[start:stop] - means[segment]).mean(axis=0))
+    return means, stds
+
+
+class IdealSummaries:
+    """
+    Per-segment means and standard deviations of the ideal functions, giving cheap lower bounds of their
+    sums of squared deviations from a training function.
+
+    Within a segment of L rows, sum((a - b)²) = L * (mean(a) - mean(b))² + ||a - mean(a) - (b - mean(b))||²,
+    and the second term is at least L * (std(a) - std(b))², so the sum over the segments bounds the whole sum.
+    Columns with NaN values get the bound 0 and are never pruned by it.
+
+    :param ideal_matrix: Array of shape (rows, ideal functions), aligned on x with the training data.
+    :param segments: Number of segments the rows are split into.
+    """
+
+    def __init__(self, ideal_matrix: np.ndarray, segments: int = PRUNING_SEGMENTS):
+        rows = ideal_matrix.shape[0]
+        self.edges = np.unique(np.linspace(0, rows, min(segments, rows) + 1).astype(np.intp))
+        self.lengths = np.diff(self.edges)
+        self.means, self.stds = segment_statistics(ideal_matrix, self.edges)
+
+        # a NaN value makes the mean of its segment NaN, so the data is only scanned once
+        self.complete = ~np.isnan(self.means).any(axis=0)
+        self.squared_norms = (self.lengths[:, np.newaxis] * (self.means ** 2 + self.stds ** 2)).sum(axis=0)
+        self.squared_norms[~self.complete] = np.nansum(np.square(ideal_matrix[:, ~self.complete], dtype=np.float64), axis=0)
+
+    def lower_bounds(self, training_values: np.ndarray) -> np.ndarray:
+        """
+        Calculate a lower bound of the sum of squared deviations of every ideal function from a training function.
+
+        :param training_values: Array of the values of the training function.
+        :return: Array with one lower bound per ideal function.
+        """
+        lower_bounds = np.zeros(len(self.complete))
+        if len(training_values) == 0 or np.isnan(training_values).any():
+            return lower_bounds
+
+        means, stds = segment_statistics(training_values[:, np.newaxis], self.edges)
+        lower_bounds = (self.lengths[:, np.newaxis] * ((self.means - means) ** 2 + (self.stds - stds) ** 2)).sum(axis=0)
+        lower_bounds[~self.complete] = 0.0
+        return lower_bounds
+
+
+def pruned_best_ideal_column(training_values: np.ndarray, ideal_matrix: np.ndarray, summaries: IdealSummaries,
+                             stats: PruningStats) -> tuple:
+    """
+    Find the ideal column with the minimum sum of squared deviations from one training column without
+    calculating the complete sum of every column.
+
+    The candidates are visited in the order of their lower bounds. A candidate whose lower bound exceeds the best
+    sum so far is discarded, and so is a candidate whose partial sum exceeds it while its rows are summed up.
+    Candidates within the rounding error of the minimum are kept and decided by their exact sums, like in
+    best_ideal_columns. All sums are accumulated in float64, also for a float32 ideal matrix.
+
+    :param training_values: Array of the values of the training function.
+    :param ideal_matrix: Array of shape (rows, ideal functions), aligned on x with the training values.
+    :param summaries: IdealSummaries of the ideal matrix.
+    :param stats: PruningStats the candidates are counted in.
+    :return: Tuple of the position of the best ideal column and its exact sum of squared deviations.
+    """
+    rows, number_of_columns = ideal_matrix.shape
+    lower_bounds = summaries.lower_bounds(training_values)
+    rounding_errors = 64 * np.finfo(float).eps * (np.nansum(np.square(training_values, dtype=np.float64)) + summaries.squared_norms)
+    order = np.argsort(lower_bounds, kind='stable')
+    stats.candidates += number_of_columns
+
+    limit = np.inf
+    survivors = []
+    survivor_sums = []
+    # the batches grow from a single candidate, so a good limit is known before many sums are calculated
+    start, batch_size = 0, 1
+    while start < number_of_columns:
+        batch = order[start:start + batch_size]
+        start, batch_size = start + batch_size, min(2 * batch_size, PRUNING_BATCH_SIZE)
+        remaining = lower_bounds[batch] - rounding_errors[batch] <= limit
+        stats.pruned += int(len(batch) - remaining.sum())
+        batch = batch[remaining]
+
+        sums = np.zeros(len(batch))
+        for row_start in range(0, rows, PRUNING_ROW_BLOCK):
+            if not len(batch):
+                break
+            deviations = (ideal_matrix[row_start:row_start + PRUNING_ROW_BLOCK, batch].astype(np.float64)
+                          - training_values[row_start:row_start + PRUNING_ROW_BLOCK, np.newaxis])
+            sums += np.nansum(deviations ** 2, axis=0)
+            remaining = sums - rounding_errors[batch] <= limit
+            if not remaining.all():
+                stats.abandoned += int(len(batch) - remaining.sum())
+                batch, sums = batch[remaining], sums[remaining]
+
+        if len(batch):
+            stats.evaluated += len(batch)
+            limit = min(limit, (sums + rounding_errors[batch]).min())
+            survivors.append(batch)
+            survivor_sums.append(sums)
+
+    survivors = np.concatenate(survivors)
+    survivor_sums = np.concatenate(survivor_sums)
+    candidates = np.sort(survivors[survivor_sums - rounding_errors[survivors] <= limit])
+    exact_sums = np.nansum((ideal_matrix[:, candidates].astype(np.float64) - training_values[:, np.newaxis]) ** 2, axis=0)
+    return candidates[exact_sums.argmin()], exact_sums.min()
+
+
+def pruned_best_ideal_columns(training_matrix: np.ndarray, ideal_matrix: np.ndarray, summaries: IdealSummaries = None) -> tuple:
+    """
+    Find the ideal column with the minimum sum of squared deviations for every training column with a pruned search.
+
+    The result is the same as the one of the exhaustive best_ideal_columns.
+
+    :param training_matrix: Array of shape (rows, training functions), aligned on x with the ideal matrix.
+    :param ideal_matrix: Array of shape (rows, ideal functions), aligned on x with the training matrix.
+    :param summaries: IdealSummaries of the ideal matrix, calculated if not given.
+    :return: Tuple of the positions of the best ideal columns, their exact sums of squared deviations and the PruningStats.
+    """
+    if summaries is None:
+        summaries = IdealSummaries(ideal_matrix)
+    stats = PruningStats()
+
+    best_positions = np.empty(training_matrix.shape[1], dtype=np.intp)
+    best_sums = np.empty(training_matrix.shape[1])
+    for training_position in range(training_matrix.shape[1]):
+        best_positions[training_position], best_sums[training_position] = pruned_best_ideal_column(
+            training_matrix[:, training_position], ideal_matrix, summaries, stats)
+
+    return best_positions, best_sums, stats
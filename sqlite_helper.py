@@ -1,48 +1,392 @@
-from sqlalchemy import create_engine, MetaData, Table, Column, Float, select, inspect, text
+from sqlalchemy import create_engine
+from concurrent.futures import Future
+from contextlib import contextmanager
+import hashlib
+import json
+import queue
+import threading
+import uuid
+import numpy as np
 import pandas as pd
+import time
 import traceback
 from fancy_logging import logger
 
+# PRAGMAs for fast imports, the journal is kept in memory and syncing to disk is switched off for the duration of the import.
+# The journal is not switched off, a failed write within the import still has to be rolled back
+BULK_LOAD_PRAGMAS = {
+    'journal_mode': 'MEMORY',
+    'synchronous': 'OFF',
+    'cache_size': -262144,
+}
+
+
+# table keeping track of the imported CSV files
+MANIFEST_TABLE = 'import_manifest'
+
+# tables keeping track of the table contents and the ideal functions selected for them
+TABLE_VERSIONS_TABLE = 'table_versions'
+SELECTION_CACHE_TABLE = 'ideal_function_cache'
+
+# number of rows fetched from the cursor at once
+FETCH_SIZE = 65536
+
+# number of prepared statements every connection keeps for reuse
+STATEMENT_CACHE_SIZE = 256
+
+# storage layouts of a table: one column per function, one row per function and x value, or one packed array per column
+TABLE_LAYOUTS = ('wide', 'long', 'blob')
+# table keeping track of the tables that are not stored in the wide layout
+LAYOUTS_TABLE = 'table_layouts'
+# dtype of the packed arrays of the blob layout
+BLOB_DTYPE = np.dtype('<f8')
+# number of functions looked up by one statement, below the SQLite limit of bound parameters
+LOOKUP_SIZE = 500
+
+
+def quote_identifier(name):
+    """
+    Quote a table or column name for use in SQL statements.
+
+    :param name: Name to quote.
+    :return: Quoted name.
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
 
 class SqliteOperations:
     """
     Class to handle SQLite database operations.
+
+    Every thread uses one long-lived connection, so the prepared statements of repeated SQL are reused
+    and several threads can read at the same time. The tables, their columns and layouts are looked up
+    when they are first used and cached until the schema of the database changes.
     """
 
     def __init__(self, db_path):
         """
-        Initialize the SqliteOperations with a database path.
+        Initialize the SqliteOperations with a database path, nothing is read from the database yet.
 
         :param db_path: Path to the SQLite database file.
         """
-        self.engine = create_engine(f'sqlite:///{db_path}')
-        self.metadata = MetaData()
-        self.metadata.reflect(self.engine)
+        self.engine = create_engine(f'sqlite:///{db_path}', connect_args={'cached_statements': STATEMENT_CACHE_SIZE})
         self.logger = logger
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # sqlite3 connections must not be shared between threads, so every thread has its own connection and schema cache
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        """
+        Get the connection of the calling thread, it is opened on first use and kept until close is called.
+
+        :return: DBAPI connection.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.engine.raw_connection()
+            self._local.depth = 0
+            self._local.schema = None
+        return connection
+
+    def close(self):
+        """
+        Close the connection of the calling thread, the next call opens a new one.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            self._local.connection = None
+            connection.close()
+
+    def execute(self, statement, parameters=()):
+        """
+        Execute a statement on the connection of the calling thread.
+
+        :param statement: SQL statement with ? placeholders, the same text reuses the prepared statement.
+        :param parameters: Sequence of values for the placeholders.
+        :return: Cursor to fetch the result from.
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(statement, parameters)
+        return cursor
 
-    def get_data_from_table(self, table_name):
+    @contextmanager
+    def transaction(self, pragmas=None):
+        """
+        Context manager for a transaction that is committed once at its end and rolled back on an exception.
+
+        The write methods run in a transaction of their own. Within this scope they join it through savepoints
+        instead, so e.g. a multi-table import is committed once, and a failed write only rolls back its own changes.
+        Rolling back needs a journal, so journal_mode OFF is applied as MEMORY.
+
+        :param pragmas: Dictionary of PRAGMAs to apply for the duration of the transaction, e.g. BULK_LOAD_PRAGMAS.
+                        Ignored for a transaction within another one.
+        """
+        connection = self.connection
+        cursor = connection.cursor()
+        depth = self._local.depth
+
+        if depth:
+            if pragmas:
+                self.logger.debug(f"PRAGMAs {list(pragmas)} are not applied within a running transaction")
+            savepoint = f"savepoint_{depth}"
+            cursor.execute(f"SAVEPOINT {savepoint}")
+            self._local.depth += 1
+            try:
+                yield
+            except BaseException:
+                cursor.execute(f"ROLLBACK TO {savepoint}")
+                self._local.schema = None
+                raise
+            finally:
+                cursor.execute(f"RELEASE {savepoint}")
+                self._local.depth -= 1
+            return
+
+        if pragmas and str(pragmas.get('journal_mode', '')).upper() == 'OFF':
+            self.logger.warning("journal_mode OFF cannot roll back failed writes, the journal is kept in memory instead")
+            pragmas = {**pragmas, 'journal_mode': 'MEMORY'}
+        previous_pragmas = {name: cursor.execute(f"PRAGMA {name}").fetchone()[0] for name in pragmas or {}}
+        for name, value in (pragmas or {}).items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        try:
+            cursor.execute("BEGIN")
+            self._local.depth = 1
+            try:
+                yield
+            except BaseException:
+                connection.rollback()
+                self._local.schema = None
+                raise
+            connection.commit()
+        finally:
+            self._local.depth = 0
+            for name, value in previous_pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+
+    def _schema_cache(self):
+        """
+        Get the schema cache of the calling thread, it is emptied whenever the schema version of the database changed,
+        also by other connections.
+
+        :return: Dictionary with the cached 'tables', 'columns' per table and 'layouts' per table.
+        """
+        version = self.execute("PRAGMA schema_version").fetchone()[0]
+        schema = self._local.schema
+        if schema is None or schema['version'] != version:
+            schema = self._local.schema = {'version': version, 'tables': None, 'columns': {}, 'layouts': {}}
+        return schema
+
+    def get_data_from_table(self, table_name, columns=None, x_range=None, where=None, dtype=None, x_dtype=None):
         """
         Retrieve data from a specified table.
 
+        The rows are read straight from the database cursor in blocks, which are converted block by block
+        into one NumPy array that backs the DataFrame. Without a dtype a block is float64, or object if it holds text,
+        and the columns of an object array are inferred afterwards.
+        Tables in the long or blob layout are read the same way, with only the rows or arrays
+        of the requested columns being read.
+
         :param table_name: Name of the table to retrieve data from.
+        :param columns: List of column names to retrieve, all columns if not given.
+        :param x_range: Tuple (min, max) to only retrieve rows with x within the range, inclusive.
+        :param where: Dictionary of column name to the value the column has to equal, or to a tuple (min, max) the column
+                      has to be within, inclusive, with None for an open end. The values are bound as parameters.
+                      Only for tables in the wide layout.
+        :param dtype: NumPy dtype for all retrieved columns, inferred per column if not given (float64 for the long and blob layout).
+        :param x_dtype: NumPy dtype of the x column if it differs from the dtype, e.g. to keep exact x values in a float32 table.
         :return: DataFrame containing the table data or None if an error occurs.
         """
         try:
-            table = Table(table_name, self.metadata, autoload_with=self.engine)
-            stmt = select(table)
+            layout = self.get_layout_entry(table_name)
+            if layout is not None:
+                if where:
+                    raise ValueError(f"A where predicate needs the wide layout, the table is in the {layout['layout']} layout.")
+                return self.get_layout_data(table_name, layout, columns, x_range, dtype, x_dtype)
+
+            selection = ', '.join(quote_identifier(col) for col in columns) if columns else '*'
+            conditions = []
+            parameters = []
+            if x_range is not None:
+                conditions.append('"x" BETWEEN ? AND ?')
+                parameters.extend(x_range)
+            for col, value in (where or {}).items():
+                if not isinstance(value, tuple):
+                    conditions.append(f"{quote_identifier(col)} = ?")
+                    parameters.append(value)
+                    continue
+                for operator, bound in zip((">=", "<="), value):
+                    if bound is not None:
+                        conditions.append(f"{quote_identifier(col)} {operator} ?")
+                        parameters.append(bound)
+
+            stmt = f"SELECT {selection} FROM {quote_identifier(table_name)}"
+            if conditions:
+                stmt += " WHERE " + " AND ".join(conditions)
 
-            with self.engine.connect() as conn:
-                result = conn.execute(stmt)
-                data = result.fetchall()
+            cursor = self.execute(stmt, parameters)
+            names = [description[0] for description in cursor.description]
 
-            df = pd.DataFrame(data, columns=[col.name for col in table.columns])
-            return df
+            if dtype is None:
+                blocks = []
+                while rows := cursor.fetchmany(FETCH_SIZE):
+                    blocks.append(self._block_values(rows))
+                values = np.concatenate(blocks) if blocks else np.empty((0, len(names)))
+                data = pd.DataFrame(values, columns=names, copy=False)
+                return data.infer_objects() if values.dtype == object else data
+
+            x_position = names.index('x') if x_dtype is not None and 'x' in names else None
+            blocks = []
+            x_blocks = []
+            while rows := cursor.fetchmany(FETCH_SIZE):
+                if x_position is None:
+                    blocks.append(np.array(rows, dtype=dtype))
+                    continue
+                block = np.array(rows, dtype=np.result_type(dtype, x_dtype))
+                blocks.append(block.astype(dtype, copy=False))
+                x_blocks.append(block[:, x_position].astype(x_dtype))
+
+            values = np.concatenate(blocks) if blocks else np.empty((0, len(names)), dtype=dtype)
+            data = pd.DataFrame(values, columns=names, copy=False)
+            if x_position is not None:
+                # replaces only the x column, the other columns stay views of the values
+                data['x'] = np.concatenate(x_blocks) if x_blocks else np.empty(0, dtype=x_dtype)
+            return data
 
         except Exception as e:
             self.logger.warning(f"Could not get data from table '{table_name}': {e}")
             self.logger.debug(traceback.format_exc())
             return None
 
+    @staticmethod
+    def _block_values(rows):
+        """
+        Convert a block of rows into an array, float64 unless a value is text.
+
+        The columns are declared FLOAT, so SQLite stores every number as REAL and NULL becomes NaN.
+
+        :param rows: List of row tuples fetched from a cursor.
+        :return: Array of shape (rows, columns), of dtype float64 or object.
+        """
+        try:
+            return np.array(rows, dtype=np.float64)
+        except (TypeError, ValueError):
+            return np.array(rows, dtype=object)
+
+    def get_layout_data(self, table_name, layout, columns=None, x_range=None, dtype=None, x_dtype=None):
+        """
+        Retrieve data from a table in the long or blob layout, the time depends on the number of read columns, not on the width of the table.
+
+        :param table_name: Name of the table to retrieve data from.
+        :param layout: Dictionary with 'layout', 'columns' and 'rows' of the table, see get_layout_entry.
+        :param columns: List of column names to retrieve, all columns if not given.
+        :param x_range: Tuple (min, max) to only retrieve rows with x within the range, inclusive.
+        :param dtype: NumPy dtype for all retrieved columns, float64 if not given.
+        :param x_dtype: NumPy dtype of the x column if it differs from the dtype.
+        :return: DataFrame containing the table data.
+        :raises ValueError: If a column does not exist.
+        """
+        columns = list(columns or layout['columns'])
+        unknown = set(columns) - set(layout['columns'])
+        if unknown:
+            raise ValueError(f"No columns {sorted(unknown)} in table '{table_name}'.")
+
+        cursor = self.connection.cursor()
+        if layout['layout'] == 'long':
+            arrays = self._read_long_columns(cursor, table_name, layout['columns'], columns, x_range)
+        else:
+            arrays = self._read_blob_columns(cursor, table_name, columns, x_range)
+
+        rows = len(next(iter(arrays.values()))) if arrays else 0
+        values = np.empty((rows, len(columns)), dtype=dtype or np.float64)
+        for position, col in enumerate(columns):
+            values[:, position] = arrays[col]
+        data = pd.DataFrame(values, columns=columns, copy=False)
+        if x_dtype is not None and 'x' in columns:
+            data['x'] = arrays['x'].astype(x_dtype)
+        return data
+
+    @staticmethod
+    def _read_long_columns(cursor, table_name, table_columns, columns, x_range):
+        """
+        Read columns of a table in the long layout, every function is a range of the primary key.
+
+        :param cursor: Cursor of the connection to read with.
+        :param table_name: Name of the table.
+        :param table_columns: Names of all columns of the table, the x column and the functions in the order of their ids.
+        :param columns: Names of the columns to read.
+        :param x_range: Tuple (min, max) to only read rows with x within the range, inclusive.
+        :return: Dictionary of column name to array of float64 values.
+        """
+        functions = [col for col in table_columns if col != 'x']
+        function_ids = {name: function_id for function_id, name in enumerate(functions)}
+        # the x values are stored with every function, the first one is read if no function is requested
+        lookup = sorted({function_ids[col] for col in columns if col != 'x'}) or [0]
+        condition = ' AND "x" BETWEEN ? AND ?' if x_range is not None else ''
+
+        arrays = {}
+        for start in range(0, len(lookup), LOOKUP_SIZE):
+            ids = lookup[start:start + LOOKUP_SIZE]
+            cursor.execute(f'SELECT "x", "y" FROM {quote_identifier(table_name)} WHERE "function_id" IN ({", ".join("?" * len(ids))})'
+                           f'{condition} ORDER BY "function_id", "row"', [*ids, *(x_range or ())])
+            block = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 2)
+            # every function has the same rows, in the order of the primary key
+            block = block.reshape(len(ids), len(block) // len(ids), 2)
+            arrays.setdefault('x', block[0, :, 0])
+            arrays.update((functions[function_id], block[position, :, 1]) for position, function_id in enumerate(ids))
+        return arrays
+
+    @staticmethod
+    def _read_blob_columns(cursor, table_name, columns, x_range):
+        """
+        Read columns of a table in the blob layout, every column is one packed array.
+
+        :param cursor: Cursor of the connection to read with.
+        :param table_name: Name of the table.
+        :param columns: Names of the columns to read.
+        :param x_range: Tuple (min, max) to only read rows with x within the range, inclusive.
+        :return: Dictionary of column name to array of float64 values.
+        """
+        lookup = list(dict.fromkeys([*columns, *(['x'] if x_range is not None else [])]))
+
+        arrays = {}
+        for start in range(0, len(lookup), LOOKUP_SIZE):
+            names = lookup[start:start + LOOKUP_SIZE]
+            cursor.execute(f'SELECT "name", "values" FROM {quote_identifier(table_name)} WHERE "name" IN ({", ".join("?" * len(names))})', names)
+            arrays.update((name, np.frombuffer(blob, dtype=BLOB_DTYPE)) for name, blob in cursor)
+
+        if x_range is not None:
+            in_range = (arrays['x'] >= x_range[0]) & (arrays['x'] <= x_range[1])
+            arrays = {name: values[in_range] for name, values in arrays.items()}
+        return arrays
+
+    def get_layout_entry(self, table_name):
+        """
+        Get the storage layout of a table that is not stored in the wide layout.
+
+        :param table_name: Name of the table.
+        :return: Dictionary with 'layout', 'columns' and 'rows' or None if the table is in the wide layout.
+        """
+        # a layout only changes together with its table, which changes the schema version
+        layouts = self._schema_cache()['layouts']
+        if table_name not in layouts:
+            row = None
+            if self.table_exists(LAYOUTS_TABLE):
+                row = self.execute(f"SELECT layout, columns, rows FROM {LAYOUTS_TABLE} WHERE table_name = ?", (table_name,)).fetchone()
+            layouts[table_name] = {'layout': row[0], 'columns': json.loads(row[1]), 'rows': row[2]} if row else None
+        return layouts[table_name]
+
+    def get_table_layout(self, table_name):
+        """
+        Get the name of the storage layout of a table.
+
+        :param table_name: Name of the table.
+        :return: One of TABLE_LAYOUTS.
+        """
+        layout = self.get_layout_entry(table_name)
+        return 'wide' if layout is None else layout['layout']
+
     def create_xy_table(self, table_name, column_names):
         """
         Create a table with specified column names.
@@ -51,20 +395,183 @@ class SqliteOperations:
         :param column_names: List of column names for the table.
         """
         try:
-            y_columns = [Column(col, Float) for col in column_names]
-
-            if table_name in self.metadata.tables:
-                Table(table_name, self.metadata, extend_existing=True, *y_columns)
-            else:
-                Table(table_name, self.metadata, *y_columns)
-
-            self.metadata.create_all(self.engine)
+            with self.transaction():
+                self.execute(f"CREATE TABLE IF NOT EXISTS {quote_identifier(table_name)} "
+                             f"({', '.join(quote_identifier(col) + ' FLOAT' for col in column_names)})")
             self.logger.debug(f"Table '{table_name}' created successfully.")
 
         except Exception as e:
             self.logger.warning(f"Failed to create table '{table_name}': {e}")
             self.logger.debug(traceback.format_exc())
 
+    @staticmethod
+    def create_x_index_statement(table_name):
+        """
+        Get the statement that creates the index on the x column of a table.
+
+        :param table_name: Name of the table to index.
+        :return: SQL statement creating the index.
+        """
+        return f"CREATE INDEX IF NOT EXISTS {quote_identifier('ix_' + table_name + '_x')} ON {quote_identifier(table_name)} (\"x\")"
+
+    def table_exists(self, table_name):
+        """
+        Check if a table exists in the database.
+
+        :param table_name: Name of the table to check.
+        :return: True if the table exists.
+        """
+        schema = self._schema_cache()
+        if schema['tables'] is None:
+            schema['tables'] = {name for name, in self.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return table_name in schema['tables']
+
+    def get_table_columns(self, table_name):
+        """
+        Get the column names of a table, for the long and blob layout the columns of the stored DataFrame.
+
+        :param table_name: Name of the table.
+        :return: List of column names, empty if the table does not exist.
+        """
+        layout = self.get_layout_entry(table_name)
+        if layout is not None:
+            return list(layout['columns'])
+        columns = self._schema_cache()['columns']
+        if table_name not in columns:
+            columns[table_name] = [row[1] for row in self.execute(f"PRAGMA table_info({quote_identifier(table_name)})")]
+        return list(columns[table_name])
+
+    def get_manifest_entry(self, table_name):
+        """
+        Get the manifest entry of the CSV file that was imported into a table.
+
+        :param table_name: Name of the table the CSV file was imported into.
+        :return: Dictionary with 'source', 'size', 'mtime_ns' and 'content_hash' or None if there is no entry.
+        """
+        if not self.table_exists(MANIFEST_TABLE):
+            return None
+        try:
+            row = self.execute(f"SELECT source, size, mtime_ns, content_hash FROM {MANIFEST_TABLE} WHERE table_name = ?",
+                               (table_name,)).fetchone()
+            return dict(zip(('source', 'size', 'mtime_ns', 'content_hash'), row)) if row else None
+        except Exception as e:
+            self.logger.debug(f"No manifest entry for table '{table_name}': {e}")
+            return None
+
+    def set_manifest_entry(self, table_name, source, size, mtime_ns, content_hash):
+        """
+        Record the CSV file that was imported into a table.
+
+        :param table_name: Name of the table the CSV file was imported into.
+        :param source: Absolute path of the CSV file.
+        :param size: Size of the CSV file in bytes.
+        :param mtime_ns: Modification time of the CSV file in nanoseconds.
+        :param content_hash: SHA-256 hash of the content of the CSV file.
+        """
+        try:
+            with self.transaction():
+                self.execute(f"CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (table_name TEXT PRIMARY KEY, source TEXT, "
+                             f"size INTEGER, mtime_ns INTEGER, content_hash TEXT)")
+                self.execute(f"INSERT OR REPLACE INTO {MANIFEST_TABLE} (table_name, source, size, mtime_ns, content_hash) "
+                             f"VALUES (?, ?, ?, ?, ?)", (table_name, source, size, mtime_ns, content_hash))
+        except Exception as e:
+            self.logger.warning(f"Could not update manifest for table '{table_name}': {e}")
+            self.logger.debug(traceback.format_exc())
+
+    def delete_manifest_entry(self, table_name):
+        """
+        Delete the manifest entry of a table, so the next incremental import imports it completely.
+
+        :param table_name: Name of the table.
+        """
+        if not self.table_exists(MANIFEST_TABLE):
+            return
+        try:
+            with self.transaction():
+                self.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE table_name = ?", (table_name,))
+        except Exception as e:
+            self.logger.warning(f"Could not delete manifest entry for table '{table_name}': {e}")
+            self.logger.debug(traceback.format_exc())
+
+    def update_table_version(self, table_name):
+        """
+        Give a table a new version after its content changed.
+
+        The versions are part of the fingerprints, so cached ideal functions of the old content no longer match.
+
+        :param table_name: Name of the changed table.
+        """
+        try:
+            with self.transaction():
+                self.execute(f"CREATE TABLE IF NOT EXISTS {TABLE_VERSIONS_TABLE} (table_name TEXT PRIMARY KEY, version TEXT)")
+                self.execute(f"INSERT OR REPLACE INTO {TABLE_VERSIONS_TABLE} (table_name, version) VALUES (?, ?)",
+                             (table_name, uuid.uuid4().hex))
+        except Exception as e:
+            self.logger.warning(f"Could not update version of table '{table_name}': {e}")
+            self.logger.debug(traceback.format_exc())
+
+    def get_fingerprint(self, table_names, *parameters):
+        """
+        Get a fingerprint of the current content of tables.
+
+        :param table_names: Names of the tables.
+        :param parameters: Additional values that are part of the fingerprint.
+        :return: Fingerprint as hex string or None if a table has no known version.
+        """
+        if not self.table_exists(TABLE_VERSIONS_TABLE):
+            self.logger.debug("No table versions available")
+            return None
+        versions = []
+        for table_name in table_names:
+            row = self.execute(f"SELECT version FROM {TABLE_VERSIONS_TABLE} WHERE table_name = ?", (table_name,)).fetchone()
+            versions.append(row[0] if row else None)
+
+        if None in versions:
+            return None
+        return hashlib.sha256(json.dumps([*zip(table_names, versions), *parameters]).encode()).hexdigest()
+
+    def get_cached_selection(self, fingerprint):
+        """
+        Get the ideal functions that were selected for a fingerprint.
+
+        :param fingerprint: Fingerprint of the training and ideal data.
+        :return: Dictionary of ideal functions or None if nothing is cached for the fingerprint.
+        """
+        ideal_functions = None
+        if fingerprint is not None and self.table_exists(SELECTION_CACHE_TABLE):
+            try:
+                row = self.execute(f"SELECT ideal_functions FROM {SELECTION_CACHE_TABLE} WHERE fingerprint = ?", (fingerprint,)).fetchone()
+                ideal_functions = json.loads(row[0]) if row and row[0] else None
+            except Exception as e:
+                self.logger.warning(f"Could not read cached ideal functions: {e}")
+                self.logger.debug(traceback.format_exc())
+
+        if ideal_functions is None:
+            self.cache_misses += 1
+        else:
+            self.cache_hits += 1
+        return ideal_functions
+
+    def store_cached_selection(self, fingerprint, ideal_functions):
+        """
+        Store the ideal functions that were selected for a fingerprint.
+
+        :param fingerprint: Fingerprint of the training and ideal data.
+        :param ideal_functions: Dictionary of ideal functions with their respective max deviations.
+        """
+        if fingerprint is None:
+            return
+        try:
+            serializable = {training_function: {key: value if isinstance(value, str) else float(value) for key, value in mapping.items()}
+                            for training_function, mapping in ideal_functions.items()}
+            with self.transaction():
+                self.execute(f"CREATE TABLE IF NOT EXISTS {SELECTION_CACHE_TABLE} (fingerprint TEXT PRIMARY KEY, ideal_functions TEXT)")
+                self.execute(f"INSERT OR REPLACE INTO {SELECTION_CACHE_TABLE} (fingerprint, ideal_functions) VALUES (?, ?)",
+                             (fingerprint, json.dumps(serializable)))
+        except Exception as e:
+            self.logger.warning(f"Could not cache ideal functions: {e}")
+            self.logger.debug(traceback.format_exc())
+
     def get_row_count(self, table_name):
         """
         Get the row count of a specified table.
@@ -72,40 +579,158 @@ class SqliteOperations:
         :param table_name: Name of the table to count rows in.
         :return: Integer count of rows.
         """
+        layout = self.get_layout_entry(table_name)
+        if layout is not None:
+            return layout['rows']
         try:
-            with self.engine.connect() as conn:
-                result = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}"))
-                row_count = result.scalar()
-                return row_count
+            return self.execute(f"SELECT COUNT(*) FROM {quote_identifier(table_name)}").fetchone()[0]
         except Exception as e:
             self.logger.warning(f"Could not get row count for table '{table_name}': {e}")
             self.logger.debug(traceback.format_exc())
         return None
 
 
-    def fill_table(self, table_name, data):
+    def fill_table(self, table_name, data, pragmas=None, layout='wide'):
         """
-        Fill a table with data from a DataFrame.
+        Fill a table with data from a DataFrame, an existing table is replaced.
+
+        The table is dropped, created, filled with a single prepared INSERT that is executed for all rows
+        and given a new version in one transaction, or in a savepoint within a running transaction.
+
+        In the wide layout every column of the DataFrame is a column of the table. In the long layout
+        the table has the columns function_id, row, x and y with one row per function and x value,
+        clustered by function, and in the blob layout every column is stored as one packed float64 array.
+        Both are not limited by the maximum number of columns of SQLite and read single functions cheaply.
 
         :param table_name: Name of the table to fill.
         :param data: DataFrame containing the data to fill the table with.
+        :param pragmas: Dictionary of PRAGMAs to apply for the duration of the import, e.g. BULK_LOAD_PRAGMAS,
+                        within a running transaction those of the transaction apply.
+        :param layout: Storage layout of the table, one of TABLE_LAYOUTS.
+        :return: True if the table was filled, False if it failed.
         """
         try:
-            data = data.copy()
             self.logger.debug(f"Loaded {data.shape[1]} columns and {data.shape[0]} rows for {table_name}")
+            start_time = time.perf_counter()
+            if layout not in TABLE_LAYOUTS:
+                raise ValueError(f"Unknown layout '{layout}', expected one of {TABLE_LAYOUTS}.")
+            if layout == 'long' and ('x' not in data.columns or data.shape[1] < 2):
+                raise ValueError("The long layout needs an x column and at least one function.")
 
-            if inspect(self.engine).has_table(table_name):
-                self.drop_table(table_name)
+            columns = [quote_identifier(col) for col in data.columns]
+            table = quote_identifier(table_name)
 
-            self.create_xy_table(table_name, data.columns)
+            with self.transaction(pragmas):
+                cursor = self.connection.cursor()
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+                if layout == 'long':
+                    self._insert_long(cursor, table_name, data)
+                elif layout == 'blob':
+                    self._insert_blob(cursor, table_name, data)
+                else:
+                    cursor.execute(f"CREATE TABLE {table} ({', '.join(col + ' FLOAT' for col in columns)})")
+                    cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                                       data.itertuples(index=False, name=None))
+                    if 'x' in data.columns:
+                        cursor.execute(self.create_x_index_statement(table_name))
+                self._record_layout(cursor, table_name, layout, data)
+                self.update_table_version(table_name)
 
-            data.set_index('x', inplace=True)
-            data.to_sql(table_name, con=self.engine, if_exists='append', index=True)
-            self.logger.debug(f"Table '{table_name}' filled successfully.")
+            duration = time.perf_counter() - start_time
+            self.logger.info(f"Table '{table_name}' filled with {data.shape[0]} rows in {duration:.3f}s "
+                             f"({data.shape[0] / duration if duration else float('inf'):.0f} rows/s).")
+            return True
 
         except Exception as e:
             self.logger.warning(f"Failed to fill table '{table_name}': {e}")
             self.logger.debug(traceback.format_exc())
+            return False
+
+
+    @staticmethod
+    def _insert_long(cursor, table_name, data):
+        """
+        Create a table in the long layout and insert the functions of a DataFrame, in the order of their ids.
+
+        The primary key (function_id, row) is the covering index: without a rowid the rows are stored in its
+        order, so the rows of a function are read as one range.
+
+        :param cursor: Cursor of the open transaction.
+        :param table_name: Name of the table.
+        :param data: DataFrame with an x column and one column per function.
+        """
+        table = quote_identifier(table_name)
+        cursor.execute(f'CREATE TABLE {table} ("function_id" INTEGER, "row" INTEGER, "x" FLOAT, "y" FLOAT, '
+                       f'PRIMARY KEY ("function_id", "row")) WITHOUT ROWID')
+        x = data['x'].to_numpy(dtype=np.float64).tolist()
+        functions = [col for col in data.columns if col != 'x']
+        cursor.executemany(f'INSERT INTO {table} ("function_id", "row", "x", "y") VALUES (?, ?, ?, ?)',
+                           ((function_id, row, x_value, y_value)
+                            for function_id, col in enumerate(functions)
+                            for row, (x_value, y_value) in enumerate(zip(x, data[col].to_numpy(dtype=np.float64).tolist()))))
+
+    @staticmethod
+    def _insert_blob(cursor, table_name, data):
+        """
+        Create a table in the blob layout and insert every column of a DataFrame as one packed array.
+
+        :param cursor: Cursor of the open transaction.
+        :param table_name: Name of the table.
+        :param data: DataFrame to insert.
+        """
+        table = quote_identifier(table_name)
+        cursor.execute(f'CREATE TABLE {table} ("position" INTEGER PRIMARY KEY, "name" TEXT UNIQUE, "values" BLOB)')
+        cursor.executemany(f'INSERT INTO {table} ("position", "name", "values") VALUES (?, ?, ?)',
+                           ((position, str(col), data[col].to_numpy(dtype=BLOB_DTYPE).tobytes())
+                            for position, col in enumerate(data.columns)))
+
+    @staticmethod
+    def _record_layout(cursor, table_name, layout, data):
+        """
+        Record the layout of a filled table, tables in the wide layout have no entry.
+
+        :param cursor: Cursor of the open transaction.
+        :param table_name: Name of the table.
+        :param layout: Storage layout of the table.
+        :param data: DataFrame the table was filled with.
+        """
+        if layout == 'wide':
+            if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (LAYOUTS_TABLE,)).fetchone():
+                cursor.execute(f"DELETE FROM {LAYOUTS_TABLE} WHERE table_name = ?", (table_name,))
+            return
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {LAYOUTS_TABLE} (table_name TEXT PRIMARY KEY, layout TEXT, columns TEXT, rows INTEGER)")
+        cursor.execute(f"INSERT OR REPLACE INTO {LAYOUTS_TABLE} (table_name, layout, columns, rows) VALUES (?, ?, ?, ?)",
+                       (table_name, layout, json.dumps([str(col) for col in data.columns]), len(data)))
+
+    def append_to_table(self, table_name, data):
+        """
+        Append data from a DataFrame to a table, the table is created if it does not exist.
+
+        :param table_name: Name of the table to append to.
+        :param data: DataFrame containing the data to append.
+        :return: True if the rows were appended, False if it failed.
+        """
+        try:
+            if self.get_layout_entry(table_name) is not None:
+                raise ValueError("Rows can only be appended to tables in the wide layout, fill the table again instead.")
+            columns = [quote_identifier(col) for col in data.columns]
+
+            with self.transaction():
+                if not self.table_exists(table_name):
+                    self.create_xy_table(table_name, data.columns)
+                    if 'x' in data.columns:
+                        self.execute(self.create_x_index_statement(table_name))
+                self.connection.cursor().executemany(
+                    f"INSERT INTO {quote_identifier(table_name)} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    data.itertuples(index=False, name=None))
+                self.update_table_version(table_name)
+            self.logger.debug(f"Appended {data.shape[0]} rows to table '{table_name}'.")
+            return True
+
+        except Exception as e:
+            self.logger.warning(f"Failed to append to table '{table_name}': {e}")
+            self.logger.debug(traceback.format_exc())
+            return False
 
 
     def drop_table(self, table_name):
@@ -115,9 +740,12 @@ class SqliteOperations:
         :param table_name: Name of the table to drop.
         """
         try:
-            if inspect(self.engine).has_table(table_name):
-                table = Table(table_name, self.metadata, autoload_with=self.engine)
-                table.drop(self.engine)
+            if self.table_exists(table_name):
+                with self.transaction():
+                    if self.get_layout_entry(table_name) is not None:
+                        self.execute(f"DELETE FROM {LAYOUTS_TABLE} WHERE table_name = ?", (table_name,))
+                    self.execute(f"DROP TABLE {quote_identifier(table_name)}")
+                    self.update_table_version(table_name)
                 self.logger.debug(f"Table '{table_name}' dropped successfully.")
             else:
                 self.logger.warning(f"Table '{table_name}' does not exist.")
@@ -125,3 +753,74 @@ class SqliteOperations:
             self.logger.warning(f"Could not drop table '{table_name}': {e}")
             self.logger.debug(traceback.format_exc())
 
+
+class DatabaseWriter(threading.Thread):
+    """
+    Runs the writes to a database in a background thread from a queue, so the computation does not wait for them.
+
+    The writes run one after another in the order they are queued, with the connection of the writer thread. Every write
+    returns a Future of its result. A failed write is logged and set as the exception of its Future, and the following writes still run.
+
+    :param db: SqliteOperations object to write with.
+    :param max_pending: Maximum number of queued writes, further writes wait for the writer.
+    """
+
+    def __init__(self, db: SqliteOperations, max_pending: int = 16):
+        super().__init__(name="DatabaseWriter", daemon=True)
+        self.db = db
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.failed = 0
+
+    def run(self):
+        while (item := self.queue.get()) is not None:
+            future, function, args, kwargs = item
+            try:
+                result = function(self.db, *args, **kwargs)
+                if result is False:
+                    self.failed += 1
+                future.set_result(result)
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Background write {function.__name__} failed: {e}")
+                logger.debug(traceback.format_exc())
+                future.set_exception(e)
+        self.db.close()
+
+    def submit(self, function, *args, **kwargs) -> Future:
+        """
+        Queue a write.
+
+        :param function: Function called with the SqliteOperations object and the arguments, a return value of False counts as failed.
+        :return: Future of the return value of the function.
+        """
+        future = Future()
+        self.queue.put((future, function, args, kwargs))
+        return future
+
+    def fill_table(self, table_name, data, pragmas=None, layout='wide') -> Future:
+        """
+        Queue SqliteOperations.fill_table.
+        """
+        return self.submit(SqliteOperations.fill_table, table_name, data, pragmas, layout)
+
+    def append_to_table(self, table_name, data) -> Future:
+        """
+        Queue SqliteOperations.append_to_table.
+        """
+        return self.submit(SqliteOperations.append_to_table, table_name, data)
+
+    def drop_table(self, table_name) -> Future:
+        """
+        Queue SqliteOperations.drop_table.
+        """
+        return self.submit(SqliteOperations.drop_table, table_name)
+
+    def close(self) -> int:
+        """
+        Run the queued writes and stop the thread.
+
+        :return: Number of failed writes.
+        """
+        self.queue.put(None)
+        self.join()
+        return self.failed
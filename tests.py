@@ -1,15 +1,36 @@
+import asyncio
 import math
+import hashlib
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import weakref
+import numpy as np
 import unittest
 from unittest.mock import patch, MagicMock
 import pandas as pd
 import argparse
 from io import StringIO
+from sqlalchemy import inspect
+from concurrent.futures import ThreadPoolExecutor
 
 # Import the functions and classes from your script
 from csv_processor import *
 from visualize_functions import *
 from sqlite_helper import *
 from fancy_logging import *
+from xgrid_index import *
+from column_cache import *
+from profiling import *
+from pruned_search import *
+from value_index import *
+from classification_service import *
+from batch_runner import *
+from benchmarks.synthetic_dataset import generate_dataset
 
 
 class TestUtilityFunctions(unittest.TestCase):
@@ -41,6 +62,23 @@ class TestUtilityFunctions(unittest.TestCase):
         result = load_csv_data('dummy_path.csv')
         self.assertIsNone(result)
 
+    def test_read_csv_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_files = {}
+            for name, content in (('train', "x,y1\n1,2\n2,3\n"), ('test', "x,y,extra\n1,2,a\n")):
+                csv_files[name] = os.path.join(directory, f"{name}.csv")
+                with open(csv_files[name], 'w') as file:
+                    file.write(content)
+
+            for workers in (None, 0):
+                frames = list(read_csv_files(csv_files, options={'test': TEST_CSV_OPTIONS}, workers=workers))
+                self.assertEqual([name for name, _ in frames], ['train', 'test'])
+                self.assertEqual(frames[0][1]['y1'].dtype, np.float64)
+                self.assertEqual(frames[1][1].columns.tolist(), ['x', 'y'])
+
+            with self.assertRaises(FileNotFoundError):
+                list(read_csv_files({'ideal': os.path.join(directory, 'ideal.csv')}))
+
     def test_get_row(self):
         df = pd.DataFrame({'col1': [1, 2, 3], 'col2': ['a', 'b', 'c']})
         result = get_row(df, 'col1', 2)
@@ -69,6 +107,237 @@ class TestAssignTestData(unittest.TestCase):
             self.assertEqual(result.shape[0], 3)
             self.assertIn('Delta Y', result.columns)
 
+        # test points read in the background are used instead of the file
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            test_points = executor.submit(read_test_points, StringIO("x,y,z\n1,2,0\n3,3.1,0"))
+            result = assign_test_data('missing.csv', ideal_data, ideal_functions, test_points=test_points)
+        self.assertEqual(result['No. of ideal func'].isna().tolist(), [True, False])
+
+    def test_assign_points(self):
+        test_points = pd.DataFrame({'x': [3.0, 1.0, 2.0], 'y': [3.15, 1.0, 5.0]})
+        ideal_data = pd.DataFrame({'x': [1.0, 2.0, 3.0], 'ideal1': [1.1, 2.1, 3.1], 'ideal2': [1.2, 2.2, 3.2]})
+        ideal_functions = {
+            'train1': {'ideal_function': 'ideal1', 'max_deviation': 0.2, 'max_deviation_factor_sqrt_two': 0.2 * math.sqrt(2)},
+            'train2': {'ideal_function': 'ideal2', 'max_deviation': 0.1, 'max_deviation_factor_sqrt_two': 0.1 * math.sqrt(2)},
+        }
+        result = assign_points(test_points, ideal_data, ideal_functions)
+        self.assertEqual(result['x'].tolist(), [1.0, 2.0, 3.0])
+        self.assertEqual(result['No. of ideal func'].isna().tolist(), [False, True, False])
+        self.assertEqual(result['No. of ideal func'][2], 'ideal1')
+        self.assertAlmostEqual(result['Delta Y'][0], 0.1)
+        self.assertTrue(math.isnan(result['Delta Y'][1]))
+        self.assertEqual(result['y_point_not_found'][1], 5.0)
+
+    def test_assign_points_without_match(self):
+        test_points = pd.DataFrame({'x': [4.0], 'y': [1.0]})
+        ideal_data = pd.DataFrame({'x': [1.0, 2.0, 3.0], 'ideal1': [1.1, 2.1, 3.1]})
+        ideal_functions = {'train1': {'ideal_function': 'ideal1', 'max_deviation': 0.2, 'max_deviation_factor_sqrt_two': 0.2 * math.sqrt(2)}}
+        with self.assertRaises(ValueError):
+            assign_points(test_points, ideal_data, ideal_functions)
+        result = assign_points(test_points, ideal_data, ideal_functions, skip_unmatched=True)
+        self.assertEqual(result['x found'].tolist(), [False])
+        self.assertIsNone(result['No. of ideal func'][0])
+
+    def test_assign_points_with_value_index(self):
+        rng = np.random.default_rng(0)
+        x = np.arange(-5.0, 5.5, 0.5)
+        names = [f"ideal{number}" for number in range(1, 41)]
+        # rounded values give many equal values and equally near functions
+        ideal_data = pd.DataFrame(np.column_stack([x, np.round(rng.normal(size=(len(x), 40)), 1)]), columns=['x', *names])
+        ideal_data.loc[4, 'ideal7'] = np.nan
+        ideal_functions = {f"train{number}": {'ideal_function': name, 'max_deviation_factor_sqrt_two': rng.uniform(0, 0.2)}
+                           for number, name in enumerate(rng.permutation(names))}
+        test_x = x[rng.integers(0, len(x) - 1, 500)]
+        test_x[:50] += 0.2
+        test_points = pd.DataFrame({'x': test_x, 'y': np.round(rng.normal(size=500), 2)})
+        x_index = XGridIndex(x, interpolate=True)
+
+        value_index = build_value_index(ideal_data, ideal_functions)
+        pd.testing.assert_frame_equal(assign_points(test_points, ideal_data, ideal_functions, x_index, value_index),
+                                      assign_points(test_points, ideal_data, ideal_functions, x_index))
+
+        with self.assertRaises(ValueError):
+            assign_points(test_points, ideal_data, ideal_functions, x_index, SortedValueIndex(ideal_data[names[:3]], names[:3]))
+
+    def test_find_dtype_changes(self):
+        db = SqliteOperations(':memory:')
+        db.fill_table('train', pd.DataFrame({'x': [0.1, 0.2, 0.3], 'y1': [1.0, 2.0, 3.0]}))
+        db.fill_table('ideal', pd.DataFrame({'x': [0.1, 0.2, 0.3], 'ideal1': [1.1, 2.1, 3.1], 'ideal2': [1.5, 2.5, 3.5]}))
+        ideal_functions = {'y1': {'ideal_function': 'ideal1', 'max_deviation': 0.1, 'max_deviation_factor_sqrt_two': 0.1 * math.sqrt(2)}}
+        test_points = pd.DataFrame({'x': [0.3, 0.1, 0.2], 'y': [3.1, 1.0, 9.0]})
+
+        test_data = assign_points(test_points, db.get_data_from_table('ideal', dtype=np.float32, x_dtype=np.float64), ideal_functions)
+        self.assertTrue(find_dtype_changes(db, ideal_functions, test_data).empty)
+
+        test_data.loc[0, 'No. of ideal func'] = None
+        test_data.loc[1, 'No. of ideal func'] = 'ideal1'
+        changes = find_dtype_changes(db, ideal_functions, test_data)
+        self.assertEqual(changes['x'].tolist(), [0.1, 0.2])
+        self.assertEqual(changes['compact'].isna().tolist(), [True, False])
+        self.assertEqual(changes['float64'].tolist()[0], 'ideal1')
+        self.assertTrue(pd.isna(changes['float64'][1]))
+
+    def test_stream_test_data(self):
+        csv_content = StringIO("x,y\n3,3.1\n1,2\n2,2.15\n1,1.05\n3,9")
+        ideal_data = pd.DataFrame({'x': [1.0, 2.0, 3.0], 'ideal1': [1.1, 2.1, 3.1], 'ideal2': [1.2, 2.2, 3.2]})
+        ideal_functions = {'train1': {'ideal_function': 'ideal1', 'max_deviation': 0.2, 'max_deviation_factor_sqrt_two': 0.2 * math.sqrt(2)}}
+        db = SqliteOperations(':memory:')
+
+        with patch('builtins.open', return_value=csv_content):
+            points_assigned, points_unassigned = stream_test_data('dummy_path.csv', ideal_data, ideal_functions, chunk_size=2, db=db)
+
+        self.assertEqual((points_assigned, points_unassigned), (3, 2))
+        result = db.get_data_from_table('test')
+        self.assertEqual(len(result), 5)
+        self.assertEqual(result['x'].tolist(), [1.0, 3.0, 1.0, 2.0, 3.0])
+
+
+class TestAssignmentService(unittest.TestCase):
+    def setUp(self):
+        self.ideal_data = pd.DataFrame({'x': [1.0, 2.0, 3.0], 'ideal1': [1.1, 2.1, 3.1], 'ideal2': [1.2, 2.2, 3.2]})
+        self.ideal_functions = {
+            'train1': {'ideal_function': 'ideal1', 'max_deviation': 0.2, 'max_deviation_factor_sqrt_two': 0.2 * math.sqrt(2)},
+            'train2': {'ideal_function': 'ideal2', 'max_deviation': 0.1, 'max_deviation_factor_sqrt_two': 0.1 * math.sqrt(2)},
+        }
+        self.model = AssignmentModel(self.ideal_data, self.ideal_functions, XGridIndex(self.ideal_data['x']))
+
+    def test_assign_keeps_order(self):
+        ideal_function, delta_y, found = self.model.assign(np.array([3.0, 1.0, 2.0, 7.0]), np.array([3.15, 1.0, 5.0, 1.0]))
+        self.assertEqual(ideal_function.tolist(), ['ideal1', 'ideal1', None, None])
+        np.testing.assert_allclose(delta_y[:2], [0.05, 0.1])
+        self.assertEqual(found.tolist(), [True, True, True, False])
+
+    def test_server(self):
+        async def request(port, method, path, payload=None):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            body = json.dumps(payload).encode() if payload is not None else b''
+            writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            response = await reader.read()
+            writer.close()
+            head, _, body = response.partition(b"\r\n\r\n")
+            return int(head.split()[1]), json.loads(body)
+
+        async def run():
+            server = AssignmentServer(self.model)
+            await server.start(port=0)
+            port = server.server.sockets[0].getsockname()[1]
+            try:
+                points = [{'x': float(x), 'y': y} for x, y in zip([3, 1, 2, 1, 3] * 10, [3.1, 2, 2.15, 1.05, 9] * 10)]
+                responses = await asyncio.gather(*[request(port, 'POST', '/assign', point) for point in points])
+                batch = await request(port, 'POST', '/assign', {'x': [3, 1, 4], 'y': [3.1, 2, 1]})
+                errors = [await request(port, 'POST', '/assign', {'x': [1, 2], 'y': [1]}),
+                          await request(port, 'POST', '/assign', {'x': [1, float('nan')], 'y': [1, 2]}),
+                          await request(port, 'GET', '/assign'),
+                          await request(port, 'GET', '/unknown')]
+                health = await request(port, 'GET', '/health')
+            finally:
+                await server.stop()
+            return responses, batch, errors, health
+
+        responses, batch, errors, health = asyncio.run(run())
+        self.assertEqual([response['ideal_function'] for _, response in responses[:5]], ['ideal1', None, 'ideal1', 'ideal1', None])
+        self.assertEqual(batch, (200, {'ideal_function': ['ideal1', None, None], 'delta_y': [unittest.mock.ANY, None, None],
+                                       'x_found': [True, True, False]}))
+        self.assertEqual([status for status, _ in errors], [400, 400, 405, 404])
+        self.assertEqual(health[1]['points'], 53)
+        self.assertLessEqual(health[1]['batches'], 51)
+
+    def test_failed_batch_assigned_one_by_one(self):
+        assign = self.model.assign
+
+        def assign_failing_for_bad_points(x, y):
+            if (y < 0).any():
+                raise ValueError("bad points")
+            return assign(x, y)
+
+        async def run():
+            batcher = MicroBatcher(self.model, max_delay=0.05)
+            task = asyncio.create_task(batcher.run())
+            try:
+                with patch.object(self.model, 'assign', side_effect=assign_failing_for_bad_points):
+                    results = await asyncio.gather(batcher.submit(np.array([3.0]), np.array([3.1])),
+                                                   batcher.submit(np.array([1.0]), np.array([-1.0])),
+                                                   batcher.submit(np.array([1.0, 2.0]), np.array([1.05, 2.15])),
+                                                   return_exceptions=True)
+            finally:
+                task.cancel()
+            return results, batcher
+
+        results, batcher = asyncio.run(run())
+        self.assertEqual(results[0][0].tolist(), ['ideal1'])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2][0].tolist(), ['ideal1', 'ideal1'])
+        self.assertEqual((batcher.batches, batcher.points), (2, 3))
+
+
+class TestIncrementalImport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.csv_file = os.path.join(self.directory.name, 'train.csv')
+        with open(self.csv_file, 'w') as file:
+            file.write("x,y1\n1,2\n2,3\n")
+        self.db = SqliteOperations(':memory:')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_hash_file(self):
+        content_hash, prefix_hash = hash_file(self.csv_file, prefix_size=9)
+        self.assertEqual(content_hash, hashlib.sha256(b"x,y1\n1,2\n2,3\n").hexdigest())
+        self.assertEqual(prefix_hash, hashlib.sha256(b"x,y1\n1,2\n").hexdigest())
+
+    def test_import_unchanged_and_appended(self):
+        self.assertTrue(import_csv_incrementally(self.db, self.csv_file, 'train'))
+        self.assertEqual(self.db.get_row_count('train'), 2)
+
+        with patch('csv_processor.load_csv_data') as mock_load_csv_data:
+            self.assertTrue(import_csv_incrementally(self.db, self.csv_file, 'train'))
+            mock_load_csv_data.assert_not_called()
+
+        with open(self.csv_file, 'a') as file:
+            file.write("3,4\n")
+        with patch('csv_processor.load_csv_data') as mock_load_csv_data:
+            self.assertTrue(import_csv_incrementally(self.db, self.csv_file, 'train'))
+            mock_load_csv_data.assert_not_called()
+        self.assertEqual(self.db.get_data_from_table('train', dtype=float)['y1'].tolist(), [2.0, 3.0, 4.0])
+
+    def test_import_layout_changed(self):
+        self.assertTrue(import_csv_incrementally(self.db, self.csv_file, 'train'))
+        self.assertTrue(import_csv_incrementally(self.db, self.csv_file, 'train', layout='blob'))
+        self.assertEqual(self.db.get_table_layout('train'), 'blob')
+
+        with open(self.csv_file, 'a') as file:
+            file.write("3,4\n")
+        self.assertTrue(import_csv_incrementally(self.db, self.csv_file, 'train', layout='blob'))
+        self.assertEqual(self.db.get_data_from_table('train')['y1'].tolist(), [2.0, 3.0, 4.0])
+
+    def test_import_changed(self):
+        import_csv_incrementally(self.db, self.csv_file, 'train')
+        with open(self.csv_file, 'w') as file:
+            file.write("x,y1\n1,5\n")
+        self.assertTrue(import_csv_incrementally(self.db, self.csv_file, 'train'))
+        self.assertEqual(self.db.get_data_from_table('train', dtype=float)['y1'].tolist(), [5.0])
+
+    def test_import_write_failed(self):
+        self.assertTrue(import_csv_incrementally(self.db, self.csv_file, 'train'))
+        entry = self.db.get_manifest_entry('train')
+
+        with open(self.csv_file, 'a') as file:
+            file.write("3,4\n")
+        with patch.object(SqliteOperations, 'append_to_table', return_value=False):
+            self.assertFalse(import_csv_incrementally(self.db, self.csv_file, 'train'))
+        self.assertEqual(self.db.get_manifest_entry('train'), entry)
+
+        with open(self.csv_file, 'w') as file:
+            file.write("x,y1\n1,5\n")
+        with patch.object(SqliteOperations, 'fill_table', return_value=False):
+            self.assertFalse(import_csv_incrementally(self.db, self.csv_file, 'train'))
+        self.assertEqual(self.db.get_manifest_entry('train'), entry)
+
+        # the next import is not skipped and writes the current content
+        self.assertTrue(import_csv_incrementally(self.db, self.csv_file, 'train'))
+        self.assertEqual(self.db.get_data_from_table('train', dtype=float)['y1'].tolist(), [5.0])
+
 
 class TestFindIdealFunction(unittest.TestCase):
 
@@ -78,6 +347,287 @@ class TestFindIdealFunction(unittest.TestCase):
         result = find_ideal_function('y1', training_data[['x', 'y1']], ideal_data)
         self.assertEqual(result, 'y1')
 
+    def test_squared_deviation_sums(self):
+        training_matrix = np.array([[1.0, 0.0], [2.0, np.nan], [3.0, 1.0]])
+        ideal_matrix = np.array([[1.5, 0.0, 4.0], [2.0, 1.0, np.nan], [2.0, 1.0, 1.0]])
+        result = squared_deviation_sums(training_matrix, ideal_matrix)
+        expected = [[np.nansum((ideal_matrix[:, j] - training_matrix[:, i]) ** 2) for j in range(3)] for i in range(2)]
+        np.testing.assert_allclose(result, expected, atol=1e-12)
+
+    def test_select_ideal_functions(self):
+        training_data = pd.DataFrame({'x': [1.0, 2.0, 3.0], 'a': [1.0, 2.0, 3.0], 'b': [1.2, 2.5, 3.0]})
+        ideal_data = pd.DataFrame({'x': [3.0, 2.0, 1.0], 'y1': [3.1, 2.1, 1.1], 'y2': [3.2, 2.2, 1.2]})
+        result = select_ideal_functions(training_data, ideal_data)
+        self.assertEqual(result['a']['ideal_function'], 'y1')
+        self.assertEqual(result['b']['ideal_function'], 'y2')
+        self.assertAlmostEqual(result['a']['max_deviation'], 0.1)
+        self.assertAlmostEqual(result['b']['max_deviation_factor_sqrt_two'], 0.3 * math.sqrt(2))
+
+    def test_best_ideal_columns_parallel(self):
+        rng = np.random.default_rng(0)
+        ideal_matrix = rng.normal(size=(50, 37))
+        training_matrix = ideal_matrix[:, [3, 20, 36]] + rng.normal(scale=0.1, size=(50, 3))
+        serial_positions, serial_sums = best_ideal_columns(training_matrix, ideal_matrix)
+        parallel_positions, parallel_sums = best_ideal_columns_parallel(training_matrix, ideal_matrix, workers=2)
+        self.assertEqual(serial_positions.tolist(), [3, 20, 36])
+        self.assertEqual(parallel_positions.tolist(), serial_positions.tolist())
+        np.testing.assert_array_equal(parallel_sums, serial_sums)
+
+    def test_pruned_search(self):
+        rng = np.random.default_rng(0)
+        x = np.linspace(-20, 20, 600)[:, np.newaxis]
+        coefficients = rng.uniform(-1, 1, size=(3, 2000))
+        ideal_matrix = coefficients[0] * 10 * np.sin(x * (1 + coefficients[1])) + coefficients[2] * x
+        # duplicated columns have to be resolved to the first one, columns with NaN are never pruned
+        ideal_matrix[:, 1000:1010] = ideal_matrix[:, 5:15]
+        ideal_matrix[17, 7] = np.nan
+        training_matrix = ideal_matrix[:, [7, 12, 1500, 42]] + rng.uniform(-0.5, 0.5, size=(600, 4))
+        training_matrix[3, 3] = np.nan
+
+        summaries = IdealSummaries(ideal_matrix)
+        lower_bounds = summaries.lower_bounds(training_matrix[:, 1])
+        exact_sums = np.nansum((ideal_matrix - training_matrix[:, [1]]) ** 2, axis=0)
+        self.assertTrue(np.all(lower_bounds <= exact_sums * (1 + 1e-12)))
+        self.assertEqual(lower_bounds[7], 0.0)
+        self.assertFalse(summaries.lower_bounds(training_matrix[:, 3]).any())
+
+        positions, sums = best_ideal_columns(training_matrix, ideal_matrix)
+        pruned_positions, pruned_sums, stats = pruned_best_ideal_columns(training_matrix, ideal_matrix, summaries)
+        self.assertEqual(pruned_positions.tolist(), positions.tolist())
+        self.assertEqual(pruned_positions.tolist()[:3], [7, 12, 1500])
+        np.testing.assert_array_equal(pruned_sums, sums)
+        self.assertEqual(stats.candidates, 4 * 2000)
+        self.assertEqual(stats.pruned + stats.abandoned + stats.evaluated, stats.candidates)
+        self.assertGreater(stats.pruned, 2000)
+
+        training_data = pd.DataFrame(np.column_stack([x, training_matrix]), columns=['x', 'y1', 'y2', 'y3', 'y4'])
+        ideal_data = pd.DataFrame(np.column_stack([x, ideal_matrix]), columns=['x', *[f"y{n}" for n in range(1, 2001)]])
+        self.assertEqual(select_ideal_functions(training_data, ideal_data, pruned=True),
+                         select_ideal_functions(training_data, ideal_data))
+
+
+    def test_select_float32(self):
+        rng = np.random.default_rng(0)
+        x = np.linspace(-10, 10, 400)
+        ideal_matrix = rng.normal(size=(400, 300)).cumsum(axis=0) * 1000
+        training_matrix = ideal_matrix[:, [4, 150, 299]] + rng.uniform(-0.5, 0.5, size=(400, 3))
+        names = [f"y{n}" for n in range(1, 301)]
+        training_data = pd.DataFrame(np.column_stack([x, training_matrix]), columns=['x', 'a', 'b', 'c'])
+        ideal_data = pd.DataFrame(np.column_stack([x, ideal_matrix]), columns=['x', *names])
+        compact_ideal_data = ideal_data.astype(np.float32).assign(x=x)
+
+        expected = select_ideal_functions(training_data, ideal_data)
+        for pruned in (False, True):
+            result = select_ideal_functions(training_data.astype(np.float32).assign(x=x), compact_ideal_data, pruned=pruned)
+            self.assertEqual({name: mapping['ideal_function'] for name, mapping in result.items()},
+                             {name: mapping['ideal_function'] for name, mapping in expected.items()})
+            for name, mapping in result.items():
+                self.assertIsInstance(mapping['max_deviation'], np.float64)
+                self.assertAlmostEqual(mapping['max_deviation'], expected[name]['max_deviation'], delta=1e-3)
+
+class TestSortedValueIndex(unittest.TestCase):
+
+    def test_nearest(self):
+        index = SortedValueIndex([[3.0, 1.0, 2.0, 1.0], [0.0, 5.0, np.nan, 4.0]], ['a', 'b', 'c', 'd'])
+        function_ids, deviations = index.nearest([0, 0, 0, 0, 0, 1], [0.0, 1.4, 1.5, 9.0, np.nan, 4.0])
+        # equal values and equally near functions resolve to the first function, like argmin
+        self.assertEqual(function_ids[:4].tolist(), [1, 1, 1, 0])
+        np.testing.assert_allclose(deviations[:4], [1.0, 0.4, 0.5, 6.0])
+        self.assertTrue(np.isnan(deviations[4:]).all())
+
+    def test_nearest_function(self):
+        index = SortedValueIndex(np.arange(12.0).reshape(2, 6), [f"y{number}" for number in range(6)])
+        self.assertEqual(index.nearest_function(1, 8.2), ('y2', np.float64(8.2 - 8.0)))
+        self.assertEqual(len(index), 2)
+        with self.assertRaises(ValueError):
+            SortedValueIndex(np.zeros((2, 3)), ['a', 'b'])
+
+
+class TestXGridIndex(unittest.TestCase):
+
+    def test_uniform_grid_lookup(self):
+        index = XGridIndex(np.round(np.arange(-20, 20.05, 0.1), 1))
+        self.assertIsNotNone(index.step)
+        positions = index.get_positions([-20.0, 0.1 + 0.2, 20.0, 20.5, 0.35])
+        self.assertEqual(positions.tolist(), [0, 203, 400, -1, -1])
+
+    def test_non_finite_lookup(self):
+        x = [np.nan, np.inf, -np.inf, 2.0]
+        for grid in ([1.0, 2.0, 3.0], [1.0, 2.0, 4.0]):
+            index = XGridIndex(grid, interpolate=True)
+            self.assertEqual(index.get_positions(x).tolist(), [-1, -1, -1, 1])
+            aligned, found = index.align(x, np.array(grid) * 10)
+            self.assertEqual(found.tolist(), [False, False, False, True])
+
+    def test_unsorted_grid_lookup(self):
+        index = XGridIndex([3.0, 1.0, 10.0, 2.0])
+        self.assertIsNone(index.step)
+        self.assertEqual(index.get_positions([10.0, 1.0, 2.0000000001, 5.0]).tolist(), [2, 1, 3, -1])
+
+    def test_tolerance(self):
+        index = XGridIndex([1.0, 2.0], tolerance=0.01)
+        self.assertEqual(index.get_positions([1.005, 1.02]).tolist(), [0, -1])
+
+    def test_align_with_interpolation(self):
+        index = XGridIndex([2.0, 1.0, 3.0], interpolate=True)
+        values = np.array([[20.0, 2.0], [10.0, 1.0], [40.0, 3.0]])
+        aligned, found = index.align([1.5, 3.0, 4.0], values)
+        np.testing.assert_allclose(aligned[:2], [[15.0, 1.5], [40.0, 3.0]])
+        self.assertEqual(found.tolist(), [True, True, False])
+        self.assertTrue(np.isnan(aligned[2]).all())
+
+    def test_duplicate_x_values(self):
+        with self.assertRaises(ValueError):
+            XGridIndex([1.0, 2.0, 1.0])
+
+
+class TestColumnCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ColumnCache(os.path.join(self.directory.name, 'ideal'))
+        self.data = pd.DataFrame({'x': [1.0, 2.0, 3.0], 'y1': [4.0, 5.0, 6.0], 'y 2': [7.0, 8.0, 9.0]})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_read_written_columns(self):
+        self.cache.write(self.data, 'fingerprint')
+        result = self.cache.read('fingerprint', ['x', 'y 2'])
+        self.assertEqual(result.columns.tolist(), ['x', 'y 2'])
+        self.assertEqual(result['y 2'].tolist(), [7.0, 8.0, 9.0])
+        self.assertEqual(self.cache.read('fingerprint').shape, (3, 3))
+
+    def test_dtype(self):
+        self.cache.write(self.data, 'fingerprint', np.float32, x_dtype=np.float64)
+        result = self.cache.read('fingerprint', dtype=np.float32)
+        self.assertEqual(result.dtypes.tolist(), [np.float64, np.float32, np.float32])
+        self.assertIsNone(self.cache.read('fingerprint', dtype=np.float64))
+
+    def test_fingerprint_mismatch(self):
+        self.assertIsNone(self.cache.read('fingerprint'))
+        self.cache.write(self.data, 'fingerprint')
+        self.assertIsNone(self.cache.read('other fingerprint'))
+        self.assertIsNone(self.cache.read(None))
+
+    def test_read_ideal_data_cache_miss(self):
+        db = SqliteOperations(':memory:')
+        db.fill_table('ideal', self.data)
+        result = read_ideal_data(db, self.cache, ['x', 'y1'])
+        self.assertEqual(result.columns.tolist(), ['x', 'y1'])
+        self.assertEqual(result['y1'].tolist(), [4.0, 5.0, 6.0])
+        # the miss writes the cache, which is used by the next read
+        self.assertEqual(self.cache.read(db.get_fingerprint(['ideal'])).shape, (3, 3))
+
+
+class TestStageTimer(unittest.TestCase):
+    def setUp(self):
+        self.timer = StageTimer()
+
+    def test_stage_summary(self):
+        with self.timer.stage('assign', rows=100):
+            pass
+        with self.timer.stage('assign') as stage:
+            stage.rows = 50
+        with self.timer.stage('select'):
+            pass
+        summary = self.timer.summary()
+        self.assertEqual([stage['stage'] for stage in summary], ['assign', 'select'])
+        self.assertEqual((summary[0]['calls'], summary[0]['rows']), (2, 150))
+        self.assertIsNone(summary[1]['throughput'])
+        self.assertIn('assign', self.timer.format_summary())
+
+    def test_timed_decorator(self):
+        @self.timer.timed('plot')
+        def plot(value):
+            return value * 2
+
+        self.assertEqual(plot(2), 4)
+        self.assertEqual(len(self.timer.records), 1)
+        self.assertGreaterEqual(self.timer.records[0].wall_time, 0)
+
+    def test_chrome_trace(self):
+        with self.timer.stage('load', rows=10):
+            pass
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.json')
+            self.timer.write_chrome_trace(path)
+            with open(path) as file:
+                events = json.load(file)['traceEvents']
+        self.assertEqual(events[0]['name'], 'load')
+        self.assertEqual(events[0]['ph'], 'X')
+        self.assertEqual(events[0]['args']['rows'], 10)
+
+    def test_profile_written_after_serve(self):
+        package = os.path.dirname(os.path.abspath(__file__))
+        with tempfile.TemporaryDirectory() as directory:
+            trace = os.path.join(directory, 'trace.json')
+            process = subprocess.Popen([sys.executable, 'csv_processor.py', '--serve', '-csv', os.path.join(package, 'Dataset2'),
+                                        '-db', os.path.join(directory, 'service.db'), '--unix-socket', os.path.join(directory, 'socket'),
+                                        '--profile', '--profile-trace', trace], cwd=package, stderr=subprocess.PIPE, text=True)
+            try:
+                for line in process.stderr:
+                    if 'Serving assignments' in line:
+                        break
+                process.send_signal(signal.SIGINT)
+                output = process.communicate(timeout=60)[1]
+            finally:
+                process.kill()
+            with open(trace) as file:
+                events = json.load(file)['traceEvents']
+        self.assertEqual(process.returncode, 0)
+        self.assertIn('select', [event['name'] for event in events])
+        self.assertIn('Stage timings', output)
+
+
+class TestDownsampling(unittest.TestCase):
+
+    def test_downsample_line_keeps_peaks(self):
+        y = np.sin(np.linspace(0, 100, 100000))
+        y[12345] = 50
+        y[54321] = -50
+        selected = downsample_line(y, 500)
+        self.assertLessEqual(len(selected), 4 * 500)
+        self.assertIn(12345, selected)
+        self.assertIn(54321, selected)
+        self.assertEqual((selected[0], selected[-1]), (0, len(y) - 1))
+        self.assertTrue((np.diff(selected) > 0).all())
+
+    def test_downsample_line_with_nan(self):
+        y = np.zeros(100)
+        y[50] = 10
+        y[10] = np.nan
+        self.assertIn(50, downsample_line(y, 1))
+        # a bucket of NaN values only keeps its first and last point
+        y[:] = np.nan
+        self.assertEqual(downsample_line(y, 1).tolist(), [0, 99])
+
+    def test_downsample_small_line(self):
+        self.assertEqual(downsample_line(np.arange(10.0), 500).tolist(), list(range(10)))
+
+    def test_bin_scatter(self):
+        x = np.array([0.0, 0.1, 0.2, 10.0])
+        y = np.array([0.0, 0.1, 0.2, 10.0])
+        binned_x, binned_y, counts = bin_scatter(x, y, 10, 10)
+        self.assertEqual(len(binned_x), 2)
+        self.assertAlmostEqual(binned_x[0], 0.5)
+        self.assertAlmostEqual(binned_y[1], 9.5)
+        self.assertEqual(counts.tolist(), [3, 1])
+
+    def test_binned_marker_sizes(self):
+        sizes = binned_marker_sizes(np.array([1, 1000]))
+        self.assertEqual(sizes[0], plt.rcParams['lines.markersize'] ** 2)
+        self.assertAlmostEqual(sizes[1], sizes[0] * (1 + np.log2(1000)))
+
+    def test_binned_scatter_shows_counts(self):
+        x = np.concatenate([np.zeros(1000), np.arange(15.0, 100.0, 10.0)])
+        data = pd.DataFrame({'x': x, 'y_point': x})
+        figure = Figure()
+        draw_xy_plot(figure, data, "Test Plot", 40, 40, styles={'y_point': {'type': 'scatter', 'color': 'green'}})
+        sizes = figure.axes[0].collections[0].get_sizes()
+        self.assertEqual(len(sizes), 10)
+        self.assertEqual(sizes.min(), plt.rcParams['lines.markersize'] ** 2)
+        self.assertAlmostEqual(sizes.max(), sizes.min() * (1 + np.log2(1000)))
+
 
 class TestPlotManager(unittest.TestCase):
     def setUp(self):
@@ -99,6 +649,31 @@ class TestPlotManager(unittest.TestCase):
         self.plot_manager.load_xy_as_line_plot(data, "Test Plot")
         self.assertEqual(self.plot_manager.number_of_plots, 1)
 
+    def test_export_plots(self):
+        data = pd.DataFrame({'x': [1, 2, 3, 4, 5], 'y': [2, 3, 4, 5, 6], 'y_point': [2, np.nan, 4, np.nan, 6]})
+        styles = {'y_point': {'type': 'scatter', 'color': 'green'}}
+        with tempfile.TemporaryDirectory() as export_dir:
+            for export_format in EXPORT_FORMATS:
+                plot_manager = PlotManager(export_dir=export_dir, export_format=export_format, export_workers=2)
+                plot_manager.load_xy_as_line_plot(data, "Test Plot", styles=styles)
+                plot_manager.load_xy_as_line_plot(data, "Test Plot", position=FULL_SCREEN, text="Info")
+                plot_manager.show_plots()
+                executor = plot_manager.executor
+                plot_manager.load_xy_as_line_plot(data, "Other Plot")
+                # the pool is kept over several calls of show_plots
+                self.assertIs(plot_manager.executor, executor)
+                exported_files = plot_manager.shutdown()
+
+                self.assertEqual([os.path.basename(path) for path in exported_files],
+                                 [f"Test_Plot.{export_format}", f"Test_Plot_2.{export_format}", f"Other_Plot.{export_format}"])
+                self.assertTrue(all(os.path.getsize(path) > 0 for path in exported_files))
+                self.assertIsNone(plot_manager.executor)
+            self.assertEqual(len(os.listdir(export_dir)), 6)
+
+    def test_export_format_unsupported(self):
+        with self.assertRaises(ValueError):
+            PlotManager(export_dir=tempfile.gettempdir(), export_format='bmp')
+
     def tearDown(self):
         # Clean up resources
         self.plot_manager.delete_plots()
@@ -117,6 +692,76 @@ class TestSqliteOperations(unittest.TestCase):
         self.assertIsNotNone(df)
         self.assertEqual(len(df), 3)
 
+    def test_get_data_from_table_projection(self):
+        self.db_ops.fill_table('wide_table', pd.DataFrame({'x': [1, 2, 3, 4], 'y1': [4, 5, 6, 7], 'y2': [8, 9, 10, 11]}))
+        df = self.db_ops.get_data_from_table('wide_table', columns=['x', 'y2'], x_range=(2, 3), dtype=np.float32)
+        self.assertEqual(df.columns.tolist(), ['x', 'y2'])
+        self.assertEqual(df['y2'].tolist(), [9.0, 10.0])
+        self.assertEqual(df['y2'].dtype, np.float32)
+        df = self.db_ops.get_data_from_table('wide_table', columns=['x'], where={'y1': (6, None)}, dtype=float)
+        self.assertEqual(df['x'].tolist(), [3.0, 4.0])
+        df = self.db_ops.get_data_from_table('wide_table', columns=['x'], where={'y1': 5, 'y2': (None, 10)})
+        self.assertEqual(df['x'].tolist(), [2.0])
+        # the values are bound as parameters, not inserted into the statement
+        self.assertTrue(self.db_ops.get_data_from_table('wide_table', where={'y1': "0 OR 1 = 1"}).empty)
+        self.assertTrue(self.db_ops.table_exists('wide_table'))
+
+    def test_get_data_from_table_inferred_dtypes(self):
+        self.db_ops.fill_table('mixed_table', pd.DataFrame({'x': [1.0, 2.0], 'y': [4, None], 'name': ['y1', None]}))
+        df = self.db_ops.get_data_from_table('mixed_table')
+        self.assertEqual(df['x'].dtype, np.float64)
+        self.assertEqual(df['y'].dtype, np.float64)
+        self.assertTrue(np.isnan(df['y'][1]))
+        self.assertEqual(df['name'][0], 'y1')
+        self.assertEqual(self.db_ops.get_data_from_table('test_table').dtypes.tolist(), [np.float64, np.float64])
+
+    def test_get_data_from_table_x_dtype(self):
+        self.db_ops.fill_table('compact_table', pd.DataFrame({'x': [0.1, 0.3], 'y1': [0.1, 0.3]}))
+        df = self.db_ops.get_data_from_table('compact_table', dtype=np.float32, x_dtype=np.float64)
+        self.assertEqual(df.dtypes.tolist(), [np.float64, np.float32])
+        self.assertEqual(df['x'].tolist(), [0.1, 0.3])
+        self.assertEqual(df['y1'].tolist(), np.array([0.1, 0.3], dtype=np.float32).tolist())
+
+    def test_fill_table_layouts(self):
+        data = pd.DataFrame({'x': [1.0, 2.0, 3.0, 2.0], 'y1': [4.0, np.nan, 6.0, 7.0], 'y 2': [8.0, 9.0, 10.0, 11.0]})
+        for layout in ('long', 'blob'):
+            self.assertTrue(self.db_ops.fill_table('layout_table', data, layout=layout))
+            self.assertEqual(self.db_ops.get_table_layout('layout_table'), layout)
+            self.assertEqual(self.db_ops.get_row_count('layout_table'), 4)
+            pd.testing.assert_frame_equal(self.db_ops.get_data_from_table('layout_table'), data)
+            df = self.db_ops.get_data_from_table('layout_table', columns=['y 2', 'x'], x_range=(2, 3), dtype=np.float32, x_dtype=np.float64)
+            self.assertEqual(df.columns.tolist(), ['y 2', 'x'])
+            self.assertEqual(df['y 2'].tolist(), [9.0, 10.0, 11.0])
+            self.assertEqual(df.dtypes.tolist(), [np.float32, np.float64])
+            self.assertIsNone(self.db_ops.get_data_from_table('layout_table', columns=['y3']))
+            self.assertIsNone(self.db_ops.get_data_from_table('layout_table', where={'y1': (4, None)}))
+
+        self.db_ops.append_to_table('layout_table', data)
+        self.assertEqual(self.db_ops.get_row_count('layout_table'), 4)
+        self.assertTrue(self.db_ops.fill_table('layout_table', data))
+        self.assertEqual(self.db_ops.get_table_layout('layout_table'), 'wide')
+        self.assertFalse(self.db_ops.fill_table('layout_table', data, layout='diagonal'))
+
+    def test_x_index_created(self):
+        with self.db_ops.engine.connect() as conn:
+            indexes = conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'").scalars().all()
+        self.assertIn('ix_test_table_x', indexes)
+
+    def test_selection_cache(self):
+        fingerprint = self.db_ops.get_fingerprint(['test_table'], 1e-9)
+        self.assertIsNotNone(fingerprint)
+        self.assertIsNone(self.db_ops.get_cached_selection(fingerprint))
+
+        ideal_functions = {'y1': {'ideal_function': 'y42', 'max_deviation': np.float64(0.5), 'max_deviation_factor_sqrt_two': 0.5 * math.sqrt(2)}}
+        self.db_ops.store_cached_selection(fingerprint, ideal_functions)
+        self.assertEqual(self.db_ops.get_cached_selection(fingerprint), ideal_functions)
+        self.assertEqual((self.db_ops.cache_hits, self.db_ops.cache_misses), (1, 1))
+
+        self.assertNotEqual(self.db_ops.get_fingerprint(['test_table'], 1e-6), fingerprint)
+        self.db_ops.fill_table('test_table', pd.DataFrame({'x': [1], 'y': [2]}))
+        self.assertNotEqual(self.db_ops.get_fingerprint(['test_table'], 1e-9), fingerprint)
+        self.assertIsNone(self.db_ops.get_fingerprint(['missing_table']))
+
     def test_create_xy_table(self):
         self.db_ops.create_xy_table('new_table', ['x', 'y'])
         self.assertTrue(inspect(self.db_ops.engine).has_table('new_table'))
@@ -131,10 +776,107 @@ class TestSqliteOperations(unittest.TestCase):
         count = self.db_ops.get_row_count('test_table')
         self.assertEqual(count, 3)  # Expecting 3 since the table is dropped and recreated before fill
 
+    def test_fill_table_replaces_columns(self):
+        self.db_ops.get_data_from_table('test_table')
+        self.db_ops.fill_table('test_table', pd.DataFrame({'x': [1.0, 2.0], 'Delta Y': [0.5, np.nan], 'No. of ideal func': ['y1', None]}))
+        df = self.db_ops.get_data_from_table('test_table')
+        self.assertEqual(df.columns.tolist(), ['x', 'Delta Y', 'No. of ideal func'])
+        self.assertEqual(df['No. of ideal func'][0], 'y1')
+        self.assertTrue(pd.isna(df['No. of ideal func'][1]))
+
+    def test_fill_table_with_pragmas(self):
+        with self.db_ops.engine.connect() as conn:
+            synchronous = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+        self.db_ops.fill_table('bulk_table', pd.DataFrame({'x': range(1000), 'y': range(1000)}), BULK_LOAD_PRAGMAS)
+        self.assertEqual(self.db_ops.get_row_count('bulk_table'), 1000)
+        with self.db_ops.engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql("PRAGMA synchronous").scalar(), synchronous)
+
+    def test_append_to_table(self):
+        self.assertTrue(self.db_ops.append_to_table('test_table', pd.DataFrame({'x': [7, 8], 'y': [10, 11]})))
+        self.assertTrue(self.db_ops.append_to_table('appended_table', pd.DataFrame({'x': [1], 'y': [2]})))
+        self.assertFalse(self.db_ops.append_to_table('test_table', pd.DataFrame({'z': [1]})))
+        self.assertEqual(self.db_ops.get_row_count('test_table'), 5)
+        self.assertEqual(self.db_ops.get_row_count('appended_table'), 1)
+
     def test_drop_table(self):
         self.db_ops.drop_table('test_table')
         self.assertFalse(inspect(self.db_ops.engine).has_table('test_table'))
 
+    def test_transaction(self):
+        with self.db_ops.transaction():
+            self.assertTrue(self.db_ops.fill_table('first_table', pd.DataFrame({'x': [1.0]})))
+            self.assertFalse(self.db_ops.fill_table('failed_table', pd.DataFrame({'x': [1.0]}), layout='diagonal'))
+            self.db_ops.append_to_table('test_table', pd.DataFrame({'x': [7], 'y': [10]}))
+        self.assertTrue(self.db_ops.table_exists('first_table'))
+        self.assertFalse(self.db_ops.table_exists('failed_table'))
+        self.assertEqual(self.db_ops.get_row_count('test_table'), 4)
+
+        with self.assertRaises(RuntimeError):
+            with self.db_ops.transaction():
+                self.db_ops.drop_table('first_table')
+                self.db_ops.append_to_table('test_table', pd.DataFrame({'x': [8], 'y': [11]}))
+                raise RuntimeError('abort')
+        self.assertTrue(self.db_ops.table_exists('first_table'))
+        self.assertEqual(self.db_ops.get_row_count('test_table'), 4)
+
+    def test_failed_fill_with_bulk_load_pragmas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db = SqliteOperations(os.path.join(directory, 'bulk.sqlite3'))
+            with db.transaction(BULK_LOAD_PRAGMAS):
+                self.assertTrue(db.fill_table('kept_table', pd.DataFrame({'x': [1.0, 2.0]})))
+                # the table is dropped before the unsupported values fail, the savepoint has to restore it
+                self.assertFalse(db.fill_table('kept_table', pd.DataFrame({'x': [{'not': 'a number'}]})))
+            self.assertEqual(db.get_data_from_table('kept_table')['x'].tolist(), [1.0, 2.0])
+            self.assertEqual(db.execute("PRAGMA journal_mode").fetchone()[0], 'delete')
+
+            # without a journal the savepoints could not roll back, so it is kept in memory
+            with db.transaction({'journal_mode': 'OFF'}):
+                self.assertEqual(db.execute("PRAGMA journal_mode").fetchone()[0], 'memory')
+                self.assertFalse(db.fill_table('kept_table', pd.DataFrame({'x': [{'not': 'a number'}]})))
+            self.assertEqual(db.get_row_count('kept_table'), 2)
+            db.close()
+
+    def test_connection_per_thread(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'threads.sqlite3')
+            db = SqliteOperations(db_path)
+            self.assertIs(db.connection, db.connection)
+            self.assertEqual(db.get_table_columns('shared_table'), [])
+            self.assertFalse(db.table_exists('shared_table'))
+
+            # the schema cache notices tables created through another connection
+            other = SqliteOperations(db_path)
+            other.fill_table('shared_table', pd.DataFrame({'x': [1.0, 2.0], 'y': [3.0, 4.0]}))
+            self.assertTrue(db.table_exists('shared_table'))
+            self.assertEqual(db.get_table_columns('shared_table'), ['x', 'y'])
+
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                results = list(executor.map(lambda _: (id(db.connection), db.get_row_count('shared_table')), range(2)))
+            self.assertNotIn(id(db.connection), [connection for connection, _ in results])
+            self.assertEqual([count for _, count in results], [2, 2])
+            db.close()
+            other.close()
+
+    def test_database_writer(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db = SqliteOperations(os.path.join(directory, 'writer.sqlite3'))
+            writer = DatabaseWriter(db)
+            writer.start()
+            writer.fill_table('written_table', pd.DataFrame({'x': [1.0, 2.0], 'y': [3.0, 4.0]}))
+            writer.append_to_table('written_table', pd.DataFrame({'x': [3.0], 'y': [5.0]}))
+            writer.fill_table('failed_table', pd.DataFrame({'x': [1.0]}), layout='diagonal')
+            writer.submit(lambda db: db.drop_table('missing_table'))
+            row_count = writer.submit(SqliteOperations.get_row_count, 'written_table')
+            failed_write = writer.submit(lambda db: db.execute("INSERT INTO missing_table VALUES (1)"))
+            self.assertEqual(row_count.result(), 3)
+            with self.assertRaises(Exception):
+                failed_write.result()
+            self.assertEqual(writer.close(), 2)
+            self.assertFalse(writer.is_alive())
+            self.assertEqual(db.get_row_count('written_table'), 3)
+            db.close()
+
 
 class TestLogger(unittest.TestCase):
     def setUp(self):
@@ -143,6 +885,215 @@ class TestLogger(unittest.TestCase):
     def test_logger_level(self):
         self.assertEqual(self.logger.logger.level, logging.DEBUG)
 
+    def test_parse_logging_level(self):
+        self.assertEqual(parse_logging_level('debug'), logging.DEBUG)
+        self.assertEqual(parse_logging_level(' WARNING '), logging.WARNING)
+        self.assertEqual(parse_logging_level('15'), 15)
+        with self.assertRaises(LoggingLevelError):
+            parse_logging_level('verbose')
+
+    def test_log_level_option(self):
+        parser = argparse.ArgumentParser()
+        parser.add_argument('--log-level', type=logging_level_argument)
+        self.assertEqual(parser.parse_args(['--log-level', 'warning']).log_level, logging.WARNING)
+        with patch('sys.stderr', new_callable=StringIO) as stderr, self.assertRaises(SystemExit) as exit_status:
+            parser.parse_args(['--log-level', 'verbose'])
+        self.assertEqual(exit_status.exception.code, 2)
+        self.assertIn("Unknown logging level: VERBOSE", stderr.getvalue())
+
+    def test_formatters_are_reused(self):
+        formatter = ColorFormatter()
+        formatters = dict(formatter.formatters)
+        record = logging.LogRecord('TestLogger', logging.INFO, __file__, 1, 'message %s', ('text',), None)
+        self.assertIn('message text', formatter.format(record))
+        self.assertIs(formatter.formatters[logging.INFO], formatters[logging.INFO])
+
+    def test_asynchronous_handler(self):
+        logger = Logger("TestAsyncLogger", logging.INFO, asynchronous=True)
+        stream = StringIO()
+        logger.listener.handlers[0].setStream(stream)
+        logger.logger.info("queued message")
+        logger.logger.debug("filtered message")
+        logger.stop_listener()
+        self.assertIn("queued message", stream.getvalue())
+        self.assertNotIn("filtered message", stream.getvalue())
+
+    def test_set_level(self):
+        self.logger.set_level('ERROR')
+        self.assertEqual(self.logger.logger.level, logging.ERROR)
+        self.assertEqual(self.logger.handler.level, logging.ERROR)
+
+
+
+class TestSyntheticDataset(unittest.TestCase):
+
+    def test_generated_functions_are_selected(self):
+        with tempfile.TemporaryDirectory() as directory:
+            mapping = generate_dataset(directory, rows=200, training_functions=3, ideal_functions=40, test_points=50,
+                                       noise=0.1, off_grid_fraction=0.2)
+            training_data = load_csv_data(os.path.join(directory, 'train.csv'))
+            ideal_data = load_csv_data(os.path.join(directory, 'ideal.csv'))
+            test_data = load_csv_data(os.path.join(directory, 'test.csv'))
+
+        ideal_functions = select_ideal_functions(training_data, ideal_data)
+        self.assertEqual({name: value['ideal_function'] for name, value in ideal_functions.items()}, mapping)
+        self.assertEqual(len(test_data), 50)
+
+    def test_main_in_memory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            generate_dataset(directory, rows=100, training_functions=2, ideal_functions=20, test_points=30, noise=0.1)
+            tables = {}
+            for name, options in (('database', {}), ('in_memory', {'in_memory': True, 'column_cache': True})):
+                db_path = os.path.join(directory, f"{name}.sqlite3")
+                main(directory, db_path, overwrite=True, **options)
+                db = SqliteOperations(db_path)
+                tables[name] = {table_name: db.get_data_from_table(table_name) for table_name in ('train', 'ideal', 'test')}
+                db.close()
+            for table_name, data in tables['database'].items():
+                pd.testing.assert_frame_equal(tables['in_memory'][table_name], data)
+
+            # the selection of the in-memory run is cached for the next run over its database
+            db = SqliteOperations(os.path.join(directory, 'in_memory.sqlite3'))
+            self.assertIsNotNone(db.get_cached_selection(selection_fingerprint(db, DEFAULT_X_TOLERANCE, False)))
+            db.close()
+
+            main(directory, os.path.join(directory, 'none.sqlite3'), no_db=True)
+            self.assertFalse(os.path.exists(os.path.join(directory, 'none.sqlite3')))
+
+    def test_main_in_memory_compact_dtype(self):
+        with tempfile.TemporaryDirectory() as directory:
+            generate_dataset(directory, rows=100, training_functions=2, ideal_functions=20, test_points=30, noise=0.1)
+            parsed = {}
+            def read_and_keep(*args, **kwargs):
+                for table_name, data in read_csv_files(*args, **kwargs):
+                    parsed[table_name] = weakref.ref(data)
+                    yield table_name, data
+
+            checked = []
+            def check(db, ideal_functions, test_data, x_tolerance, interpolate, training_data, ideal_data):
+                # only the chosen float64 ideal functions are left for the check
+                self.assertIsNone(parsed['ideal']())
+                self.assertEqual(ideal_data.columns.tolist(), chosen_ideal_columns(ideal_functions))
+                self.assertEqual(ideal_data.dtypes.tolist(), [np.float64] * ideal_data.shape[1])
+                checked.append(ideal_functions)
+
+            with patch('csv_processor.read_csv_files', read_and_keep), patch('csv_processor.find_dtype_changes', check):
+                main(directory, os.path.join(directory, 'none.sqlite3'), no_db=True, dtype='float32')
+            self.assertEqual(len(checked), 1)
+
+    def test_main_in_memory_failed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            generate_dataset(directory, rows=100, training_functions=2, ideal_functions=20, test_points=30, noise=0.1)
+            db_path = os.path.join(directory, 'failed.sqlite3')
+            with patch('csv_processor.select_ideal_functions_in_memory', side_effect=RuntimeError('selection failed')):
+                with self.assertRaises(RuntimeError):
+                    main(directory, db_path, overwrite=True, in_memory=True)
+
+            # the writes queued before the error are written and the writer is joined
+            self.assertNotIn('DatabaseWriter', [thread.name for thread in threading.enumerate()])
+            db = SqliteOperations(db_path)
+            self.assertEqual(db.get_row_count('train'), 100)
+            db.close()
+
+    def test_main_in_memory_persist_failed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            old_path, new_path = os.path.join(directory, 'old'), os.path.join(directory, 'new')
+            generate_dataset(old_path, rows=100, training_functions=2, ideal_functions=20, test_points=30, noise=0.1)
+            generate_dataset(new_path, rows=50, training_functions=2, ideal_functions=20, test_points=30, noise=0.1, seed=1)
+            db_path = os.path.join(directory, 'failed.sqlite3')
+            main(old_path, db_path, overwrite=True)
+            db = SqliteOperations(db_path)
+            selection = db.get_cached_selection(selection_fingerprint(db, DEFAULT_X_TOLERANCE, False))
+            db.close()
+
+            fill_table = SqliteOperations.fill_table
+            def fail_ideal(db, table_name, *args, **kwargs):
+                return False if table_name == 'ideal' else fill_table(db, table_name, *args, **kwargs)
+
+            with patch.object(SqliteOperations, 'fill_table', fail_ideal):
+                main(new_path, db_path, overwrite=True, in_memory=True)
+
+            # the new train table is rolled back with the failed ideal table and the selection of the new data is not cached
+            db = SqliteOperations(db_path)
+            self.assertEqual(db.get_row_count('train'), 100)
+            self.assertEqual(db.get_row_count('ideal'), 100)
+            self.assertEqual(db.get_cached_selection(selection_fingerprint(db, DEFAULT_X_TOLERANCE, False)), selection)
+            db.close()
+
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.mappings = {}
+        for name in ('first', 'second'):
+            self.mappings[name] = generate_dataset(os.path.join(self.directory.name, 'nightly', name), rows=100, training_functions=2,
+                                                   ideal_functions=20, test_points=30, noise=0.1, seed=len(name))
+        os.makedirs(os.path.join(self.directory.name, 'nightly', 'broken'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_find_datasets(self):
+        manifest = os.path.join(self.directory.name, 'manifest.txt')
+        os.makedirs(os.path.join(self.directory.name, 'other', 'first'))
+        with open(manifest, 'w') as file:
+            file.write("# nightly datasets\nother/first\nnightly/second\n")
+
+        datasets = find_datasets([os.path.join(self.directory.name, 'nightly', '*')], manifest)
+        self.assertEqual(list(datasets), ['broken', 'first', 'second', 'first_2'])
+        self.assertEqual(datasets['first_2'], os.path.join(self.directory.name, 'other', 'first'))
+
+    def test_run_batch(self):
+        db_path = os.path.join(self.directory.name, 'batch.sqlite3')
+        report = run_batch(find_datasets([os.path.join(self.directory.name, 'nightly', '*')]), db_path, workers=2)
+
+        self.assertEqual([(row['dataset'], row['status']) for row in report], [('broken', 'failed'), ('first', 'ok'), ('second', 'ok')])
+        self.assertIn('FileNotFoundError', report[0]['error'])
+        self.assertEqual(report[1]['points_assigned'] + report[1]['points_unassigned'], 30)
+        self.assertGreaterEqual(report[1]['write_s'], 0)
+
+        db = SqliteOperations(db_path)
+        for dataset in ('first', 'second'):
+            selected = {name: value['ideal_function'] for name, value in json.loads(db.get_data_from_table(REPORT_TABLE, where={'dataset': dataset})['ideal_functions'][0]).items()}
+            self.assertEqual(selected, self.mappings[dataset])
+            self.assertEqual(len(db.get_data_from_table(f"{dataset}_test")), 30)
+        self.assertFalse(db.table_exists('broken_test'))
+
+    def test_run_batch_write_failed(self):
+        # the database cannot be opened, so every write fails and the writer still takes all datasets of the batch
+        db_path = os.path.join(self.directory.name, 'missing', 'batch.sqlite3')
+        with patch('batch_runner.MAX_PENDING_WRITES', 1):
+            report = run_batch(find_datasets([os.path.join(self.directory.name, 'nightly', '*')]), db_path, workers=2)
+
+        self.assertEqual([row['status'] for row in report], ['failed', 'failed', 'failed'])
+        self.assertTrue(report[1]['error'].startswith('Writing failed'))
+        self.assertIsNone(report[1]['write_s'])
+
+
+class TestImportTime(unittest.TestCase):
+    # import time of csv_processor in microseconds, without the numpy and pandas imports it needs anyway
+    CORE_IMPORT_BUDGET_US = 100000
+
+    def import_times(self, module):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+        times = {}
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:') and '|' in line:
+                _, cumulative, name = line[len('import time:'):].split('|')
+                if cumulative.strip().isdigit():
+                    times.setdefault(name.strip(), int(cumulative))
+        return times
+
+    def test_no_heavy_imports(self):
+        times = self.import_times('csv_processor')
+        for module in ('matplotlib', 'sqlalchemy', 'unittest', 'visualize_functions', 'sqlite_helper'):
+            self.assertNotIn(module, times)
+
+    def test_core_import_budget(self):
+        times = self.import_times('csv_processor')
+        own_time = times['csv_processor'] - times.get('numpy', 0) - times.get('pandas', 0)
+        self.assertLess(own_time, self.CORE_IMPORT_BUDGET_US)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,93 @@
+import numpy as np
+
+
+class SortedValueIndex:
+    """
+    Index over the values of many candidate functions that stores, for every row of a table, the values sorted
+    together with the positions of their functions, so the function nearest to a y value is found with a binary
+    search in O(log k) instead of comparing all k functions.
+
+    Ties are resolved like an argmin over all functions: of equally near functions the first one wins, and
+    rows with a NaN value have no nearest function.
+
+    :param values: Array of shape (rows, functions) in the row order of the table, float32 values are kept as float32
+                   and the deviations are calculated in float64.
+    :param function_names: Names of the functions, in column order.
+    :raises ValueError: If the values and names do not match or there are no functions.
+    """
+
+    def __init__(self, values, function_names):
+        values = np.asarray(values)
+        if values.dtype != np.float32:
+            values = values.astype(float, copy=False)
+        if values.ndim != 2 or values.shape[1] != len(function_names) or values.shape[1] == 0:
+            raise ValueError("Values must have one column per function name.")
+
+        self.function_names = np.array(function_names, dtype=object)
+        # a stable sort keeps equal values in function order and puts NaN values last
+        self.function_ids = np.argsort(values, axis=1, kind='stable')
+        self.sorted_values = np.take_along_axis(values, self.function_ids, axis=1)
+        self.incomplete = np.isnan(self.sorted_values[:, -1])
+
+    def __len__(self):
+        return self.sorted_values.shape[0]
+
+    def _bisect_left(self, rows, y):
+        """
+        Get the first position in the sorted values of every row whose value is not below the y value.
+
+        :param rows: Array of rows.
+        :param y: Array of y values, one per row.
+        :return: Array of positions between 0 and the number of functions.
+        """
+        number_of_functions = self.sorted_values.shape[1]
+        lower = np.zeros(len(rows), dtype=np.intp)
+        upper = np.full(len(rows), number_of_functions, dtype=np.intp)
+        for _ in range(number_of_functions.bit_length()):
+            middle = (lower + upper) // 2
+            below = self.sorted_values[rows, np.minimum(middle, number_of_functions - 1)] < y
+            active = lower < upper
+            lower = np.where(active & below, middle + 1, lower)
+            upper = np.where(active & ~below, middle, upper)
+        return lower
+
+    def nearest(self, rows, y):
+        """
+        Find the nearest function for a batch of points.
+
+        :param rows: Array of the rows of the points in the table.
+        :param y: Array of the y values of the points.
+        :return: Tuple of an array of function positions and an array of absolute deviations, NaN where there is no nearest function.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        y = np.asarray(y, dtype=float)
+        number_of_functions = self.sorted_values.shape[1]
+
+        upper = self._bisect_left(rows, y)
+        lower = upper - 1
+        upper_values = self.sorted_values[rows, np.minimum(upper, number_of_functions - 1)]
+        lower_values = self.sorted_values[rows, np.maximum(lower, 0)]
+        upper_deviations = np.where(upper < number_of_functions, np.abs(upper_values - y), np.inf)
+        lower_deviations = np.where(lower >= 0, np.abs(lower_values - y), np.inf)
+
+        # the first of equal values belongs to the first of their functions
+        upper_ids = self.function_ids[rows, np.minimum(upper, number_of_functions - 1)]
+        lower_ids = self.function_ids[rows, self._bisect_left(rows, lower_values)]
+
+        use_lower = (lower_deviations < upper_deviations) | ((lower_deviations == upper_deviations) & (lower_ids < upper_ids))
+        function_ids = np.where(use_lower, lower_ids, upper_ids)
+        deviations = np.where(use_lower, lower_deviations, upper_deviations)
+        deviations[self.incomplete[rows] | np.isnan(y)] = np.nan
+
+        return function_ids, deviations
+
+    def nearest_function(self, row, y):
+        """
+        Find the nearest function for a single point.
+
+        :param row: Row of the point in the table.
+        :param y: y value of the point.
+        :return: Tuple of the name of the nearest function and its absolute deviation, the deviation is NaN if there is none.
+        """
+        function_ids, deviations = self.nearest([row], [y])
+        return self.function_names[function_ids[0]], deviations[0]
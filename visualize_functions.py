@@ -1,7 +1,15 @@
+import os
+import re
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from fancy_logging import logger
-import pandas as pd
+from profiling import stage_timer
+import numpy as np
 from matplotlib import pyplot as plt
 from matplotlib import style
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 FULL_SCREEN = {
     'left': 0,
@@ -10,17 +18,179 @@ FULL_SCREEN = {
     'height': 1
 }
 
+# size of the bins in pixels that the points of large scatter plots are combined into
+SCATTER_BIN_SIZE = 4
+
+# file formats figures can be exported to, and the resolution used to convert their pixel size to inches
+EXPORT_FORMATS = ('png', 'svg')
+EXPORT_DPI = 100
+
+
+def downsample_line(y, buckets):
+    """
+    Select the points of a line that keep its shape when it is drawn with the given number of pixels.
+
+    The points are split into one bucket per pixel, of every bucket the first, last, minimum and maximum point
+    is kept, so the peaks stay visible while at most four points per pixel are drawn.
+
+    :param y: Array of the y values of the line, in drawing order.
+    :param buckets: Number of buckets, usually the width of the plot in pixels.
+    :return: Sorted array of the indices of the selected points.
+    """
+    n = len(y)
+    buckets = max(1, int(buckets))
+    if n <= 4 * buckets:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, buckets + 1).astype(np.intp)
+    bucket_ids = np.repeat(np.arange(buckets), np.diff(edges))
+    # within every bucket the points are sorted by y, NaN values last, so the maximum is the last value before them
+    nan = np.isnan(y)
+    order = np.lexsort((np.where(nan, np.inf, y), bucket_ids))
+    values = np.add.reduceat(~nan, edges[:-1])
+    minima = order[edges[:-1]]
+    maxima = order[edges[:-1] + np.maximum(values, 1) - 1]
+
+    return np.unique(np.concatenate([edges[:-1], edges[1:] - 1, minima, maxima]))
+
+
+def bin_scatter(x, y, bins_x, bins_y):
+    """
+    Combine the points of a scatter plot into bins, every occupied bin is drawn as one point in its center.
+
+    :param x: Array of the x values of the points.
+    :param y: Array of the y values of the points.
+    :param bins_x: Number of bins along x.
+    :param bins_y: Number of bins along y.
+    :return: Tuple of the x and y values of the occupied bin centers and the number of points in each of these bins.
+    """
+    counts, edges_x, edges_y = np.histogram2d(x, y, bins=(max(1, int(bins_x)), max(1, int(bins_y))))
+    occupied_x, occupied_y = np.nonzero(counts)
+    return ((edges_x[occupied_x] + edges_x[occupied_x + 1]) / 2, (edges_y[occupied_y] + edges_y[occupied_y + 1]) / 2,
+            counts[occupied_x, occupied_y])
+
+
+def binned_marker_sizes(counts, size=None):
+    """
+    Marker sizes that show how many points a bin of a binned scatter plot holds, the series keeps its color.
+
+    A bin with one point gets the normal marker size, every doubling of the points adds the normal marker area once more.
+
+    :param counts: Array of the number of points in each bin.
+    :param size: Marker area in points^2 of a bin with one point, the matplotlib default if not given.
+    :return: Array of the marker areas in points^2.
+    """
+    if size is None:
+        size = plt.rcParams['lines.markersize'] ** 2
+    return size * (1 + np.log2(counts))
+
+
+def draw_xy_plot(figure, data, name, pixels_x, pixels_y, styles=None, text=None, downsample=True):
+    """
+    Draw the columns of a DataFrame over its x column into a figure.
+
+    :param figure: Matplotlib figure to draw into.
+    :param data: DataFrame containing the data to plot.
+    :param name: Name of the plot.
+    :param pixels_x: Width of the figure in pixels.
+    :param pixels_y: Height of the figure in pixels.
+    :param styles: Dictionary specifying styles for each column.
+    :param text: Additional text to display on the plot.
+    :param downsample: Draw only as many points as the figure has pixels.
+    :raises ValueError: If a style requests an unsupported plot type.
+    """
+    axes = figure.add_subplot(111)
+    x = data['x'].to_numpy(dtype=float)
+
+    for col in data.columns:
+        if col != 'x':
+            style_for_this_plot = {'linewidth': 2}
+            type_for_this_plot = "line"
+
+            if styles and col in styles:
+                style_for_this_plot.update(styles[col])
+                if 'type' in style_for_this_plot:
+                    type_for_this_plot = style_for_this_plot.pop('type')
+
+            y = data[col].to_numpy(dtype=float)
+
+            if type_for_this_plot == 'line':
+                if downsample:
+                    selected = downsample_line(y, pixels_x)
+                    axes.plot(x[selected], y[selected], label=col, **style_for_this_plot)
+                else:
+                    axes.plot(x, y, label=col, **style_for_this_plot)
+            elif type_for_this_plot == 'scatter':
+                finite = np.isfinite(x) & np.isfinite(y)
+                bins_x, bins_y = pixels_x / SCATTER_BIN_SIZE, pixels_y / SCATTER_BIN_SIZE
+                if downsample and finite.sum() > bins_x * bins_y:
+                    binned_x, binned_y, counts = bin_scatter(x[finite], y[finite], bins_x, bins_y)
+                    style_for_this_plot['s'] = binned_marker_sizes(counts, style_for_this_plot.get('s'))
+                    axes.scatter(binned_x, binned_y, label=col, **style_for_this_plot)
+                else:
+                    axes.scatter(x, y, label=col, **style_for_this_plot)
+            else:
+                raise ValueError("Unsupported plot type")
+
+    box = axes.get_position()
+    axes.set_position([box.x0, box.y0, box.width * 0.8, box.height])
+
+    if text:
+        axes.text(23, box.height, text, fontsize=12, color='black', ha='left',
+                  bbox=dict(facecolor='lightgrey', alpha=0.5, pad=5))
+
+    axes.legend(loc='center right', bbox_to_anchor=(0, 0.5), fancybox=True, shadow=True,
+                ncol=2 if data.shape[1] > 25 else 1)
+    axes.grid(True, color="k")
+    axes.set_ylabel('y axis')
+    axes.set_xlabel('x axis')
+    axes.set_title(name)
+
+
+def export_xy_plot(path, data, name, pixels_x, pixels_y, styles=None, text=None, downsample=True):
+    """
+    Render a plot without a window with the Agg backend and save it to a file, the format is taken from the file extension.
+
+    Runs in the worker processes of the export, so it only uses the figure objects and not the pyplot state.
+
+    :param path: Path of the image file.
+    :param data: DataFrame containing the data to plot.
+    :param name: Name of the plot.
+    :param pixels_x: Width of the image in pixels.
+    :param pixels_y: Height of the image in pixels.
+    :param styles: Dictionary specifying styles for each column.
+    :param text: Additional text to display on the plot.
+    :param downsample: Draw only as many points as the image has pixels.
+    :return: Path of the written file.
+    """
+    with style.context('ggplot'):
+        figure = Figure(figsize=(pixels_x / EXPORT_DPI, pixels_y / EXPORT_DPI), dpi=EXPORT_DPI)
+        FigureCanvasAgg(figure)
+        draw_xy_plot(figure, data, name, pixels_x, pixels_y, styles, text, downsample)
+        figure.savefig(path)
+    return path
+
+
 class PlotManager:
     """
     Class to manage plotting of figures with specific positioning on screen.
 
+    With an export directory no window is opened, every figure is rendered to an image file in a
+    worker process as soon as it is loaded, and show_plots waits until the files are written.
+
     :param screen_size_x: Width of the screen in pixels.
     :param screen_size_y: Height of the screen in pixels.
     :param num_plots_vertical: Number of plots vertically.
     :param num_plots_horizontal: Number of plots horizontally.
+    :param downsample: Draw only as many points as the figure has pixels, for large data.
+    :param export_dir: Directory to export the figures to instead of showing them.
+    :param export_format: File format of the exported figures, 'png' or 'svg'.
+    :param export_workers: Number of worker processes rendering the exported figures, the number of CPUs if not given.
+    :raises ValueError: If the export format is not supported.
     """
 
-    def __init__(self, screen_size_x=3440, screen_size_y=1365, num_plots_vertical=2, num_plots_horizontal=4):
+    def __init__(self, screen_size_x=3440, screen_size_y=1365, num_plots_vertical=2, num_plots_horizontal=4, downsample=True,
+                 export_dir=None, export_format='png', export_workers=None):
         self.screen_size_x = screen_size_x
         self.screen_size_y = screen_size_y
         self.num_plots_vertical = num_plots_vertical
@@ -29,25 +199,84 @@ class PlotManager:
         self.plt_size_x = screen_size_x / num_plots_horizontal
         self.plt_size_y = screen_size_y / num_plots_vertical
 
+        self.downsample = downsample
+
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {export_format}")
+        self.export_dir = export_dir
+        self.export_format = export_format
+        self.export_workers = export_workers
+        self.executor = None
+        self.pending_exports = []
+        self.exported_files = []
+
         self.number_of_plots = 0
 
+    @stage_timer.timed("plot")
     def show_plots(self):
         """
-        Show all currently plotted figures.
+        Show all currently plotted figures. Exported figures keep rendering in the worker processes, see shutdown.
         """
-        plt.show()
         self.number_of_plots = 0
+        if self.export_dir is None:
+            plt.show()
 
     def delete_plots(self):
         """
         Delete all currently plotted figures without showing them.
         """
         plt.close('all')
+        for future, _ in self.pending_exports:
+            future.cancel()
+        self.pending_exports = []
+        self.shutdown()
         self.number_of_plots = 0
 
+    @stage_timer.timed("plot")
+    def shutdown(self):
+        """
+        Wait until all loaded figures are exported and stop the worker processes of the export.
+
+        The pool is started with the first export and kept for the lifetime of the PlotManager,
+        so it is only shut down once, after the last figure.
+
+        :return: List of the paths of the files exported since the last call.
+        """
+        exported_files = []
+        for future, path in self.pending_exports:
+            try:
+                exported_files.append(future.result())
+            except Exception as e:
+                logger.warning(f"Could not export figure to '{path}': {e}")
+                logger.debug(traceback.format_exc())
+        self.pending_exports = []
+        self.exported_files.extend(exported_files)
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+            logger.info(f"Exported {len(exported_files)} figures to '{self.export_dir}'")
+        return exported_files
+
+    def export_path(self, name):
+        """
+        Get the path of the exported file of a figure, figures with the same name get a numbered suffix.
+
+        :param name: Name of the figure.
+        :return: Path of the file in the export directory.
+        """
+        file_name = re.sub(r'[^\w.-]+', '_', name).strip('_') or 'figure'
+        path = os.path.join(self.export_dir, f"{file_name}.{self.export_format}")
+        taken = {taken_path for _, taken_path in self.pending_exports} | set(self.exported_files)
+        number = 1
+        while path in taken:
+            number += 1
+            path = os.path.join(self.export_dir, f"{file_name}_{number}.{self.export_format}")
+        return path
+
     def position_figure(self, position=None):
         """
-        Position the current figure window on screen.
+        Position the current figure window on screen, a figure without window, e.g. of a non-interactive backend, is not moved.
 
         :param position: Dictionary specifying 'left', 'top', 'width', and 'height' of the figure window.
         """
@@ -58,18 +287,21 @@ class PlotManager:
         pos_x = self.number_of_plots * self.plt_size_x - (line * self.screen_size_x)
         pos_y = line * self.plt_size_y
 
-        manager = plt.get_current_fig_manager()
+        window = None if self.export_dir is not None else getattr(plt.get_current_fig_manager(), 'window', None)
 
-        if position:
-            manager.window.wm_geometry(f"{int(position['width'] * self.screen_size_x)}x{int(position['height'] * self.screen_size_y)}+{int(position['left'])}+{int(position['top'])}")
+        if window is None or not hasattr(window, 'wm_geometry'):
+            pass
+        elif position:
+            window.wm_geometry(f"{int(position['width'] * self.screen_size_x)}x{int(position['height'] * self.screen_size_y)}+{int(position['left'])}+{int(position['top'])}")
         else:
-            manager.window.wm_geometry(f"{int(self.plt_size_x)}x{int(self.plt_size_y)}+{int(pos_x)}+{int(pos_y)}")
+            window.wm_geometry(f"{int(self.plt_size_x)}x{int(self.plt_size_y)}+{int(pos_x)}+{int(pos_y)}")
 
         self.number_of_plots += 1
 
+    @stage_timer.timed("plot")
     def load_xy_as_line_plot(self, data, name, position=None, styles=None, text=None):
         """
-        Load data and create a line plot.
+        Load data and create a line plot, or start exporting it in a worker process.
 
         :param data: DataFrame containing the data to plot.
         :param name: Name of the plot.
@@ -77,41 +309,21 @@ class PlotManager:
         :param styles: Dictionary specifying styles for each column.
         :param text: Additional text to display on the plot.
         """
-        style.use('ggplot')
-        plt.figure(name)
-
-        x = data['x'].values
+        # the figure size in pixels limits the number of points that can be told apart
+        pixels_x = position['width'] * self.screen_size_x if position else self.plt_size_x
+        pixels_y = position['height'] * self.screen_size_y if position else self.plt_size_y
 
-        for col in data.columns:
-            if col != 'x':
-                style_for_this_plot = {'linewidth': 2}
-                type_for_this_plot = "line"
-
-                if styles and col in styles:
-                    style_for_this_plot.update(styles[col])
-                    if 'type' in style_for_this_plot:
-                        type_for_this_plot = style_for_this_plot.pop('type')
-
-                if type_for_this_plot == 'line':
-                    plt.plot(x, data[col].values, label=col, **style_for_this_plot)
-                elif type_for_this_plot == 'scatter':
-                    plt.scatter(x, data[col].values, label=col, **style_for_this_plot)
-                else:
-                    raise ValueError("Unsupported plot type")
-
-        box = plt.subplot(111).get_position()
-        plt.subplot(111).set_position([box.x0, box.y0, box.width * 0.8, box.height])
-
-        if text:
-            plt.text(23, box.height, text, fontsize=12, color='black', ha='left',
-                    bbox=dict(facecolor='lightgrey', alpha=0.5, pad=5))
-
-        plt.legend(loc='center right', bbox_to_anchor=(0, 0.5), fancybox=True, shadow=True,
-                   ncol=2 if data.shape[1] > 25 else 1)
-        plt.grid(True, color="k")
-        plt.ylabel('y axis')
-        plt.xlabel('x axis')
-        plt.title(name)
+        if self.export_dir is not None:
+            os.makedirs(self.export_dir, exist_ok=True)
+            if self.executor is None:
+                # spawned like the other pools, a forked worker could inherit a lock held by the writer or logging thread
+                self.executor = ProcessPoolExecutor(max_workers=self.export_workers, mp_context=get_context('spawn'))
+            path = self.export_path(name)
+            # the data and styles are sent to the worker as they are, the figure is drawn there
+            future = self.executor.submit(export_xy_plot, path, data, name, pixels_x, pixels_y, styles, text, self.downsample)
+            self.pending_exports.append((future, path))
+        else:
+            style.use('ggplot')
+            draw_xy_plot(plt.figure(name), data, name, pixels_x, pixels_y, styles, text, self.downsample)
 
         self.position_figure(position)
-
@@ -0,0 +1,109 @@
+import numpy as np
+
+DEFAULT_X_TOLERANCE = 1e-9
+
+
+class XGridIndex:
+    """
+    Sorted index over the x values of a table for fast lookups of arbitrary x values.
+
+    Lookups use an O(1) step calculation for uniform grids and a binary search on the sorted x values otherwise.
+    An x value matches a grid value if both differ by at most the tolerance, optionally x values between
+    two grid values are interpolated linearly.
+
+    :param x_values: x values of the table, in the row order of the table.
+    :param tolerance: Maximum absolute difference between an x value and the matching grid value.
+    :param interpolate: Interpolate linearly for x values that are inside the grid but have no matching grid value.
+    :raises ValueError: If the x values are empty or not unique within the tolerance.
+    """
+
+    def __init__(self, x_values, tolerance=DEFAULT_X_TOLERANCE, interpolate=False):
+        x_values = np.asarray(x_values, dtype=float)
+        if x_values.size == 0:
+            raise ValueError("Cannot build an index without x values.")
+
+        self.tolerance = tolerance
+        self.interpolate = interpolate
+
+        self.order = np.argsort(x_values, kind='stable')
+        self.sorted_x = x_values[self.order]
+
+        if (np.diff(self.sorted_x) <= tolerance).any():
+            raise ValueError("x values are not unique within the tolerance.")
+
+        # exact-step fast path for uniform grids like -20.0..20.0 with step 0.1
+        self.step = None
+        if self.sorted_x.size > 1:
+            step = (self.sorted_x[-1] - self.sorted_x[0]) / (self.sorted_x.size - 1)
+            expected = self.sorted_x[0] + step * np.arange(self.sorted_x.size)
+            if np.abs(self.sorted_x - expected).max() <= step * 1e-6:
+                self.step = step
+
+    def __len__(self):
+        return self.sorted_x.size
+
+    def _nearest(self, x):
+        """
+        Get the positions in the sorted x values that are nearest to the given x values.
+
+        :param x: Array of x values.
+        :return: Array of positions in the sorted x values.
+        """
+        last = self.sorted_x.size - 1
+
+        if self.step is not None:
+            nearest = np.rint((x - self.sorted_x[0]) / self.step).clip(0, last)
+            # NaN and infinite x values get a position that never matches, like from the binary search
+            return np.where(np.isfinite(x), nearest, -1).astype(np.intp)
+
+        upper = np.searchsorted(self.sorted_x, x).clip(0, last)
+        lower = (upper - 1).clip(0, last)
+        return np.where(np.abs(x - self.sorted_x[lower]) <= np.abs(self.sorted_x[upper] - x), lower, upper)
+
+    def get_positions(self, x):
+        """
+        Get the table rows matching the given x values.
+
+        :param x: Array of x values to look up.
+        :return: Array of row positions in the table, -1 where no grid value lies within the tolerance.
+        """
+        x = np.asarray(x, dtype=float)
+        nearest = self._nearest(x)
+        matched = np.abs(self.sorted_x[nearest] - x) <= self.tolerance
+        return np.where(matched, self.order[nearest], -1)
+
+    def align(self, x, values):
+        """
+        Align table values to the given x values.
+
+        :param x: Array of x values to align to.
+        :param values: Array of shape (rows,) or (rows, columns) in the row order of the table.
+        :return: Tuple of the aligned values, NaN where nothing was found, and a boolean mask of the found x values.
+        """
+        x = np.asarray(x, dtype=float)
+        # float32 values stay float32, so a compact table is not doubled in size by aligning it
+        values = np.asarray(values)
+        if values.dtype != np.float32:
+            values = values.astype(float, copy=False)
+
+        positions = self.get_positions(x)
+        found = positions >= 0
+
+        aligned = np.full((x.size,) + values.shape[1:], np.nan, dtype=values.dtype)
+        aligned[found] = values[positions[found]]
+
+        if self.interpolate and self.sorted_x.size > 1:
+            off_grid = ~found & (x >= self.sorted_x[0]) & (x <= self.sorted_x[-1])
+            if off_grid.any():
+                upper = np.searchsorted(self.sorted_x, x[off_grid]).clip(1, self.sorted_x.size - 1)
+                lower = upper - 1
+                weight = (x[off_grid] - self.sorted_x[lower]) / (self.sorted_x[upper] - self.sorted_x[lower])
+                if values.ndim > 1:
+                    weight = weight[:, np.newaxis]
+
+                lower_values = values[self.order[lower]]
+                upper_values = values[self.order[upper]]
+                aligned[off_grid] = lower_values + (upper_values - lower_values) * weight
+                found = found | off_grid
+
+        return aligned, found